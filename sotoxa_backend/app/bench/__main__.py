@@ -0,0 +1,45 @@
+import sys
+import json
+import asyncio
+import argparse
+from .runner import run_benchmarks, compare, BENCHMARKS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench",
+        description="Benchmark upload, OCR, export and query hot paths"
+    )
+    parser.add_argument("--repeat", type=int, default=10, help="timed runs per benchmark")
+    parser.add_argument("--records", type=int, default=1000, help="seeded drug_tests records")
+    parser.add_argument("--mongo-url", help="benchmark queries against this MongoDB instead of mongomock")
+    parser.add_argument("--only", help=f"comma separated name prefixes, from: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="previous JSON report to compare medians against")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_benchmarks(
+        repeat=args.repeat,
+        records=args.records,
+        mongo_url=args.mongo_url,
+        only=args.only.split(",") if args.only else None
+    ))
+
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(json.load(f), report)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    for name, ratio in report.get("comparison", {}).items():
+        marker = "  REGRESSION" if ratio > 1.10 else ""
+        print(f"{name}: {ratio:.2f}x baseline median{marker}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
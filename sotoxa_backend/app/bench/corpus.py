@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from .synthetic import PANEL_CODES, degrade, random_results, render_print
+
+# Offline OCR regression corpus: labeled synthetic prints with controlled
+# defects, and a runner that scores the real OCR pipeline against the labels
+# and measures throughput, so preprocessing, Tesseract config and
+# DRUG_PATTERNS changes can be gated on accuracy as well as speed.
+
+MANIFEST = "manifest.json"
+CONFIDENCE_BINS = 10
+
+
+def build_corpus(out_dir: str, count: int, seed: int = 0, noise: float = 0.0, blur: float = 0.0,
+                 rotation: float = 0.0, lighting: float = 0.0, positive_rate: float = 0.3,
+                 image_format: str = "JPEG") -> Dict:
+    """Render `count` labeled prints into out_dir and write the manifest"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    extension = "png" if image_format.upper() == "PNG" else "jpg"
+    samples = []
+    for i in range(count):
+        results = random_results(rng, positive_rate)
+        image, params = degrade(
+            render_print(results, test_id=f"{i:06d}", font_size=rng.choice([22, 26, 28, 32])),
+            rng, noise=noise, blur=blur, rotation=rotation, lighting=lighting
+        )
+        filename = f"{i:05d}.{extension}"
+        image.save(os.path.join(out_dir, filename), format=image_format.upper(), quality=85)
+        samples.append({"file": filename, "labels": results, "degradation": params})
+
+    manifest = {
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "seed": seed,
+        "settings": {"noise": noise, "blur": blur, "rotation": rotation, "lighting": lighting,
+                     "positive_rate": positive_rate},
+        "samples": samples,
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_corpus(corpus_dir: str) -> Dict:
+    with open(os.path.join(corpus_dir, MANIFEST)) as f:
+        return json.load(f)
+
+
+def _ocr(path: str) -> Dict:
+    from ..services.ocr_service import OCRService
+    try:
+        text, data, confidence = OCRService.process_image_sync(path)
+        return {"ocr_data": data, "confidence": confidence}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def _run_pass(paths: List[str], workers: int) -> Dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="corpus-ocr") as pool:
+        outputs = list(pool.map(_ocr, paths))
+    elapsed = time.perf_counter() - start
+    return {"outputs": outputs, "elapsed": elapsed}
+
+
+def score(samples: List[Dict], outputs: List[Dict]) -> Dict:
+    """Per-drug accuracy, exact-scan accuracy, retry rate and confidence calibration"""
+    from ..services.ocr_service import OCRService
+    drugs = {drug: {"correct": 0, "wrong": 0, "not_found": 0, "false_positive": 0, "false_negative": 0}
+             for drug in PANEL_CODES}
+    bins = [{"scans": 0, "confidence_sum": 0.0, "accuracy_sum": 0.0} for _ in range(CONFIDENCE_BINS)]
+    exact = 0
+    errors = 0
+    retried = 0
+
+    for sample, output in zip(samples, outputs):
+        if "error" in output:
+            errors += 1
+            for drug in PANEL_CODES:
+                drugs[drug]["not_found"] += 1
+            continue
+        # OCRQueue retries a scan whose results don't validate, multiplying its cost
+        retried += not OCRService._validate_results(output["ocr_data"])
+        correct = 0
+        for drug, expected in sample["labels"].items():
+            actual = output["ocr_data"].get(drug, "Not Found")
+            counters = drugs[drug]
+            if actual == expected:
+                counters["correct"] += 1
+                correct += 1
+            elif actual == "Not Found":
+                counters["not_found"] += 1
+            else:
+                counters["wrong"] += 1
+                counters["false_positive" if actual == "Positive" else "false_negative"] += 1
+        exact += correct == len(sample["labels"])
+
+        # Calibration: does a scan's reported confidence predict how much of it is right?
+        confidence = max(0.0, min(100.0, output["confidence"]))
+        bucket = bins[min(int(confidence / (100 / CONFIDENCE_BINS)), CONFIDENCE_BINS - 1)]
+        bucket["scans"] += 1
+        bucket["confidence_sum"] += confidence / 100
+        bucket["accuracy_sum"] += correct / len(sample["labels"])
+
+    total = len(samples)
+    for counters in drugs.values():
+        counters["accuracy"] = counters["correct"] / total if total else None
+
+    scored = sum(bucket["scans"] for bucket in bins)
+    calibration = []
+    ece = 0.0
+    for i, bucket in enumerate(bins):
+        if not bucket["scans"]:
+            continue
+        mean_confidence = bucket["confidence_sum"] / bucket["scans"]
+        accuracy = bucket["accuracy_sum"] / bucket["scans"]
+        ece += bucket["scans"] / scored * abs(accuracy - mean_confidence)
+        calibration.append({
+            "range": [i * 100 // CONFIDENCE_BINS, (i + 1) * 100 // CONFIDENCE_BINS],
+            "scans": bucket["scans"],
+            "mean_confidence": mean_confidence * 100,
+            "accuracy": accuracy,
+        })
+
+    field_total = total * len(PANEL_CODES)
+    return {
+        "scans": total,
+        "errors": errors,
+        "field_accuracy": sum(c["correct"] for c in drugs.values()) / field_total if field_total else None,
+        "exact_scan_accuracy": exact / total if total else None,
+        "retry_rate": retried / (total - errors) if total > errors else None,
+        "per_drug": drugs,
+        "calibration": calibration,
+        "expected_calibration_error": ece if scored else None,
+    }
+
+
+def run_corpus(corpus_dir: str, workers: List[int], limit: Optional[int] = None) -> Dict:
+    """Score the OCR pipeline on a corpus, then time it at each worker count"""
+    import pytesseract
+    from ..services.ocr_service import OCRService
+    pytesseract.get_tesseract_version()
+
+    manifest = load_corpus(corpus_dir)
+    samples = manifest["samples"][:limit] if limit else manifest["samples"]
+    paths = [os.path.join(corpus_dir, sample["file"]) for sample in samples]
+
+    throughput = {}
+    accuracy = None
+    for count in workers:
+        run = _run_pass(paths, count)
+        throughput[str(count)] = {
+            "workers": count,
+            "seconds": run["elapsed"],
+            "scans_per_sec": len(paths) / run["elapsed"] if run["elapsed"] else None,
+        }
+        if accuracy is None:
+            accuracy = score(samples, run["outputs"])
+
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "tesseract": str(pytesseract.get_tesseract_version()),
+            "pipeline_version": OCRService.pipeline_version(),
+            "corpus": os.path.abspath(corpus_dir),
+            "corpus_settings": manifest["settings"],
+        },
+        "accuracy": accuracy,
+        "throughput": throughput,
+    }
+
+
+def gate(baseline: Dict, current: Dict, max_accuracy_drop: float, max_throughput_drop: float) -> List[str]:
+    """Regressions of current against baseline beyond the allowed drops; empty when the gate passes"""
+    failures = []
+    before, after = baseline["accuracy"], current["accuracy"]
+    for metric in ("field_accuracy", "exact_scan_accuracy"):
+        if before.get(metric) is not None and after.get(metric) is not None \
+                and after[metric] < before[metric] - max_accuracy_drop:
+            failures.append(f"{metric} {after[metric]:.4f} < baseline {before[metric]:.4f}")
+    for drug, counters in after["per_drug"].items():
+        previous = before["per_drug"].get(drug, {}).get("accuracy")
+        if previous is not None and counters["accuracy"] < previous - max_accuracy_drop:
+            failures.append(f"{drug} accuracy {counters['accuracy']:.4f} < baseline {previous:.4f}")
+    if before.get("retry_rate") is not None and after.get("retry_rate") is not None \
+            and after["retry_rate"] > before["retry_rate"] + max_accuracy_drop:
+        failures.append(f"retry_rate {after['retry_rate']:.4f} > baseline {before['retry_rate']:.4f}")
+    for workers, stats in current.get("throughput", {}).items():
+        previous = baseline.get("throughput", {}).get(workers, {}).get("scans_per_sec")
+        if previous and stats["scans_per_sec"] and stats["scans_per_sec"] < previous * (1 - max_throughput_drop):
+            failures.append(f"{workers} workers: {stats['scans_per_sec']:.2f} scans/s < baseline {previous:.2f}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m app.bench.corpus",
+        description="Build a labeled synthetic OCR corpus, or score the OCR pipeline against one"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="render a labeled corpus")
+    build.add_argument("out_dir")
+    build.add_argument("--count", type=int, default=200)
+    build.add_argument("--seed", type=int, default=0)
+    build.add_argument("--noise", type=float, default=0.0, help="max Gaussian noise sigma (grey levels)")
+    build.add_argument("--blur", type=float, default=0.0, help="max Gaussian blur radius (px)")
+    build.add_argument("--rotation", type=float, default=0.0, help="max skew (degrees, either way)")
+    build.add_argument("--lighting", type=float, default=0.0, help="max uneven lighting depth (0..1)")
+    build.add_argument("--positive-rate", type=float, default=0.3)
+    build.add_argument("--format", default="JPEG", choices=["JPEG", "PNG"])
+
+    run = commands.add_parser("run", help="score the OCR pipeline on a corpus")
+    run.add_argument("corpus_dir")
+    run.add_argument("--workers", default="1", help="comma separated worker counts to time, e.g. 1,2,4")
+    run.add_argument("--limit", type=int, default=None, help="only use the first N samples")
+    run.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    run.add_argument("--baseline", help="previous report; exit 1 if accuracy or throughput regressed")
+    run.add_argument("--max-accuracy-drop", type=float, default=0.01, help="absolute, e.g. 0.01 = 1 point")
+    run.add_argument("--max-throughput-drop", type=float, default=0.10, help="relative, e.g. 0.10 = 10%%")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        manifest = build_corpus(
+            args.out_dir, args.count, args.seed, args.noise, args.blur,
+            args.rotation, args.lighting, args.positive_rate, args.format
+        )
+        print(f"Wrote {len(manifest['samples'])} samples to {args.out_dir}")
+        return
+
+    try:
+        report = run_corpus(args.corpus_dir, [int(w) for w in args.workers.split(",")], args.limit)
+    except Exception as e:
+        print(f"Cannot run OCR corpus: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    accuracy = report["accuracy"]
+    print(f"field accuracy {accuracy['field_accuracy']:.4f}, exact scans {accuracy['exact_scan_accuracy']:.4f}, "
+          f"retry rate {accuracy['retry_rate'] or 0:.4f}, ECE {accuracy['expected_calibration_error'] or 0:.4f}",
+          file=sys.stderr)
+    for stats in report["throughput"].values():
+        print(f"{stats['workers']} workers: {stats['scans_per_sec']:.2f} scans/s", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = gate(json.load(f), report, args.max_accuracy_drop, args.max_throughput_drop)
+        for failure in failures:
+            print(f"REGRESSION: {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+import io
+import os
+import sys
+import time
+import random
+import queue
+import shutil
+import logging
+import platform
+import subprocess
+import tempfile
+import statistics
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from fastapi import Request, UploadFile
+from ..core.config import get_settings
+from ..db.mongodb import db
+from .synthetic import random_results, render_print, synthetic_documents, print_text_lines
+
+settings = get_settings()
+
+
+class BenchmarkSkipped(Exception):
+    """Raised by a benchmark whose prerequisites are missing"""
+
+
+def _stats(samples: List[float]) -> Dict:
+    samples = sorted(samples)
+    p95_index = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+    mean = statistics.fmean(samples)
+    return {
+        "runs": len(samples),
+        "min_ms": samples[0] * 1000,
+        "mean_ms": mean * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[p95_index] * 1000,
+        "stdev_ms": statistics.stdev(samples) * 1000 if len(samples) > 1 else 0.0,
+        "ops_per_sec": 1 / mean if mean else None,
+    }
+
+
+async def measure(fn: Callable, repeat: int, warmup: int = 1, is_async: bool = False) -> Dict:
+    """Time fn() repeat times after warmup calls"""
+    for _ in range(warmup):
+        result = fn()
+        if is_async:
+            await result
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        if is_async:
+            await result
+        samples.append(time.perf_counter() - start)
+    return _stats(samples)
+
+
+class BenchContext:
+    def __init__(self, repeat: int, records: int, mongo_url: Optional[str]):
+        self.repeat = repeat
+        self.records = records
+        self.mongo_url = mongo_url
+        self.workdir = tempfile.mkdtemp(prefix="sotoxa-bench-")
+        self.results = random_results(random.Random(42))
+        self.image = render_print(self.results)
+        self.image_path = os.path.join(self.workdir, "scan.png")
+        self.image.save(self.image_path)
+        buffer = io.BytesIO()
+        self.image.save(buffer, format="JPEG", quality=90)
+        self.image_bytes = buffer.getvalue()
+        self.documents = synthetic_documents(records)
+        self.db_ready = False
+        self.db_backend = None
+
+    async def setup_database(self):
+        """Seed drug_tests in a real MongoDB if a URL was given, else mongomock"""
+        if self.mongo_url:
+            settings.MONGODB_URL = self.mongo_url
+            settings.MONGODB_DB_NAME = "sotoxa_bench"
+            await db.connect_to_database()
+            self.db_backend = "mongodb"
+        else:
+            try:
+                from mongomock_motor import AsyncMongoMockClient
+            except ImportError:
+                return
+            db.client = AsyncMongoMockClient()
+            db.db = db.client["sotoxa_bench"]
+            self.db_backend = "mongomock"
+        await db.db["drug_tests"].drop()
+        await db.db["drug_tests"].insert_many(self.documents)
+        await db.db["drug_tests"].create_index("test_timestamp")
+        self.db_ready = True
+
+    async def teardown(self):
+        if self.db_ready and self.db_backend == "mongodb":
+            await db.client.drop_database("sotoxa_bench")
+        await db.close_database_connection()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+async def bench_preprocess(ctx: BenchContext) -> Dict:
+    from ..services.ocr_service import OCRService
+    return await measure(lambda: OCRService._preprocess_image(ctx.image), ctx.repeat)
+
+
+async def bench_deskew(ctx: BenchContext) -> Dict:
+    """Skew estimate and rotation on a 4 degree skewed print"""
+    from PIL import Image
+    from ..services.ocr_service import OCRService
+    skewed = ctx.image.convert("L").rotate(4, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=235)
+    result = await measure(lambda: OCRService._deskew(skewed), ctx.repeat)
+    result["estimated_angle"] = OCRService._estimate_skew(skewed)
+    return result
+
+
+async def bench_binarize(ctx: BenchContext) -> Dict:
+    from ..services.ocr_service import OCRService
+    gray = ctx.image.convert("L")
+    ratio = 1500.0 / min(gray.size)
+    gray = gray.resize((int(gray.width * ratio), int(gray.height * ratio)))
+    result = await measure(lambda: OCRService._binarize(gray), ctx.repeat)
+    result["method"] = settings.OCR_BINARIZATION
+    return result
+
+
+async def bench_extraction(ctx: BenchContext) -> Dict:
+    from ..services.ocr_service import OCRService
+    text = OCRService._clean_text(" ".join(print_text_lines(ctx.results)))
+
+    def extract():
+        return {
+            drug: OCRService._extract_result(text, patterns)
+            for drug, patterns in OCRService.DRUG_PATTERNS.items()
+        }
+
+    if extract() != ctx.results:
+        raise BenchmarkSkipped("extraction does not reproduce the synthetic results")
+    return await measure(extract, ctx.repeat * 100)
+
+
+async def bench_process_image(ctx: BenchContext) -> Dict:
+    import pytesseract
+    from ..services.ocr_service import OCRService
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception as e:
+        raise BenchmarkSkipped(f"tesseract unavailable: {e}")
+    return await measure(lambda: OCRService.process_image(ctx.image_path), ctx.repeat, is_async=True)
+
+
+async def bench_save_file(ctx: BenchContext) -> Dict:
+    from ..services.upload_service import UploadService
+    from ..services.storage import get_storage
+    upload_dir = settings.UPLOAD_DIR
+    settings.UPLOAD_DIR = os.path.join(ctx.workdir, "uploads")
+    get_storage.cache_clear()
+    counter = iter(range(10 ** 9))
+
+    def save():
+        # A unique trailer per call defeats content-addressed dedupe so every run writes
+        data = ctx.image_bytes + str(next(counter)).encode()
+        return UploadService.save_file(UploadFile(file=io.BytesIO(data), filename="scan.jpg"))
+
+    try:
+        return await measure(save, ctx.repeat, is_async=True)
+    finally:
+        settings.UPLOAD_DIR = upload_dir
+        get_storage.cache_clear()
+
+
+async def bench_export_csv(ctx: BenchContext) -> Dict:
+    from ..services.export_service import ExportService
+    return await measure(lambda: ExportService.generate_csv(ctx.documents), ctx.repeat, is_async=True)
+
+
+async def bench_export_excel(ctx: BenchContext) -> Dict:
+    from ..services.export_service import ExportService
+    return await measure(lambda: ExportService.generate_excel(ctx.documents), ctx.repeat, is_async=True)
+
+
+async def bench_list_query(ctx: BenchContext) -> Dict:
+    from ..routers import drug_tests
+    if not ctx.db_ready:
+        raise BenchmarkSkipped("no MongoDB or mongomock_motor available")
+    return await measure(
+        lambda: drug_tests.list_test_results(
+            request=Request({"type": "http", "path": "/api/drug-tests/results",
+                             "query_string": b"limit=100", "headers": []}),
+            date_from=None, date_to=None, operator=None, person_id=None,
+            page=1, limit=100, sort_by="test_timestamp", sort_order=-1,
+            current_user=None
+        ),
+        ctx.repeat,
+        is_async=True
+    )
+
+
+async def bench_dashboard_query(ctx: BenchContext) -> Dict:
+    from ..routers import drug_tests
+    if not ctx.db_ready:
+        raise BenchmarkSkipped("no MongoDB or mongomock_motor available")
+    return await measure(
+        lambda: drug_tests.get_dashboard_summary(period="daily", current_user=None),
+        ctx.repeat,
+        is_async=True
+    )
+
+
+SERIALIZE_PAGE_SIZE = 100
+
+
+def _page(ctx: BenchContext) -> List[Dict]:
+    return [dict(document) for document in ctx.documents[:SERIALIZE_PAGE_SIZE]]
+
+
+async def bench_serialize_model_baseline(ctx: BenchContext) -> Dict:
+    """Per-record DrugTest validation, jsonable_encoder and json.dumps (the response_model path)"""
+    import json
+    from bson import ObjectId
+    from fastapi.encoders import jsonable_encoder
+    from ..models.drug_test import DrugTest
+    page = _page(ctx)
+
+    def serialize():
+        models = [DrugTest.model_validate(document) for document in page]
+        return json.dumps(jsonable_encoder(models, by_alias=True, custom_encoder={ObjectId: str})).encode()
+
+    return await measure(serialize, ctx.repeat * 10)
+
+
+async def bench_serialize_model_adapter(ctx: BenchContext) -> Dict:
+    from ..core.serialization import DRUG_TEST_LIST_ADAPTER
+    page = _page(ctx)
+    return await measure(
+        lambda: DRUG_TEST_LIST_ADAPTER.dump_json(DRUG_TEST_LIST_ADAPTER.validate_python(page), by_alias=True),
+        ctx.repeat * 10
+    )
+
+
+async def bench_serialize_raw_baseline(ctx: BenchContext) -> Dict:
+    """Raw documents through jsonable_encoder and json.dumps"""
+    import json
+    from bson import ObjectId
+    from fastapi.encoders import jsonable_encoder
+    page = _page(ctx)
+    return await measure(
+        lambda: json.dumps(jsonable_encoder({"results": page}, custom_encoder={ObjectId: str})).encode(),
+        ctx.repeat * 10
+    )
+
+
+async def bench_serialize_raw_fast(ctx: BenchContext) -> Dict:
+    from ..core import serialization
+    page = _page(ctx)
+    result = await measure(lambda: serialization.dumps({"results": page}), ctx.repeat * 10)
+    result["encoder"] = "orjson" if serialization.orjson is not None else "json"
+    return result
+
+
+
+async def bench_tracing_spans(ctx: BenchContext) -> Dict:
+    """The spans one OCR job records (12), nested two deep, inside an active trace"""
+    from ..core import tracing
+
+    def job():
+        with tracing.activate(tracing.Trace()):
+            with tracing.span("ocr.job"):
+                for _ in range(11):
+                    with tracing.span("stage") as span:
+                        span.set("attempt", 0)
+
+    return await measure(job, ctx.repeat * 10)
+
+
+class _CountingSink(io.TextIOBase):
+    """Discards log output, counting the characters written"""
+
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, text: str) -> int:
+        self.chars += len(text)
+        return len(text)
+
+
+def _bench_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+async def bench_log_per_drug_baseline(ctx: BenchContext) -> Dict:
+    """The OCR path's former logging: raw text per drug, 17 f-string INFO records per scan, written inline"""
+    from ..services.ocr_service import OCRService
+    text = OCRService._clean_text(" ".join(print_text_lines(ctx.results)))
+    sink = _CountingSink()
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger = _bench_logger("bench.log.baseline", handler)
+
+    def scan():
+        logger.info(f"Saved preprocessed image to: {ctx.image_path}_processed.jpg")
+        logger.info(f"Raw OCR text:\n{text}")
+        for drug, result in ctx.results.items():
+            logger.info(f"Drug {drug}: Pattern match attempt on text: '{text}'")
+            logger.info(f"Drug {drug}: Result: '{result}'")
+        logger.info(f"OCR Text for test_id 0123:\n{text}")
+        logger.info(f"Extracted data for test_id 0123:\n{ctx.results}")
+        logger.info(f"Confidence score: {91.5}")
+
+    result = await measure(scan, ctx.repeat * 10)
+    result["chars_per_scan"] = sink.chars / (ctx.repeat * 10 + 1)
+    return result
+
+
+async def bench_log_scan_summary(ctx: BenchContext) -> Dict:
+    """One structured summary record per scan through the queue handler, plus the sampled debug check"""
+    from logging.handlers import QueueListener
+    from ..core.log import JSONFormatter, OCR_DEBUG, _NonBlockingQueueHandler
+    sink = _CountingSink()
+    writer = logging.StreamHandler(sink)
+    writer.setFormatter(JSONFormatter())
+    log_queue = queue.Queue(settings.LOG_QUEUE_SIZE)
+    logger = _bench_logger("bench.log.summary", _NonBlockingQueueHandler(log_queue))
+    listener = QueueListener(log_queue, writer)
+    listener.start()
+    summary = {
+        "event": "ocr.scan", "test_id": "0123", "priority": "interactive", "attempts": 1, "cached": False,
+        "confidence": 91.5, "results_found": len(ctx.results), "status": "completed",
+        "trace_id": "4bf92f3577b34da6a3ce929d0e0e4736", "duration_ms": 412.0,
+        "stages_ms": {"ocr.pending": 1.2, "ocr.queue_wait": 0.1, "ocr.preprocess": 98.0, "ocr.tesseract": 290.0,
+                      "ocr.extraction": 0.2, "db.update": 0.9},
+    }
+
+    def scan():
+        OCR_DEBUG.sample()
+        logger.info("OCR %s for test_id %s after %d attempts", "completed", "0123", 1, extra=summary)
+
+    try:
+        result = await measure(scan, ctx.repeat * 10)
+    finally:
+        listener.stop()
+    result["chars_per_scan"] = sink.chars / (ctx.repeat * 10 + 1)
+    return result
+
+# Optional or heavy dependencies that should load only in processes that use them
+HEAVY_MODULES = ("pytesseract", "numpy", "PIL", "pdf2image", "xlsxwriter", "boto3")
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_profile(module: str, role: str) -> Dict:
+    """Import module in a fresh interpreter with -X importtime; total and per top-level package self time"""
+    script = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, WORKER_ROLE=role, PYTHONPATH=PACKAGE_ROOT)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True, text=True, cwd=PACKAGE_ROOT, env=env, check=True
+    )
+    packages: Dict[str, int] = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            self_us, cumulative_us = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue  # the header line
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+        if name.strip() == module:
+            total_us = cumulative_us
+    heavy = completed.stdout.strip()
+    return {
+        "import_ms": total_us / 1000,
+        "packages_ms": {name: us / 1000 for name, us in sorted(packages.items(), key=lambda p: -p[1])[:15]},
+        "heavy_modules_loaded": heavy.split(",") if heavy else [],
+    }
+
+
+async def _bench_startup(ctx: BenchContext, module: str, role: str) -> Dict:
+    runs = [_import_profile(module, role) for _ in range(min(ctx.repeat, 5))]
+    samples = sorted(run["import_ms"] for run in runs)
+    result = runs[-1]
+    result.update({
+        "runs": len(runs),
+        "median_ms": statistics.median(samples),
+        "min_ms": samples[0],
+    })
+    del result["import_ms"]
+    return result
+
+
+async def bench_startup_api(ctx: BenchContext) -> Dict:
+    """Cold import of the API app as an API-role worker"""
+    return await _bench_startup(ctx, "app.main", "api")
+
+
+async def bench_startup_ocr_worker(ctx: BenchContext) -> Dict:
+    """Cold import of the standalone OCR worker (no web stack)"""
+    return await _bench_startup(ctx, "app.scripts.ocr_worker", "ocr")
+
+
+BENCHMARKS = {
+    "startup.api": bench_startup_api,
+    "startup.ocr_worker": bench_startup_ocr_worker,
+    "ocr.preprocess": bench_preprocess,
+    "ocr.deskew": bench_deskew,
+    "ocr.binarize": bench_binarize,
+    "ocr.extraction": bench_extraction,
+    "ocr.process_image": bench_process_image,
+    "upload.save_file": bench_save_file,
+    "export.csv": bench_export_csv,
+    "export.excel": bench_export_excel,
+    "query.list": bench_list_query,
+    "query.dashboard": bench_dashboard_query,
+    "serialize.model_baseline": bench_serialize_model_baseline,
+    "serialize.model_adapter": bench_serialize_model_adapter,
+    "serialize.raw_baseline": bench_serialize_raw_baseline,
+    "serialize.raw_fast": bench_serialize_raw_fast,
+    "tracing.spans": bench_tracing_spans,
+    "logging.per_drug_baseline": bench_log_per_drug_baseline,
+    "logging.scan_summary": bench_log_scan_summary,
+}
+
+
+async def run_benchmarks(repeat: int = 10, records: int = 1000, mongo_url: Optional[str] = None,
+                         only: Optional[List[str]] = None) -> Dict:
+    """Run the selected benchmarks and return a JSON-serializable report"""
+    ctx = BenchContext(repeat, records, mongo_url)
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "records": records,
+        },
+        "benchmarks": {},
+    }
+    try:
+        await ctx.setup_database()
+        report["meta"]["db_backend"] = ctx.db_backend
+        for name, bench in BENCHMARKS.items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            try:
+                report["benchmarks"][name] = await bench(ctx)
+            except BenchmarkSkipped as e:
+                report["benchmarks"][name] = {"skipped": str(e)}
+    finally:
+        await ctx.teardown()
+    return report
+
+
+def compare(baseline: Dict, current: Dict) -> Dict:
+    """Median time ratio (current / baseline) per benchmark present in both reports"""
+    ratios = {}
+    for name, stats in current["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name, {})
+        if "median_ms" in stats and previous.get("median_ms"):
+            ratios[name] = stats["median_ms"] / previous["median_ms"]
+    return ratios
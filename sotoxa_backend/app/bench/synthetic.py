@@ -0,0 +1,126 @@
+import random
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from PIL import Image, ImageChops, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+
+# Panel codes as printed by the SoToxa analyzer, mapped to OCRService.DRUG_PATTERNS keys
+PANEL_CODES = {
+    "THC": "THC",
+    "Cocaine": "COC",
+    "Opiates": "OPI",
+    "Amphetamines": "AMP",
+    "Methamphetamines": "MAMP",
+    "Benzodiazepines": "BZO",
+}
+
+
+def random_results(rng: random.Random, positive_rate: float = 0.15) -> Dict[str, str]:
+    """Random Positive/Negative result per drug"""
+    return {
+        drug: "Positive" if rng.random() < positive_rate else "Negative"
+        for drug in PANEL_CODES
+    }
+
+
+def print_text_lines(results: Dict[str, str], test_id: str = "000123",
+                     timestamp: Optional[datetime] = None) -> List[str]:
+    """Text lines of a SoToxa result print, top to bottom"""
+    timestamp = timestamp or datetime(2024, 1, 1, 12, 0)
+    lines = [
+        "SoToxa",
+        "Mobile Test System",
+        f"Test ID: {test_id}",
+        f"Date: {timestamp.strftime('%Y-%m-%d')}",
+        f"Time: {timestamp.strftime('%H:%M')}",
+        "Result:",
+    ]
+    for drug, result in results.items():
+        lines.append(f"{PANEL_CODES[drug]} {result.upper()}")
+    lines.append("Operator: 0042")
+    return lines
+
+
+def render_print(results: Dict[str, str], test_id: str = "000123",
+                 timestamp: Optional[datetime] = None, width: int = 600,
+                 font_size: int = 28) -> Image.Image:
+    """Render a clean synthetic thermal-printer result print"""
+    lines = print_text_lines(results, test_id, timestamp)
+    try:
+        font = ImageFont.load_default(size=font_size)
+    except TypeError:  # Pillow < 10.1 has no sized default font
+        font = ImageFont.load_default()
+    line_height = int(font_size * 1.6)
+    margin = font_size
+    image = Image.new("L", (width, margin * 2 + line_height * len(lines)), color=250)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((margin, margin + i * line_height), line, fill=20, font=font)
+    return image.convert("RGB")
+
+
+def degrade(image: Image.Image, rng: random.Random, noise: float = 0.0, blur: float = 0.0,
+            rotation: float = 0.0, lighting: float = 0.0) -> Tuple[Image.Image, Dict[str, float]]:
+    """
+    Apply field-photo defects at the given strengths: Gaussian noise sigma,
+    blur radius, maximum skew in degrees, and uneven lighting (0..1, the depth
+    of a random-direction shadow gradient plus global exposure error).
+    Returns the image and the parameters actually drawn.
+    """
+    image = image.convert("L")
+    params = {"noise": 0.0, "blur": 0.0, "rotation": 0.0, "lighting": 0.0}
+
+    if rotation:
+        params["rotation"] = round(rng.uniform(-rotation, rotation), 2)
+        image = image.rotate(params["rotation"], resample=Image.Resampling.BICUBIC, expand=True, fillcolor=235)
+
+    if lighting:
+        params["lighting"] = round(rng.uniform(0, lighting), 3)
+        shadow = Image.linear_gradient("L").rotate(rng.choice([0, 90, 180, 270])).resize(image.size)
+        # Darken towards one edge by up to `lighting` of full scale
+        shadow = shadow.point(lambda v: 255 - int(v * params["lighting"]))
+        image = Image.composite(image, Image.new("L", image.size, 0), shadow)
+        image = ImageEnhance.Brightness(image).enhance(1 + rng.uniform(-0.5, 0.5) * params["lighting"])
+
+    if blur:
+        params["blur"] = round(rng.uniform(0, blur), 2)
+        image = image.filter(ImageFilter.GaussianBlur(params["blur"]))
+
+    if noise:
+        params["noise"] = round(rng.uniform(0, noise), 2)
+        # effect_noise is centred on 128; the offset makes it zero-mean
+        grain = Image.effect_noise(image.size, params["noise"])
+        image = ImageChops.add(image, grain, offset=-128)
+
+    return image.convert("RGB"), params
+
+
+def synthetic_documents(count: int, seed: int = 0) -> List[Dict]:
+    """Seed documents shaped like stored drug_tests records"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    documents = []
+    for i in range(count):
+        results = random_results(rng)
+        timestamp = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+        documents.append({
+            "_id": ObjectId(),
+            "scan_file_url": f"uploads/{i:08d}.jpg",
+            "ocr_text": " ".join(print_text_lines(results, f"{i:06d}", timestamp)),
+            "ocr_data": results,
+            "person_id": f"P{rng.randint(1, max(count // 10, 1)):06d}",
+            "photo_url": None,
+            "location": {
+                "type": "Point",
+                "coordinates": [round(rng.uniform(-180, 180), 6), round(rng.uniform(-60, 60), 6)],
+            },
+            "operator": {"id": f"OP{rng.randint(1, 50):03d}", "name": f"Operator {rng.randint(1, 50)}"},
+            "test_timestamp": timestamp,
+            "uploaded_at": timestamp,
+            "hash": hashlib.sha256(f"{seed}:{i}".encode()).hexdigest(),
+            "ocr_confidence": round(rng.uniform(55, 98), 2),
+            "processing_status": rng.choice(["completed"] * 8 + ["failed", "pending"]),
+            "processing_error": None,
+        })
+    return documents
@@ -0,0 +1,179 @@
+import zlib
+from typing import Dict, List, Optional, Tuple
+from .config import get_settings
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it only gzip is offered
+    brotli = None
+
+settings = get_settings()
+
+# Already-compressed or binary payloads gain nothing from another pass
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/xml", "application/javascript")
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Map each coding in an Accept-Encoding header to its q-value"""
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Best coding we support, preferring brotli over gzip on equal q-values"""
+    codings = parse_accept_encoding(header)
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = None
+    best_q = 0.0
+    for coding in supported:
+        q = codings.get(coding, codings.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits=31: gzip container
+            self._zlib = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware negotiating gzip/brotli from Accept-Encoding. Single-body
+    responses below COMPRESSION_MIN_SIZE are sent as-is; streaming responses
+    are compressed chunk by chunk without buffering the whole body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        if encoding is None or scope.get("method") == "HEAD":
+            return await self.app(scope, receive, send)
+
+        state = {"start": None, "started": False, "compressor": None, "passthrough": False}
+
+        async def send_start(message):
+            state["started"] = True
+            await send(message)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk decides the encoding
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            start = state["start"]
+
+            if state["compressor"] is None:
+                headers = start["headers"]
+                if not self._compressible(start["status"], headers):
+                    state["passthrough"] = True
+                    await send_start(start)
+                    return await send(message)
+
+                content_length = self._header(headers, b"content-length")
+                small = len(body) < settings.COMPRESSION_MIN_SIZE if not more_body else \
+                    content_length is not None and int(content_length) < settings.COMPRESSION_MIN_SIZE
+                if small:
+                    state["passthrough"] = True
+                    start["headers"] = self._with_vary(headers)
+                    await send_start(start)
+                    return await send(message)
+
+                state["compressor"] = _Compressor(encoding)
+                start["headers"] = self._compressed_headers(headers, encoding)
+                await send_start(start)
+
+            compressor = state["compressor"]
+            chunk = compressor.compress(body)
+            if not more_body:
+                chunk += compressor.flush()
+            if chunk or not more_body:
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+        if state["start"] is not None and not state["started"]:
+            await send(state["start"])
+
+    @staticmethod
+    def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[str]:
+        for key, value in headers:
+            if key.lower() == name:
+                return value.decode("latin-1")
+        return None
+
+    @staticmethod
+    def _compressible(status: int, headers: List[Tuple[bytes, bytes]]) -> bool:
+        # Partial and bodiless responses must keep their exact bytes
+        if status < 200 or status in (204, 206, 304):
+            return False
+        if CompressionMiddleware._header(headers, b"content-encoding"):
+            return False
+        content_type = (CompressionMiddleware._header(headers, b"content-type") or "").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    @staticmethod
+    def _with_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+        vary = CompressionMiddleware._header(headers, b"vary")
+        if vary and "accept-encoding" in vary.lower():
+            return headers
+        headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+        value = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+        return headers + [(b"vary", value.encode("latin-1"))]
+
+    @staticmethod
+    def _compressed_headers(headers: List[Tuple[bytes, bytes]], encoding: str) -> List[Tuple[bytes, bytes]]:
+        headers = [
+            (k, v) for k, v in CompressionMiddleware._with_vary(headers)
+            if k.lower() not in (b"content-length", b"accept-ranges")
+        ]
+        # A strong validator identifies exact bytes, which compression changes
+        headers = [
+            (k, b"W/" + v if k.lower() == b"etag" and not v.startswith(b"W/") else v)
+            for k, v in headers
+        ]
+        return headers + [(b"content-encoding", encoding.encode("latin-1"))]
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import Set
+from typing import Dict, Set
 import os
 import platform
 
@@ -8,6 +8,26 @@ class Settings(BaseSettings):
     # MongoDB settings
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "sotoxa_db"
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 10
+    MONGODB_MAX_IDLE_TIME_MS: int = 60000
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 5000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    MONGODB_CONNECT_TIMEOUT_MS: int = 5000
+    MONGODB_SOCKET_TIMEOUT_MS: int = 30000
+    MONGODB_COMPRESSORS: str = "zlib"  # e.g. "zstd,snappy,zlib" if the codecs are installed
+    MONGODB_ANALYTICS_READ_PREFERENCE: str = "secondaryPreferred"  # dashboard/export reads
+    MONGODB_WARMUP_CONNECTIONS: int = 10
+
+    # Process model (see run.py)
+    WEB_WORKERS: int = 1  # uvicorn worker processes; run.py --workers exports this to the workers
+    # "all": API workers also run OCR; "api": uploads stay pending for "ocr" role workers
+    # (python run.py --role ocr), so API processes never load the OCR stack
+    WORKER_ROLE: str = "all"
+    OCR_WORKER_POLL_INTERVAL: float = 1.0  # seconds an idle OCR worker waits before claiming again
+    OCR_WORKER_LEASE_SECONDS: int = 600  # a claimed job returns to the pool if not finished by then
+    STARTUP_LOCK_TTL: int = 300  # seconds a crashed worker can hold the startup lock
+    STARTUP_ENSURE_INDEXES: bool = True  # check/create indexes at startup (once, under the lock)
     
     # File storage settings
     UPLOAD_DIR: str = "uploads"
@@ -22,6 +42,78 @@ class Settings(BaseSettings):
     # OCR settings
     OCR_CONFIDENCE_THRESHOLD: float = 60.0  # Lower threshold for more results
     TESSERACT_CMD: str = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    OCR_WORKERS: int = 0  # OCR worker threads per process, 0 = CPU cores / WEB_WORKERS
+    OCR_DRAIN_TIMEOUT: float = 60.0  # seconds shutdown waits for in-flight OCR
+    OCR_PRIORITY_WEIGHTS: Dict[str, int] = {"interactive": 8, "batch": 2, "reprocess": 1}
+    OCR_AGING_SECONDS: float = 60.0  # jobs waiting longer are dispatched first regardless of class
+    OCR_MAX_QUEUE_DEPTH: int = 200  # queued + running OCR jobs before uploads get 503
+    OCR_DESKEW_MAX_ANGLE: float = 10.0  # degrees searched either way, 0 disables deskew
+    OCR_BINARIZATION: str = "sauvola"  # "sauvola", "otsu" or "none"
+    OCR_SAUVOLA_WINDOW: int = 51  # px at the preprocessed (>=1500px) resolution
+    OCR_SAUVOLA_K: float = 0.5  # Sauvola's value; 0.2 left background noise as speckle on the test corpus
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_MEMORY_SIZE: int = 10000  # entries in the in-process LRU in front of the ocr_cache collection
+    
+    # Admission control: concurrent requests per route class. "global" caps the
+    # worker (503 when full); role keys cap each user of that role (429)
+    ADMISSION_LIMITS: Dict[str, Dict[str, int]] = {
+        "upload": {"global": 32, "admin": 8, "operator": 4, "default": 2},
+        "export": {"global": 2, "default": 1},
+    }
+    ADMISSION_RETRY_AFTER: int = 5  # seconds
+
+    # Response compression (brotli is used when the package is installed)
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes; smaller bodies are sent uncompressed
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+
+    # Bulk metadata updates
+    METADATA_BULK_MAX_ITEMS: int = 1000
+
+    # Geospatial search and map clustering
+    GEO_MAX_RESULTS: int = 500
+    GEO_CLUSTER_GRID: int = 8  # Cells per tile edge when clustering map tiles
+
+    # Change feed (outbox) for downstream consumers
+    OUTBOX_RETENTION_DAYS: int = 7  # Resume tokens older than this must resync
+    OUTBOX_MAX_BATCH: int = 1000
+    OUTBOX_SETTLE_SECONDS: float = 5.0  # How long a sequence gap may be an in-flight write
+    OUTBOX_SWEEP_INTERVAL: float = 30.0  # seconds between passes republishing failed publishes, 0 disables
+    OUTBOX_SWEEP_AFTER: float = 60.0  # an event still pending this long after its write is republished
+
+    # Logging: records are queued and written by a background thread (see app/core/log.py)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (one object per line) or "text"
+    LOG_QUEUE_SIZE: int = 10000  # records buffered for the writer; more are dropped and counted
+    LOG_OCR_DEBUG_SAMPLE_RATE: float = 0.01  # fraction of scans whose OCR details are logged at DEBUG
+    LOG_OCR_CONTENT: bool = False  # put OCR text and per-drug results in those records (sensitive)
+
+    # Request tracing: per-stage spans for uploads and OCR jobs, kept in the traces collection
+    TRACING_ENABLED: bool = True
+    TRACE_RETENTION_DAYS: int = 7
+    TRACE_STATS_MAX_SPANS: int = 100000  # newest spans read for percentile stats
+    TRACING_OTLP_ENDPOINT: str = ""  # OTLP/HTTP JSON, e.g. http://localhost:4318/v1/traces; empty disables export
+    TRACING_SERVICE_NAME: str = "sotoxa-backend"
+
+    # Full-text search over OCR text
+    SEARCH_MAX_RESULTS: int = 1000  # Deepest rank reachable by paging
+    SEARCH_SNIPPET_LENGTH: int = 160  # characters
+    
+    # Image derivatives generated at ingest (originals are kept)
+    IMAGE_NORMALIZED_MAX_SIZE: int = 1600
+    IMAGE_THUMBNAIL_SIZE: int = 320
+    IMAGE_DERIVATIVE_FORMAT: str = "WEBP"  # WEBP or JPEG
+    IMAGE_DERIVATIVE_QUALITY: int = 80
+    
+    # Blob storage: "local" (UPLOAD_DIR sharded by hash prefix) or "s3"
+    STORAGE_BACKEND: str = "local"
+    STORAGE_SHARD_DEPTH: int = 2
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    # Flaky-network uploads: Idempotency-Key replay window and resumable upload sessions
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    UPLOAD_SESSION_TTL_HOURS: int = 24  # since the last chunk; expired sessions are purged by the retention CLI
+    UPLOAD_SESSION_DIR: str = "upload_sessions"  # partial files; keep on the same host as the API
     
     # S3 settings
     USE_S3: bool = False
@@ -29,6 +121,18 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: str = ""
     AWS_BUCKET_NAME: str = ""
     AWS_REGION: str = "us-east-1"
+    S3_ENDPOINT_URL: str = ""  # MinIO / moto server, empty for AWS
+    S3_MULTIPART_PART_SIZE: int = 8 * 1024 * 1024
+
+    # Retention: archive tests older than N months (per processing_status, "default"
+    # for the rest, 0 to keep forever) into drug_tests_archive with blobs in cold storage
+    RETENTION_POLICIES: Dict[str, int] = {"default": 24}
+    RETENTION_BATCH_SIZE: int = 200
+    RETENTION_DEBUG_FILE_DAYS: int = 7  # OCR _processed.jpg debug images older than this are removed
+    COLD_STORAGE_BACKEND: str = "local"  # "local" (COLD_STORAGE_DIR) or "s3" (COLD_STORAGE_BUCKET)
+    COLD_STORAGE_DIR: str = "archive"
+    COLD_STORAGE_BUCKET: str = ""
+    COLD_STORAGE_CLASS: str = "GLACIER_IR"  # S3 storage class; instant retrieval keeps presigned reads working
     
     # PDF processing settings
     POPPLER_PATH: str = os.getenv('POPPLER_PATH', 
@@ -0,0 +1,117 @@
+import json
+import queue
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from .config import get_settings
+from .metrics import registry
+
+# Structured logging. Records are queued by the logging thread (request
+# handlers, OCR workers) and formatted and written by one background
+# listener thread, so log I/O never blocks the hot path. Fields passed as
+# `extra` become JSON keys. Call sites pass arguments rather than f-strings,
+# so a record that is filtered out is never formatted.
+
+settings = get_settings()
+
+LOG_DROPPED = registry.counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records only cross threads, not processes, so formatting is left to the listener
+        return record
+
+
+class SampledLogger:
+    """
+    A logger for verbose output that is only worth keeping for a fraction
+    of events. sample() decides once per event, before any arguments are
+    built, so unsampled events cost one random() call.
+    """
+
+    def __init__(self, name: str, rate: float):
+        self.logger = logging.getLogger(name)
+        self.rate = rate
+
+    def sample(self) -> bool:
+        if self.rate <= 0 or not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        return self.rate >= 1 or random.random() < self.rate
+
+
+# One INFO summary record per scan
+OCR_LOG = logging.getLogger("app.ocr")
+# Per-scan OCR details (preprocessed image, word counts, extraction), for a sample of scans
+OCR_DEBUG = SampledLogger("app.ocr.debug", settings.LOG_OCR_DEBUG_SAMPLE_RATE)
+
+
+def ocr_content(text: str, results: Optional[Dict[str, str]] = None) -> Dict:
+    """OCR text and results for a debug record, reduced to sizes unless LOG_OCR_CONTENT is set"""
+    if settings.LOG_OCR_CONTENT:
+        return {"ocr_text": text, "ocr_data": results}
+    return {"ocr_text_chars": len(text)}
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging():
+    """Route the root logger through the queue to a stderr writer thread; safe to call twice"""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(settings.LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [_NonBlockingQueueHandler(log_queue)]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    if settings.LOG_OCR_DEBUG_SAMPLE_RATE > 0:
+        # Sampled OCR detail is kept even when everything else is at INFO
+        OCR_DEBUG.logger.setLevel(logging.DEBUG)
+
+    _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Write out queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
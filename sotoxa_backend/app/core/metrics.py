@@ -0,0 +1,250 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Sequence
+
+# Lightweight in-process metrics with Prometheus text exposition.
+# No client library or external service is needed; each worker process
+# exposes its own counters on /metrics.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, plus sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> Dict:
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": state[2], "sum": state[1]}
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors = []
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """Register a callable run before each scrape, e.g. to refresh gauges"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+HTTP_REQUEST_SIZE = registry.histogram(
+    "http_request_size_bytes", "HTTP request body size", ("method", "route"), SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = registry.histogram(
+    "http_response_size_bytes", "HTTP response body size", ("method", "route"), SIZE_BUCKETS)
+
+# Admission control
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "admission_in_flight", "Admitted requests in progress by route class", ("route",))
+ADMISSION_REJECTED = registry.counter(
+    "admission_rejected_total", "Requests rejected by admission control", ("route", "status"))
+
+# OCR pipeline
+OCR_STAGE_DURATION = registry.histogram(
+    "ocr_stage_duration_seconds", "Time spent per OCR pipeline stage", ("stage",))
+OCR_JOBS = registry.counter(
+    "ocr_jobs_total", "OCR jobs by final status", ("status",))
+OCR_RETRIES = registry.counter(
+    "ocr_retries_total", "OCR attempts retried because no results were extracted")
+OCR_CONFIDENCE = registry.histogram(
+    "ocr_confidence", "Average Tesseract confidence per scan",
+    buckets=(10, 20, 30, 40, 50, 60, 70, 80, 90, 100))
+OCR_QUEUE_DEPTH = registry.gauge(
+    "ocr_queue_depth", "OCR jobs queued or running")
+OCR_QUEUE_DEPTH.set(0)
+OCR_WAIT_TIME = registry.histogram(
+    "ocr_wait_seconds", "Time OCR jobs wait for a worker by priority class", ("priority",),
+    buckets=(0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+OCR_SCHEDULER_QUEUED = registry.gauge(
+    "ocr_scheduler_queued", "OCR jobs waiting for a worker by priority class", ("priority",))
+OCR_CACHE_LOOKUPS = registry.counter(
+    "ocr_cache_lookups_total", "OCR result cache lookups by outcome", ("result",))
+
+# Uploads
+IMAGE_DERIVATIVE_DURATION = registry.histogram(
+    "image_derivative_duration_seconds", "Time to render normalized/thumbnail derivatives")
+UPLOAD_BYTES = registry.counter(
+    "upload_bytes_total", "Bytes written by the uploader")
+UPLOAD_THROUGHPUT = registry.histogram(
+    "upload_throughput_bytes_per_second", "Uploader write throughput",
+    buckets=(1e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8, 1e9))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, status and payload sizes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_holder = {"status": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                status_holder["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            request_size = 0
+            for name, value in scope.get("headers", []):
+                if name == b"content-length":
+                    request_size = int(value or 0)
+                    break
+            HTTP_REQUESTS.inc(method=method, route=route_label, status=status_holder["status"])
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, method=method, route=route_label)
+            HTTP_REQUEST_SIZE.observe(request_size, method=method, route=route_label)
+            HTTP_RESPONSE_SIZE.observe(status_holder["bytes"], method=method, route=route_label)
@@ -0,0 +1,61 @@
+import json
+from datetime import date, datetime
+from typing import Any, Dict, List
+from bson import ObjectId
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+from ..models.drug_test import DrugTest
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder gives identical output, slower
+    orjson = None
+
+# Response serialization that skips FastAPI's response_model round trip
+# (validate, jsonable_encoder, json.dumps). Raw Mongo documents are encoded
+# directly, with ObjectId and datetime handled by the encoder; model-shaped
+# responses go through precompiled TypeAdapters and pydantic-core's JSON writer.
+
+DRUG_TEST_ADAPTER = TypeAdapter(DrugTest)
+DRUG_TEST_LIST_ADAPTER = TypeAdapter(List[DrugTest])
+
+
+def _default(obj: Any):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON for Mongo documents; ObjectId becomes its hex string"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class MongoJSONResponse(JSONResponse):
+    """JSONResponse for raw Mongo documents; return it from a route to bypass response_model"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def api_locations(documents: List[Dict]) -> List[Dict]:
+    """
+    Rewrite stored GeoJSON locations to the API's {latitude, longitude}
+    shape in place, as the Location model does for validated responses
+    """
+    for document in documents:
+        location = document.get("location")
+        if location and location.get("type") == "Point":
+            longitude, latitude = location["coordinates"][:2]
+            document["location"] = {"latitude": latitude, "longitude": longitude}
+    return documents
+
+
+def drug_test_response(document: dict, status_code: int = 200) -> Response:
+    """Serialize one stored drug test exactly as response_model=DrugTest would"""
+    body = DRUG_TEST_ADAPTER.dump_json(DRUG_TEST_ADAPTER.validate_python(document), by_alias=True)
+    return Response(content=body, status_code=status_code, media_type="application/json")
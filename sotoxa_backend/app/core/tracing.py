@@ -0,0 +1,287 @@
+import os
+import re
+import json
+import time
+import queue
+import logging
+import threading
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from .config import get_settings
+from .metrics import registry
+
+# Lightweight request tracing. A trace is a set of timed spans sharing a
+# trace ID; the active trace and parent span travel in context variables, so
+# spans nest across awaits and, via the OCR scheduler's copied context, into
+# worker threads. IDs follow W3C Trace Context / OpenTelemetry sizes, so
+# traces can be continued from a client's traceparent header and exported to
+# an OTLP collector unchanged.
+
+settings = get_settings()
+
+TRACE_EXPORTS = registry.counter(
+    "trace_exports_total", "Trace segments sent to the OTLP collector by outcome", ("result",))
+
+TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_parent: ContextVar[Optional[str]] = ContextVar("trace_parent", default=None)
+
+
+def new_trace_id() -> str:
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace_id, parent span_id) from a W3C traceparent header, None if absent or invalid"""
+    match = TRACEPARENT.match((header or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"} or set(match.group(2)) == {"0"}:
+        return None
+    return match.group(1), match.group(2)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, span_id: str, parent_id: Optional[str], start_ns: int,
+                 attributes: Optional[Dict] = None):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.end_ns = start_ns
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set(self, key: str, value):
+        if self.span_id:
+            self.attributes[key] = value
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+# Yielded by span() when no trace is active, so callers can always call .set()
+NOOP_SPAN = Span("noop", "", None, 0)
+
+
+class Trace:
+    """Spans finished in one process for one trace; a trace can span several segments"""
+
+    def __init__(self, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+                 test_id: Optional[str] = None):
+        self.trace_id = trace_id or new_trace_id()
+        self.parent_id = parent_id  # span this segment continues: a client traceparent, or the upload span
+        self.test_id = test_id
+        self.spans: List[Span] = []  # list.append is atomic, so worker threads add spans directly
+
+
+def current() -> Optional[Trace]:
+    return _trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _trace.get()
+    return trace.trace_id if trace else None
+
+
+def current_span_id() -> Optional[str]:
+    return _parent.get() if _trace.get() is not None else None
+
+
+def durations_by_name() -> Dict[str, float]:
+    """Total ms per span name finished so far in the active trace, e.g. for a summary log record"""
+    totals: Dict[str, float] = {}
+    trace = _trace.get()
+    for finished in (trace.spans if trace else ()):
+        totals[finished.name] = totals.get(finished.name, 0.0) + (finished.end_ns - finished.start_ns) / 1e6
+    return totals
+
+
+def set_test_id(test_id: str):
+    """Attach the active trace to a drug test once its ID is known"""
+    trace = _trace.get()
+    if trace is not None:
+        trace.test_id = test_id
+
+
+@contextmanager
+def activate(trace: Trace):
+    """Make trace the active trace for the enclosed block"""
+    trace_token = _trace.set(trace)
+    parent_token = _parent.set(trace.parent_id)
+    try:
+        yield trace
+    finally:
+        _parent.reset(parent_token)
+        _trace.reset(trace_token)
+
+
+@contextmanager
+def span(name: str, start_ns: Optional[int] = None, **attributes):
+    """
+    Time the enclosed block as a child of the current span. A no-op outside
+    a trace. start_ns backdates the span, e.g. to when a job was queued.
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield NOOP_SPAN
+        return
+    current_span = Span(name, new_span_id(), _parent.get(), start_ns or time.time_ns(), attributes)
+    token = _parent.set(current_span.span_id)
+    try:
+        yield current_span
+    except BaseException as e:
+        current_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _parent.reset(token)
+        current_span.end_ns = time.time_ns()
+        trace.spans.append(current_span)
+
+
+def record(name: str, start_ns: int, end_ns: int, **attributes):
+    """Add an already-finished span, e.g. a wait measured by someone else, under the current span"""
+    trace = _trace.get()
+    if trace is None:
+        return
+    finished = Span(name, new_span_id(), _parent.get(), start_ns, attributes)
+    finished.end_ns = end_ns
+    trace.spans.append(finished)
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class OTLPExporter:
+    """
+    Sends finished traces to an OpenTelemetry collector as OTLP/HTTP JSON
+    from a background thread. Export never blocks or fails the traced work:
+    when the queue is full or the collector is down, traces are dropped and
+    counted in trace_exports_total.
+    """
+
+    def __init__(self, endpoint: str, service_name: str, max_queue: int = 2048,
+                 batch_size: int = 64, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._queue: "queue.Queue[Optional[Trace]]" = queue.Queue(max_queue)
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            TRACE_EXPORTS.inc(result="dropped")
+
+    def payload(self, traces: List[Trace]) -> Dict:
+        spans = []
+        for trace in traces:
+            for finished in trace.spans:
+                attributes = dict(finished.attributes)
+                if trace.test_id:
+                    attributes.setdefault("sotoxa.test_id", trace.test_id)
+                spans.append({
+                    "traceId": trace.trace_id,
+                    "spanId": finished.span_id,
+                    "parentSpanId": finished.parent_id or "",
+                    "name": finished.name,
+                    "kind": 1,  # SPAN_KIND_INTERNAL
+                    "startTimeUnixNano": str(finished.start_ns),
+                    "endTimeUnixNano": str(finished.end_ns),
+                    "attributes": _otlp_attributes(attributes),
+                    # STATUS_CODE_ERROR = 2, STATUS_CODE_UNSET = 0
+                    "status": {"code": 2, "message": finished.error} if finished.error else {"code": 0},
+                })
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": self.service_name})},
+            "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": spans}],
+        }]}
+
+    def _send(self, traces: List[Trace]):
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(self.payload(traces)).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+            TRACE_EXPORTS.inc(len(traces), result="sent")
+        except Exception as e:
+            TRACE_EXPORTS.inc(len(traces), result="failed")
+            logging.warning(f"Failed to export {len(traces)} traces to {self.endpoint}: {str(e)}")
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            trace = self._queue.get()
+            if trace is None:
+                break
+            batch = [trace]
+            while len(batch) < self.batch_size:
+                try:
+                    trace = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if trace is None:
+                    stopping = True
+                    break
+                batch.append(trace)
+            self._send(batch)
+
+    def shutdown(self, timeout: float = 5.0):
+        """Send what is queued, waiting up to timeout"""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+
+_exporter: Optional[OTLPExporter] = None
+
+
+def exporter() -> Optional[OTLPExporter]:
+    """The OTLP exporter, started on first use; None unless TRACING_OTLP_ENDPOINT is set"""
+    global _exporter
+    if _exporter is None and settings.TRACING_OTLP_ENDPOINT:
+        _exporter = OTLPExporter(settings.TRACING_OTLP_ENDPOINT, settings.TRACING_SERVICE_NAME)
+    return _exporter
+
+
+def shutdown_exporter(timeout: float = 5.0):
+    global _exporter
+    if _exporter is not None:
+        _exporter.shutdown(timeout)
+        _exporter = None
@@ -0,0 +1,87 @@
+import logging
+from typing import List
+from ..core.config import get_settings
+
+settings = get_settings()
+
+# (collection, keys, create_index options). Each index is created on its own, so one
+# that cannot be built is reported without skipping the rest.
+INDEXES = [
+    # Users first: duplicate accounts are the costliest thing to let through
+    ("users", "username", {"unique": True}),
+    ("users", "email", {"unique": True}),
+
+    # Person timelines: equality on person_id, newest first, _id as keyset tie-breaker.
+    # Also serves plain person_id lookups, so no separate person_id index is needed.
+    ("drug_tests", [("person_id", 1), ("test_timestamp", -1), ("_id", -1)], {}),
+    ("drug_tests", "operator.id", {}),
+    ("drug_tests", "test_timestamp", {}),
+    ("drug_tests", "hash", {"unique": True}),
+    # Locations are GeoJSON points; databases with older {latitude, longitude}
+    # locations must run app.scripts.migrate_geo first or this build fails
+    ("drug_tests", [("location", "2dsphere")], {}),
+    # Full-text search; language "none" keeps drug codes and misread tokens unstemmed
+    ("drug_tests",
+     [("ocr_text", "text"), ("person_id", "text"), ("operator.name", "text"), ("operator.id", "text")],
+     {"name": "search_text",
+      "weights": {"person_id": 10, "operator.id": 5, "operator.name": 5, "ocr_text": 1},
+      "default_language": "none"}),
+
+    # OCR-role workers claim pending tests by priority, oldest first
+    ("drug_tests", [("processing_status", 1), ("ocr_priority", 1), ("uploaded_at", 1)],
+     {"partialFilterExpression": {"processing_status": "pending"}}),
+
+    # Retention looks up other tests sharing an archived record's photo
+    ("drug_tests", "photo_url", {"sparse": True}),
+    ("drug_tests_archive", [("person_id", 1), ("test_timestamp", -1)], {}),
+
+    # OCR result cache is keyed by "<hash>:<pipeline version>" in _id;
+    # this index supports purging entries for a scan across versions
+    ("ocr_cache", "file_hash", {}),
+
+    # Change feed events age out after OUTBOX_RETENTION_DAYS; _id is the sequence number
+    ("change_events", "created_at", {"expireAfterSeconds": settings.OUTBOX_RETENTION_DAYS * 86400}),
+    # A republished event is rejected if its first publish got through after all
+    ("change_events", "event_id", {"unique": True, "partialFilterExpression": {"event_id": {"$exists": True}}}),
+    # The outbox sweeper finds tests whose events were never published
+    ("drug_tests", "outbox_pending.created_at", {"sparse": True}),
+
+    # Trace segments: per-test timelines, lookups by trace ID, and expiry
+    ("traces", [("test_id", 1), ("started_at", 1)], {}),
+    ("traces", "trace_id", {}),
+    ("traces", "created_at", {"expireAfterSeconds": settings.TRACE_RETENTION_DAYS * 86400}),
+
+    # Idempotency keys expire on their own; expired upload sessions also have a partial
+    # file to remove, so the retention CLI purges them (UploadSessionService.purge_expired)
+    ("idempotency_keys", "expires_at", {"expireAfterSeconds": 0}),
+    ("upload_sessions", "expires_at", {}),
+]
+
+
+async def ensure_indexes(db) -> List[str]:
+    """
+    Create every collection index the app relies on; safe to re-run.
+    Returns one message per index that could not be created, each also
+    logged; an empty list means everything is in place.
+    """
+    failures = []
+
+    # Archived tests are rarely read: trade CPU for disk with zstd block compression
+    try:
+        if "drug_tests_archive" not in await db.list_collection_names():
+            await db.create_collection(
+                "drug_tests_archive",
+                storageEngine={"wiredTiger": {"configString": "block_compressor=zstd"}}
+            )
+    except Exception as e:
+        failures.append(f"drug_tests_archive collection: {str(e)}")
+
+    for collection, keys, options in INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            failures.append(f"{collection} index {keys}: {str(e)}")
+
+    for failure in failures:
+        logging.error(f"Index check failed for {failure}")
+    return failures
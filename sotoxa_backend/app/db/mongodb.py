@@ -1,18 +1,164 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from pymongo.write_concern import WriteConcern
 from ..core.config import get_settings
 
 settings = get_settings()
 
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Collects connection pool counters from the driver's CMAP events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checked_out": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "pool_clears": 0,
+            "checkout_wait_ms_total": 0.0,
+        }
+
+    def _incr(self, key: str, amount: float = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["open_connections"] = stats["connections_created"] - stats["connections_closed"]
+        stats["avg_checkout_wait_ms"] = (
+            stats["checkout_wait_ms_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        )
+        return stats
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incr("pool_clears")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("connections_created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("connections_closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failures")
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.stats["checkouts"] += 1
+            self.stats["checked_out"] += 1
+            # pymongo >= 4.7 reports how long the checkout waited for a connection
+            duration = getattr(event, "duration", None)
+            if duration is not None:
+                self.stats["checkout_wait_ms_total"] += duration * 1000
+
+    def connection_checked_in(self, event):
+        self._incr("checked_out", -1)
+
+
 class MongoDB:
+    # Per operation class read/write settings. Upload and metadata writes must
+    # survive a failover; OCR results can always be recomputed from the scan.
+    OPERATION_CLASSES = {
+        "default": {},
+        "ingest": {"write_concern": WriteConcern(w="majority")},
+        "metadata": {"write_concern": WriteConcern(w="majority")},
+        "ocr": {"write_concern": WriteConcern(w=1)},
+        "analytics": {
+            "read_preference": make_read_preference(
+                read_pref_mode_from_name(settings.MONGODB_ANALYTICS_READ_PREFERENCE), None
+            )
+        },
+    }
+
     client: AsyncIOMotorClient = None
     db = None
+    pool_listener: Optional[PoolStatsListener] = None
 
-    async def connect_to_database(self):
-        self.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    @staticmethod
+    def _client_options() -> Dict:
+        options = {
+            "maxPoolSize": settings.MONGODB_MAX_POOL_SIZE,
+            "minPoolSize": settings.MONGODB_MIN_POOL_SIZE,
+            "maxIdleTimeMS": settings.MONGODB_MAX_IDLE_TIME_MS,
+            "waitQueueTimeoutMS": settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+            "serverSelectionTimeoutMS": settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+            "connectTimeoutMS": settings.MONGODB_CONNECT_TIMEOUT_MS,
+            "socketTimeoutMS": settings.MONGODB_SOCKET_TIMEOUT_MS,
+        }
+        if settings.MONGODB_COMPRESSORS:
+            options["compressors"] = settings.MONGODB_COMPRESSORS
+        return options
+
+    async def connect_to_database(self, warm_up: bool = True):
+        self.pool_listener = PoolStatsListener()
+        self.client = AsyncIOMotorClient(
+            settings.MONGODB_URL,
+            event_listeners=[self.pool_listener],
+            **self._client_options()
+        )
         self.db = self.client[settings.MONGODB_DB_NAME]
-        
+        if warm_up:
+            await self.warm_up()
+
+    async def warm_up(self, connections: Optional[int] = None):
+        """Open pool connections up front so the first requests don't pay for handshakes"""
+        count = min(
+            connections or settings.MONGODB_WARMUP_CONNECTIONS,
+            settings.MONGODB_MAX_POOL_SIZE
+        )
+        if count <= 0:
+            return
+        # Concurrent pings force the driver to check out (and create) one connection each
+        results = await asyncio.gather(
+            *(self.db.command("ping") for _ in range(count)),
+            return_exceptions=True
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logging.warning(f"MongoDB warm-up: {len(failures)}/{count} pings failed: {failures[0]}")
+
+    def collection(self, name: str, operation: str = "default"):
+        """Get a collection configured for the given operation class"""
+        options = self.OPERATION_CLASSES[operation]
+        if not options:
+            return self.db[name]
+        return self.db.get_collection(name, **options)
+
+    def pool_stats(self) -> Dict:
+        """Connection pool statistics for sizing the pool against worker counts"""
+        stats = self.pool_listener.snapshot() if self.pool_listener else {}
+        stats["max_pool_size"] = settings.MONGODB_MAX_POOL_SIZE
+        stats["min_pool_size"] = settings.MONGODB_MIN_POOL_SIZE
+        return stats
+
     async def close_database_connection(self):
         if self.client:
             self.client.close()
+            self.client = None
+            self.db = None
 
-db = MongoDB()
\ No newline at end of file
+db = MongoDB()
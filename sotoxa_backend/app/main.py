@@ -1,13 +1,24 @@
 from fastapi import FastAPI, status
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
 from typing import Dict
 
 from .db.mongodb import db
-from .routers import drug_tests, auth
-from .services.auth_service import AuthService
-from .models.user import UserCreate, UserRole, UserInDB
+from .core.metrics import MetricsMiddleware, registry
+from .core.compression import CompressionMiddleware
+from .routers import drug_tests, auth, persons, uploads, changes, traces
+from .services.startup_service import StartupService
+from .services.ocr_queue import OCRQueue
+from .services.ocr_scheduler import OCRScheduler
+from .services.trace_service import TraceService
+from .services.outbox_service import OutboxService
+from .core import tracing
+from .core.log import setup_logging, shutdown_logging
+from .core.config import get_settings
+
+settings = get_settings()
 
 app = FastAPI(
     title="Sotoxa Backend API",
@@ -15,6 +26,9 @@ app = FastAPI(
     version="1.0.0",
 )
 
+# Response compression (innermost, so CORS and metrics see the final response)
+app.add_middleware(CompressionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -22,33 +36,42 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Upload-Offset", "Upload-Length", "Idempotent-Replayed", "Retry-After"],
 )
 
+# Request metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(drug_tests.router)
+app.include_router(uploads.router)
+app.include_router(persons.router)
+app.include_router(changes.router)
+app.include_router(traces.router)
 
 @app.on_event("startup")
 async def startup_db_client():
+    # Per worker process: app logs go through a queue to a writer thread
+    setup_logging()
     await db.connect_to_database()
-    
-    # Create admin user if it doesn't exist
-    if not await AuthService.get_user("admin"):
-        admin_user = UserCreate(
-            username="admin",
-            email="admin@example.com",
-            password="admin123",  # Change this in production!
-            role=UserRole.ADMIN
-        )
-        user_in_db = UserInDB(
-            **admin_user.dict(exclude={'password'}),
-            hashed_password=AuthService.get_password_hash(admin_user.password)
-        )
-        await db.db["users"].insert_one(user_in_db.dict(by_alias=True))
+
+    # Admin bootstrap and index checks, once across all workers
+    await StartupService.run()
+
+    # Republishes change events whose publish failed after their write
+    OutboxService.start_sweeper()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Finish in-flight OCR before the connection it writes results through goes away
+    await OCRQueue.drain(settings.OCR_DRAIN_TIMEOUT)
+    OCRScheduler.shutdown()
+    await OutboxService.stop_sweeper()
+    await TraceService.flush()
+    tracing.shutdown_exporter()
     await db.close_database_connection()
+    shutdown_logging()
 
 @app.get("/", tags=["Health Check"])
 async def root():
@@ -76,9 +99,20 @@ async def health_check() -> Dict:
     return {
         "status": "healthy",
         "database": db_status,
+        "db_pool": db.pool_stats(),
         "api_version": "1.0.0"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """
+    Prometheus text exposition of the in-process metrics
+    """
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4"
+    )
+
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
     """
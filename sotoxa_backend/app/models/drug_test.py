@@ -1,6 +1,6 @@
 from datetime import datetime
-from typing import Optional, Dict
-from pydantic import BaseModel, Field, validator
+from typing import Optional, Dict, List
+from pydantic import BaseModel, Field, validator, root_validator
 from fastapi import UploadFile
 from bson import ObjectId
 
@@ -8,6 +8,17 @@ class Location(BaseModel):
     latitude: float
     longitude: float
 
+    @root_validator(pre=True)
+    def from_geojson(cls, values):
+        # Stored documents hold a GeoJSON point: {"type": "Point", "coordinates": [lon, lat]}
+        if isinstance(values, dict) and values.get("type") == "Point":
+            longitude, latitude = values["coordinates"][:2]
+            return {"latitude": latitude, "longitude": longitude}
+        return values
+
+    def to_geojson(self) -> Dict:
+        return {"type": "Point", "coordinates": [self.longitude, self.latitude]}
+
 class Operator(BaseModel):
     id: str
     name: str
@@ -27,6 +38,13 @@ class DrugTest(BaseModel):
     ocr_confidence: float = 0.0
     processing_status: str = "pending"  # pending, completed, failed
     processing_error: Optional[str] = None
+    derivatives: Dict[str, Dict[str, str]] = Field(default_factory=dict)  # kind -> size -> location
+    trace_id: Optional[str] = None  # see GET /api/drug-tests/{id}/trace
+
+    @validator('id', pre=True)
+    def validate_id(cls, v):
+        # Stored documents use ObjectId keys
+        return str(v) if isinstance(v, ObjectId) else v
 
     class Config:
         json_encoders = {ObjectId: str}
@@ -47,6 +65,24 @@ class MetadataUpdate(BaseModel):
             raise ValueError("Test timestamp cannot be in the future")
         return v
 
+class BulkMetadataItem(MetadataUpdate):
+    test_id: str
+
+class BulkMetadataUpdate(BaseModel):
+    items: List[BulkMetadataItem]
+    ordered: bool = False  # Stop at the first failed write instead of applying the rest
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(..., min_length=1, max_length=255)
+    size: int = Field(..., gt=0)
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")  # Checked at commit when given
+    person_id: str = Field(..., min_length=1)
+    operator_id: str = Field(..., min_length=1)
+    operator_name: str = Field(..., min_length=1)
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    priority: str = Field("interactive", pattern="^(interactive|batch)$")
+
 class TestSummary(BaseModel):
     date: str
     total: int
@@ -58,3 +94,15 @@ class TestSummary(BaseModel):
 
 
 
+
+class ReprocessRequest(BaseModel):
+    """Selection and pacing for a bulk OCR reprocessing run"""
+    processing_status: Optional[str] = Field(None, pattern="^(pending|completed|failed)$")
+    max_confidence: Optional[float] = Field(None, ge=0, le=100)
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    stale_only: bool = False  # only records processed under an older pipeline version
+    dry_run: bool = True
+    batch_size: int = Field(200, gt=0, le=5000)
+    rate_per_second: float = Field(5.0, gt=0)
+    job_id: Optional[str] = None  # resume an interrupted job
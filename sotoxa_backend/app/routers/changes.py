@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, status
+from ..models.user import UserRole, UserInDB
+from ..services.auth_service import AuthService
+from ..services.outbox_service import OutboxService
+from ..core.serialization import MongoJSONResponse
+from ..core.config import get_settings
+from typing import List, Optional, Dict
+
+settings = get_settings()
+
+router = APIRouter(prefix="/api/changes", tags=["changes"])
+
+@router.get("", response_model=Dict)
+async def read_changes(
+    token: Optional[str] = None,
+    limit: int = Query(100, gt=0, le=settings.OUTBOX_MAX_BATCH),
+    types: Optional[List[str]] = Query(None),
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """
+    Test change events in order: test.uploaded, test.ocr_completed,
+    test.ocr_failed, test.metadata_updated and test.archived. Store
+    next_token after processing a page and pass it back to continue; omit it
+    to replay everything still retained. 410 means the token has expired.
+    """
+    unknown = set(types or []) - set(OutboxService.EVENT_TYPES)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown event types: {', '.join(sorted(unknown))}"
+        )
+    try:
+        page = await OutboxService.read(token, limit, types)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    return MongoJSONResponse(page)
@@ -1,17 +1,30 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status, BackgroundTasks, Form, Query
-from ..models.drug_test import DrugTest, Location, Operator, MetadataUpdate, TestSummary
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, status, BackgroundTasks, Form, Query, Path, Request, Response, Header
+from ..models.drug_test import DrugTest, MetadataUpdate, BulkMetadataUpdate, TestSummary, ReprocessRequest
 from ..models.user import UserRole, UserInDB
 from ..services.auth_service import AuthService
 from ..services.upload_service import UploadService
-from ..services.ocr_service import OCRService
-from ..services.ocr_queue import OCRQueue
 from ..services.export_service import ExportService
+from ..services.reprocess_service import ReprocessService
+from ..services.image_service import ImageService
+from ..services.file_service import FileService
+from ..services.admission import AdmissionControl
+from ..services.metadata_service import MetadataService
+from ..services.outbox_service import OutboxService
+from ..services.geo_service import GeoService
+from ..services.search_service import SearchService
+from ..services.retention_service import RetentionService
+from ..services.watermark_service import WatermarkService
+from ..services.ingest_service import IngestService
+from ..services.idempotency_service import IdempotencyService
+from ..services.trace_service import TraceService
+from ..services.ocr_worker import OCRWorker
 from ..db.mongodb import db
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict
 from bson import ObjectId
 import pymongo
 from ..core.config import get_settings
+from ..core.serialization import MongoJSONResponse, api_locations, drug_test_response
 
 settings = get_settings()
 
@@ -24,12 +37,20 @@ async def upload_scan(
     person_id: str = Form(...),
     operator_id: str = Form(...),
     operator_name: str = Form(...),
-    lat: Optional[float] = Form(None),
-    lon: Optional[float] = Form(None),
+    lat: Optional[float] = Form(None, ge=-90, le=90),
+    lon: Optional[float] = Form(None, ge=-180, le=180),
+    priority: str = Form("interactive", pattern="^(interactive|batch)$"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    traceparent: Optional[str] = Header(None, max_length=55),
     current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR]))
 ):
     """
     Upload a drug test scan (JPEG, PNG, or PDF) and process it with OCR.
+    Bulk imports should pass priority=batch so roadside uploads stay responsive.
+    Clients on unreliable links should send an Idempotency-Key so retries are
+    answered with the original response; large files can use /uploads sessions.
+    The returned trace_id (or the client's W3C traceparent, when sent) follows
+    the scan through OCR; see /{test_id}/trace.
     """
     if not person_id:
         raise HTTPException(
@@ -57,40 +78,33 @@ async def upload_scan(
             detail=f"File validation error: {str(e)}"
         )
     
-    try:
-        # Save file
-        file_url, file_hash = await UploadService.save_file(file)
-        
-        # Create drug test entry
-        drug_test = DrugTest(
-            scan_file_url=file_url,
-            person_id=person_id,
-            location=Location(latitude=lat, longitude=lon) if lat and lon else None,
-            operator=Operator(id=operator_id, name=operator_name),
-            test_timestamp=datetime.utcnow(),
-            hash=file_hash
-        )
-        
-        # Save to database
-        result = await db.db["drug_tests"].insert_one(
-            drug_test.model_dump(by_alias=True)
+    if not idempotency_key:
+        document = await IngestService.create_test(
+            background_tasks, file, person_id, operator_id, operator_name, lat, lon, priority, current_user,
+            traceparent
         )
-        drug_test.id = str(result.inserted_id)
-        
-        # Queue OCR processing
-        await OCRQueue.process_in_background(
-            background_tasks,
-            file_url,
-            drug_test.id
-        )
-        
-        return drug_test
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to process upload: {str(e)}"
+        return drug_test_response(document, status_code=status.HTTP_201_CREATED)
+
+    # Retries with the same key get the original response instead of a second upload;
+    # the content hash is reused when the scan is stored, so it is only read once more
+    digest = await UploadService.hash_file(file)
+    fingerprint = IdempotencyService.fingerprint(
+        "upload", person_id, operator_id, operator_name, lat, lon, priority, file.filename, *digest
+    )
+    replay = await IdempotencyService.begin(current_user, idempotency_key, fingerprint)
+    if replay is not None:
+        return replay
+    try:
+        document = await IngestService.create_test(
+            background_tasks, file, person_id, operator_id, operator_name, lat, lon, priority, current_user,
+            traceparent, digest
         )
+    except BaseException:
+        await IdempotencyService.release(current_user, idempotency_key)
+        raise
+    response = drug_test_response(document, status_code=status.HTTP_201_CREATED)
+    await IdempotencyService.complete(current_user, idempotency_key, response)
+    return response
 
 @router.get("/results/{test_id}", response_model=DrugTest)
 async def get_test_result(
@@ -101,10 +115,16 @@ async def get_test_result(
     result = await db.db["drug_tests"].find_one({"_id": ObjectId(test_id)})
     if not result:
         raise HTTPException(status_code=404, detail="Test not found")
-    return result
+    if result.get("archived"):
+        # Stubs only keep summary fields; the full record lives in the archive
+        archived = await db.db[RetentionService.ARCHIVE_COLLECTION].find_one({"_id": result["_id"]})
+        if archived:
+            return drug_test_response(archived)
+    return drug_test_response(result)
 
 @router.get("/results", response_model=Dict)
 async def list_test_results(
+    request: Request,
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     operator: Optional[str] = None,
@@ -115,7 +135,14 @@ async def list_test_results(
     sort_order: int = Query(-1, ge=-1, le=1),
     current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
 ):
-    """List test results with filtering, pagination and sorting"""
+    """
+    List test results with filtering, pagination and sorting.
+    Send the previous ETag in If-None-Match to get a 304 when nothing changed.
+    """
+    etag = await WatermarkService.etag(request, "drug_tests")
+    if WatermarkService.matches(request, etag):
+        return WatermarkService.not_modified(etag)
+
     # Build query
     query = {}
     if date_from or date_to:
@@ -136,19 +163,22 @@ async def list_test_results(
     total_count = await db.db["drug_tests"].count_documents(query)
 
     # Execute query with pagination and sorting
-    cursor = db.db["drug_tests"].find(query)
+    cursor = db.db["drug_tests"].find(
+        query, {OutboxService.PENDING_FIELD: 0, **{field: 0 for field in OCRWorker.LEASE_FIELDS}}
+    )
     cursor.sort(sort_by, sort_order)
     cursor.skip(skip).limit(limit)
     
     results = await cursor.to_list(length=None)
 
-    return {
+    # Raw documents straight to JSON; no per-record model validation
+    return WatermarkService.tag(MongoJSONResponse({
         "total": total_count,
         "page": page,
         "limit": limit,
         "total_pages": (total_count + limit - 1) // limit,
-        "results": results
-    }
+        "results": api_locations(results)
+    }), etag)
 
 @router.get("/{test_id}/status", response_model=Dict[str, str])
 async def get_processing_status(test_id: str):
@@ -170,83 +200,245 @@ async def get_processing_status(test_id: str):
         
     return status_info
 
+@router.get("/{test_id}/trace", response_model=Dict)
+async def get_test_trace(
+    test_id: str,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """
+    Where a test's processing time went: the upload and every OCR job
+    (including reprocessing) as timed spans, e.g. ocr.pending,
+    ocr.queue_wait, ocr.preprocess, ocr.tesseract, ocr.attempt per retry
+    and db.update. Stage percentiles across tests are at /api/traces/stats.
+    """
+    trace = await TraceService.for_test(test_id)
+    if not trace["segments"]:
+        raise HTTPException(status_code=404, detail="No trace recorded for this test")
+    return MongoJSONResponse(trace)
+
 @router.post("/{test_id}/metadata", response_model=DrugTest)
 async def associate_metadata(
     test_id: str,
     metadata: MetadataUpdate,
+    background_tasks: BackgroundTasks,
     photo: Optional[UploadFile] = File(None)
 ):
     """
     Associate metadata with an existing drug test record.
     Optionally attach a photo of the person being tested.
     """
-    # Verify test exists
-    test = await db.db["drug_tests"].find_one({"_id": ObjectId(test_id)})
-    if not test:
-        raise HTTPException(status_code=404, detail="Test not found")
+    try:
+        object_id = ObjectId(test_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid test ID")
 
-    update_data = {}
+    update_data = MetadataService.build_update(metadata)
 
     # Process photo if provided
     if photo:
+        # Check the test exists before storing a photo for it
+        if not await db.db["drug_tests"].find_one({"_id": object_id}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Test not found")
         try:
             if not await UploadService.validate_file(photo):
                 raise HTTPException(
                     status_code=400,
                     detail="Invalid photo file. Must be JPG or PNG."
                 )
-            photo_url, _ = await UploadService.save_file(photo)
+            photo_url, photo_hash = await UploadService.save_file(photo)
             update_data["photo_url"] = photo_url
+            background_tasks.add_task(
+                ImageService.process_test_images,
+                test_id,
+                "photo",
+                photo_url,
+                photo_hash
+            )
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to process photo: {str(e)}"
             )
 
-    # Update metadata fields
-    if metadata.person_id:
-        update_data["person_id"] = metadata.person_id
-
-    if metadata.operator_id and metadata.operator_name:
-        update_data["operator"] = {
-            "id": metadata.operator_id,
-            "name": metadata.operator_name
-        }
-
-    if metadata.test_timestamp:
-        update_data["test_timestamp"] = metadata.test_timestamp
-
-    if metadata.latitude is not None and metadata.longitude is not None:
-        update_data["location"] = {
-            "latitude": metadata.latitude,
-            "longitude": metadata.longitude
-        }
-
-    # Update database
+    # Update database and return the updated record in one round trip
     try:
-        result = await db.db["drug_tests"].update_one(
-            {"_id": ObjectId(test_id)},
-            {"$set": update_data}
+        updated_test = await MetadataService.update_one(object_id, update_data)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Database error: {str(e)}"
         )
 
-        if result.modified_count == 0:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to update test metadata"
-            )
+    if not updated_test:
+        raise HTTPException(status_code=404, detail="Test not found")
+    return drug_test_response(updated_test)
 
-        # Return updated record
-        updated_test = await db.db["drug_tests"].find_one(
-            {"_id": ObjectId(test_id)}
+@router.post("/metadata/bulk", response_model=Dict)
+async def bulk_associate_metadata(
+    request: BulkMetadataUpdate,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR]))
+):
+    """
+    Apply metadata updates to many drug tests in one batched write.
+    Returns a per-item outcome in request order.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No items to update")
+    if len(request.items) > settings.METADATA_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.METADATA_BULK_MAX_ITEMS} items per request"
         )
-        return updated_test
 
+    try:
+        results = await MetadataService.bulk_update(request.items, request.ordered)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Database error: {str(e)}"
         )
 
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {"counts": counts, "results": results}
+
+@router.get("/{test_id}/files/{kind}")
+async def download_test_file(
+    request: Request,
+    test_id: str,
+    kind: str = Path(..., pattern="^(scan|photo)$"),
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """
+    Download the original scan or photo of a test.
+    Supports Range requests and conditional GET; files are content-addressed
+    and served with the content hash as ETag, revalidated on every use.
+    """
+    url_field = "scan_file_url" if kind == "scan" else "photo_url"
+    test = await db.db["drug_tests"].find_one({"_id": ObjectId(test_id)}, {url_field: 1, "archived": 1})
+    if test and test.get("archived"):
+        raise HTTPException(status_code=410, detail="Test is archived; its files are in cold storage")
+    if not test or not test.get(url_field):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    location = test[url_field]
+    extension = location.rsplit(".", 1)[-1].lower()
+    return await FileService.serve(
+        request,
+        location,
+        UploadService.MIME_TYPES.get(extension, "application/octet-stream"),
+        filename=f"{test_id}-{kind}.{extension}"
+    )
+
+@router.get("/{test_id}/images/{kind}")
+async def get_test_image(
+    request: Request,
+    test_id: str,
+    kind: str = Path(..., pattern="^(scan|photo)$"),
+    size: str = Query("thumb", pattern="^(thumb|normalized|original)$"),
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """
+    Get a test's scan or photo. Defaults to the thumbnail for list views;
+    falls back to the original while derivatives are still being generated.
+    """
+    url_field = "scan_file_url" if kind == "scan" else "photo_url"
+    test = await db.db["drug_tests"].find_one(
+        {"_id": ObjectId(test_id)},
+        {url_field: 1, f"derivatives.{kind}": 1, "archived": 1}
+    )
+    if test and test.get("archived"):
+        raise HTTPException(status_code=410, detail="Test is archived; its images are in cold storage")
+    if not test or not test.get(url_field):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    location = test.get("derivatives", {}).get(kind, {}).get(size)
+    if location:
+        return await FileService.serve(request, location, ImageService.media_type())
+
+    location = test[url_field]
+    extension = location.rsplit(".", 1)[-1].lower()
+    return await FileService.serve(
+        request,
+        location,
+        UploadService.MIME_TYPES.get(extension, "application/octet-stream")
+    )
+
+# Search and geo endpoints
+@router.get("/search", response_model=Dict)
+async def search_test_results(
+    q: str = Query(..., min_length=1, max_length=200),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    processing_status: Optional[str] = None,
+    page: int = Query(1, gt=0),
+    limit: int = Query(20, gt=0, le=100),
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """
+    Full-text search over OCR text, person ID and operator, best match first.
+    Supports quoted phrases and -negated terms; results carry a snippet with
+    highlight offsets.
+    """
+    try:
+        return MongoJSONResponse(await SearchService.search(q, page, limit, date_from, date_to, processing_status))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/geo/near", response_model=Dict)
+async def find_tests_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(1000, gt=0, le=500000),
+    limit: int = Query(100, gt=0),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    processing_status: Optional[str] = None,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """Tests within radius_m metres of a point, nearest first"""
+    query = GeoService.filters(date_from, date_to, processing_status)
+    results = await GeoService.near(lat, lon, radius_m, min(limit, settings.GEO_MAX_RESULTS), query)
+    return MongoJSONResponse({"count": len(results), "results": api_locations(results)})
+
+@router.get("/geo/within", response_model=Dict)
+async def find_tests_within(
+    west: float = Query(..., ge=-180, le=180),
+    south: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    limit: int = Query(100, gt=0),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    processing_status: Optional[str] = None,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """Tests inside a bounding box, newest first"""
+    query = GeoService.filters(date_from, date_to, processing_status)
+    try:
+        results = await GeoService.within(west, south, east, north, min(limit, settings.GEO_MAX_RESULTS), query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return MongoJSONResponse({"count": len(results), "results": api_locations(results)})
+
+@router.get("/geo/tiles/{z}/{x}/{y}", response_model=Dict)
+async def get_map_tile_clusters(
+    z: int = Path(..., ge=0, le=22),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    processing_status: Optional[str] = None,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """Clustered test counts for one Web Mercator map tile"""
+    query = GeoService.filters(date_from, date_to, processing_status)
+    try:
+        return await GeoService.tile_clusters(z, x, y, query)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 # Dashboard endpoints
 @router.get("/dashboard/summary", response_model=Dict[str, List[TestSummary]])
 async def get_dashboard_summary(
@@ -300,7 +492,7 @@ async def get_dashboard_summary(
         {"$sort": {"_id": 1}}
     ]
 
-    results = await db.db["drug_tests"].aggregate(pipeline).to_list(length=None)
+    results = await db.collection("drug_tests", "analytics").aggregate(pipeline).to_list(length=None)
     
     # Add drug type statistics if available
     drug_stats = await get_drug_type_stats(start_date)
@@ -312,12 +504,18 @@ async def get_dashboard_summary(
 
 @router.get("/dashboard/export")
 async def export_results(
+    request: Request,
     format: str = Query("csv", regex="^(csv|excel)$"),
     date_from: Optional[datetime] = None,
     date_to: Optional[datetime] = None,
     current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN]))
 ):
     """Export test results in CSV or Excel format"""
+    # Revalidate before taking an export slot: unchanged data needs no re-render
+    etag = await WatermarkService.etag(request, "drug_tests")
+    if WatermarkService.matches(request, etag):
+        return WatermarkService.not_modified(etag)
+
     # Build query
     query = {}
     if date_from or date_to:
@@ -327,26 +525,59 @@ async def export_results(
         if date_to:
             query["test_timestamp"]["$lte"] = date_to
 
-    # Get results
-    results = await db.db["drug_tests"].find(query).to_list(length=None)
-    
-    # Generate export file
-    if format == "csv":
-        content = await ExportService.generate_csv(results)
-        media_type = "text/csv"
-        filename = f"drug_tests_export_{datetime.now().strftime('%Y%m%d')}.csv"
-    else:
-        content = await ExportService.generate_excel(results)
-        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        filename = f"drug_tests_export_{datetime.now().strftime('%Y%m%d')}.xlsx"
-
-    return Response(
+    # Exports load and render whole result sets, so only a few may run at once
+    async with AdmissionControl.slot("export", current_user):
+        # Get results
+        results = await db.collection("drug_tests", "analytics").find(query).to_list(length=None)
+        
+        # Generate export file
+        if format == "csv":
+            content = await ExportService.generate_csv(results)
+            media_type = "text/csv"
+            filename = f"drug_tests_export_{datetime.now().strftime('%Y%m%d')}.csv"
+        else:
+            content = await ExportService.generate_excel(results)
+            media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            filename = f"drug_tests_export_{datetime.now().strftime('%Y%m%d')}.xlsx"
+
+    return WatermarkService.tag(Response(
         content=content,
         media_type=media_type,
         headers={
             'Content-Disposition': f'attachment; filename="{filename}"'
         }
-    )
+    ), etag)
+
+@router.post("/reprocess", status_code=status.HTTP_202_ACCEPTED, response_model=Dict)
+async def start_reprocessing(
+    request: ReprocessRequest,
+    background_tasks: BackgroundTasks,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN]))
+):
+    """
+    Re-run OCR over stored tests matching the filters.
+    Defaults to a dry run that only reports what would change; pass job_id to resume.
+    """
+    try:
+        job = await ReprocessService.start(request)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    if job["status"] != "completed":
+        background_tasks.add_task(ReprocessService.run, job["_id"])
+
+    return {"job_id": job["_id"], "status": job["status"], "dry_run": job["params"]["dry_run"]}
+
+@router.get("/reprocess/{job_id}", response_model=Dict)
+async def get_reprocessing_job(
+    job_id: str,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN]))
+):
+    """Get progress and the diff report of a reprocessing job"""
+    job = await ReprocessService.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Reprocess job not found")
+    return MongoJSONResponse(job)
 
 async def get_drug_type_stats(start_date: datetime) -> Dict:
     """Get statistics grouped by drug type"""
@@ -369,6 +600,6 @@ async def get_drug_type_stats(start_date: datetime) -> Dict:
         }
     ]
     
-    return await db.db["drug_tests"].aggregate(pipeline).to_list(length=None)
+    return await db.collection("drug_tests", "analytics").aggregate(pipeline).to_list(length=None)
 
 
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from ..models.user import UserRole, UserInDB
+from ..services.auth_service import AuthService
+from ..services.person_service import PersonService
+from ..core.serialization import MongoJSONResponse
+from typing import Optional, Dict
+
+router = APIRouter(prefix="/api/persons", tags=["persons"])
+
+@router.get("/{person_id}/history", response_model=Dict)
+async def get_person_history(
+    person_id: str,
+    limit: int = Query(20, gt=0, le=100),
+    cursor: Optional[str] = None,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """
+    A person's test timeline, newest first, with their result summary.
+    Pass next_cursor from the previous page to continue.
+    """
+    try:
+        return MongoJSONResponse(await PersonService.history(person_id, limit, cursor))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from ..models.user import UserRole, UserInDB
+from ..services.auth_service import AuthService
+from ..services.trace_service import TraceService
+from ..core.serialization import MongoJSONResponse
+from typing import List, Optional, Dict
+
+router = APIRouter(prefix="/api/traces", tags=["traces"])
+
+@router.get("/stats", response_model=Dict)
+async def trace_stats(
+    minutes: int = Query(60, gt=0, le=7 * 24 * 60),
+    names: Optional[List[str]] = Query(None),
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN]))
+):
+    """
+    Duration percentiles (p50/p90/p95/p99, ms) per span name over traces
+    stored in the last `minutes`, e.g. how ocr.pending, ocr.queue_wait,
+    ocr.tesseract and db.update contribute to time-to-completed.
+    """
+    return MongoJSONResponse(await TraceService.stats(minutes, names))
+
+@router.get("/{trace_id}", response_model=Dict)
+async def read_trace(
+    trace_id: str,
+    current_user: UserInDB = Depends(AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR, UserRole.VIEWER]))
+):
+    """All stored segments of one trace, oldest first"""
+    segments = await TraceService.for_trace(trace_id)
+    if not segments:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return MongoJSONResponse({"trace_id": trace_id, "segments": segments})
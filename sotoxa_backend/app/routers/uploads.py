@@ -0,0 +1,139 @@
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, BackgroundTasks, UploadFile, status
+from ..models.drug_test import UploadSessionCreate
+from ..models.user import UserRole, UserInDB
+from ..services.auth_service import AuthService
+from ..services.upload_session_service import UploadSessionService
+from ..services.idempotency_service import IdempotencyService
+from ..services.ingest_service import IngestService
+from ..db.mongodb import db
+from ..core.serialization import MongoJSONResponse, drug_test_response
+from typing import Dict, Optional
+
+router = APIRouter(prefix="/api/drug-tests/uploads", tags=["uploads"])
+
+uploader = AuthService.check_permissions([UserRole.ADMIN, UserRole.OPERATOR])
+
+
+def session_state(session: Dict) -> MongoJSONResponse:
+    return MongoJSONResponse(
+        {
+            "_id": session["_id"],
+            "filename": session["filename"],
+            "size": session["size"],
+            "received": session["received"],
+            "status": session["status"],
+            "expires_at": session["expires_at"],
+            "test_id": session.get("test_id"),
+        },
+        headers={"Upload-Offset": str(session["received"]), "Upload-Length": str(session["size"])}
+    )
+
+
+@router.post("", status_code=status.HTTP_201_CREATED, response_model=Dict)
+async def create_upload_session(
+    data: UploadSessionCreate,
+    current_user: UserInDB = Depends(uploader)
+):
+    """
+    Start a resumable upload. Send the file with PUT /{session_id}/chunks in
+    one or more pieces, then POST /{session_id}/commit to create the test.
+    """
+    session = await UploadSessionService.create(data.model_dump(), current_user)
+    response = session_state(session)
+    response.status_code = status.HTTP_201_CREATED
+    return response
+
+
+@router.get("/{session_id}", response_model=Dict)
+async def get_upload_session(session_id: str, current_user: UserInDB = Depends(uploader)):
+    """Session progress; after a dropped connection, resume from Upload-Offset"""
+    return session_state(await UploadSessionService.get(session_id, current_user))
+
+
+@router.head("/{session_id}")
+async def head_upload_session(session_id: str, current_user: UserInDB = Depends(uploader)):
+    session = await UploadSessionService.get(session_id, current_user)
+    return Response(headers={"Upload-Offset": str(session["received"]), "Upload-Length": str(session["size"])})
+
+
+@router.put("/{session_id}/chunks", response_model=Dict)
+async def upload_chunk(
+    session_id: str,
+    request: Request,
+    upload_offset: Optional[int] = Header(None, alias="Upload-Offset", ge=0),
+    offset: Optional[int] = Query(None, ge=0),
+    current_user: UserInDB = Depends(uploader)
+):
+    """
+    Append the raw request body at the given offset (Upload-Offset header or
+    ?offset=), which must equal the bytes received so far; otherwise 409
+    with the current Upload-Offset.
+    """
+    chunk_offset = upload_offset if upload_offset is not None else offset
+    if chunk_offset is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload-Offset is required")
+    session = await UploadSessionService.get(session_id, current_user)
+    session = await UploadSessionService.write_chunk(session, chunk_offset, request.stream())
+    return session_state(session)
+
+
+@router.post("/{session_id}/commit", status_code=status.HTTP_201_CREATED, response_model=Dict)
+async def commit_upload_session(
+    session_id: str,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    traceparent: Optional[str] = Header(None, max_length=55),
+    current_user: UserInDB = Depends(uploader)
+):
+    """Create the drug test from a fully received session; repeating a commit returns the same test"""
+    session = await UploadSessionService.get(session_id, current_user)
+    if session["status"] == "committed":
+        document = await db.db["drug_tests"].find_one({"_id": session["test_id"]})
+        if document is None:
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail="Committed test no longer exists")
+        return drug_test_response(document)
+
+    if idempotency_key:
+        fingerprint = IdempotencyService.fingerprint("commit", session_id)
+        replay = await IdempotencyService.begin(current_user, idempotency_key, fingerprint)
+        if replay is not None:
+            return replay
+
+    session = await UploadSessionService.claim_commit(session)
+    try:
+        await UploadSessionService.verify(session)
+        with await UploadSessionService.open_file(session) as f:
+            file = UploadFile(file=f, filename=session["filename"], size=session["size"])
+            document = await IngestService.create_test(
+                background_tasks,
+                file,
+                session["person_id"],
+                session["operator_id"],
+                session["operator_name"],
+                session.get("lat"),
+                session.get("lon"),
+                session["priority"],
+                current_user,
+                traceparent
+            )
+    except BaseException:
+        await UploadSessionService.release_commit(session)
+        if idempotency_key:
+            await IdempotencyService.release(current_user, idempotency_key)
+        raise
+    await UploadSessionService.mark_committed(session, document["_id"])
+
+    response = drug_test_response(document, status_code=status.HTTP_201_CREATED)
+    if idempotency_key:
+        await IdempotencyService.complete(current_user, idempotency_key, response)
+    return response
+
+
+@router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(session_id: str, current_user: UserInDB = Depends(uploader)):
+    """Abandon an upload and discard the received bytes"""
+    session = await UploadSessionService.get(session_id, current_user)
+    if session["status"] != "open":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload session is {session['status']}")
+    await UploadSessionService.abort(session)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,25 +1,22 @@
+import sys
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
-from ..core.config import get_settings
+from ..db.mongodb import db as mongodb
+from ..db.indexes import ensure_indexes
 
 async def init_db():
-    settings = get_settings()
+    # Connect to MongoDB through the shared, pool-configured client
+    await mongodb.connect_to_database(warm_up=False)
+    client = mongodb.client
+    db = mongodb.db
     
-    # Connect to MongoDB
-    client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db = client[settings.MONGODB_DB_NAME]
-    
-    # Create indexes
-    await db.drug_tests.create_index("person_id")
-    await db.drug_tests.create_index("operator.id")
-    await db.drug_tests.create_index("test_timestamp")
-    await db.drug_tests.create_index("hash", unique=True)
-    
-    # Create indexes for users collection
-    await db.users.create_index("username", unique=True)
-    await db.users.create_index("email", unique=True)
-    
-    print("Database initialization completed successfully!")
+    failures = await ensure_indexes(db)
+    for failure in failures:
+        print(f"Failed to create {failure}")
+
+    if failures:
+        print(f"Database initialization incomplete: {len(failures)} index(es) missing")
+    else:
+        print("Database initialization completed successfully!")
     
     # Test connection
     try:
@@ -28,7 +25,9 @@ async def init_db():
     except Exception as e:
         print(f"Failed to connect to MongoDB: {e}")
     finally:
-        client.close()
+        await mongodb.close_database_connection()
+    return not failures
 
 if __name__ == "__main__":
-    asyncio.run(init_db())
+    if not asyncio.run(init_db()):
+        sys.exit(1)
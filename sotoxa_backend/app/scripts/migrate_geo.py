@@ -0,0 +1,60 @@
+import asyncio
+import argparse
+from pymongo import UpdateOne
+from ..db.mongodb import db
+from ..services.watermark_service import WatermarkService
+
+# Locations written before GeoJSON storage: {"latitude": ..., "longitude": ...}
+LEGACY_QUERY = {"location.latitude": {"$exists": True}}
+
+async def migrate_geo(dry_run: bool = False, batch_size: int = 500):
+    await db.connect_to_database(warm_up=False)
+    collection = db.collection("drug_tests", "metadata")
+
+    converted = 0
+    skipped = 0
+    last_id = None
+    try:
+        while True:
+            query = dict(LEGACY_QUERY)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            records = await collection.find(query, {"location": 1}) \
+                .sort("_id", 1).limit(batch_size).to_list(length=None)
+            if not records:
+                break
+            last_id = records[-1]["_id"]
+
+            updates = []
+            for record in records:
+                latitude = record["location"].get("latitude")
+                longitude = record["location"].get("longitude")
+                if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                    # The 2dsphere index rejects these; drop the location instead
+                    updates.append(UpdateOne({"_id": record["_id"]}, {"$unset": {"location": ""}}))
+                    skipped += 1
+                    continue
+                updates.append(UpdateOne(
+                    {"_id": record["_id"]},
+                    {"$set": {"location": {"type": "Point", "coordinates": [longitude, latitude]}}}
+                ))
+                converted += 1
+
+            if not dry_run:
+                await collection.bulk_write(updates, ordered=False)
+
+        if not dry_run:
+            await db.db.drug_tests.create_index([("location", "2dsphere")])
+            await WatermarkService.bump("drug_tests")
+    finally:
+        await db.close_database_connection()
+
+    verb = "Would convert" if dry_run else "Converted"
+    print(f"{verb} {converted} locations to GeoJSON; {skipped} invalid locations {'would be' if dry_run else 'were'} removed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert drug test locations to GeoJSON points and build the 2dsphere index")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(migrate_geo(args.dry_run, args.batch_size))
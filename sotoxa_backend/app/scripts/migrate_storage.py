@@ -0,0 +1,98 @@
+import os
+import re
+import asyncio
+import shutil
+import argparse
+from pymongo import UpdateMany, UpdateOne
+from ..core.config import get_settings
+from ..db.mongodb import db
+from ..services.storage import get_storage, LocalStorage
+from ..services.watermark_service import WatermarkService
+
+# Blobs written by the old flat layout: UPLOAD_DIR/<sha256>.<ext>
+FLAT_BLOB = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+DEBUG_SUFFIX = "_processed.jpg"
+
+async def _place(storage, filename: str, old_path: str) -> str:
+    """Put a flat blob at its new location; the flat file stays until its record points there"""
+    if isinstance(storage, LocalStorage):
+        new_path = storage.location(filename)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        try:
+            os.link(old_path, new_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copy2(old_path, new_path)
+        return new_path
+
+    async def chunks():
+        with open(old_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                yield chunk
+
+    return await storage.save(filename, chunks())
+
+async def _flush(updates: list, moved_paths: list):
+    """Repoint the records, then remove the flat files they no longer reference"""
+    if updates:
+        await db.collection("drug_tests", "metadata").bulk_write(updates, ordered=False)
+    for old_path in moved_paths:
+        os.remove(old_path)
+
+async def migrate_storage(dry_run: bool = False, batch_size: int = 500):
+    settings = get_settings()
+    storage = get_storage()
+    await db.connect_to_database(warm_up=False)
+
+    moved = 0
+    updates = []
+    moved_paths = []
+    try:
+        for entry in os.scandir(settings.UPLOAD_DIR):
+            if not entry.is_file() or not FLAT_BLOB.match(entry.name):
+                continue
+
+            old_path = os.path.join(settings.UPLOAD_DIR, entry.name)
+            if dry_run:
+                print(f"{old_path} -> {storage.location(entry.name)}")
+                moved += 1
+                continue
+
+            new_location = await _place(storage, entry.name, old_path)
+            moved += 1
+
+            # Keep the OCR debug image next to its scan on local storage, drop it otherwise
+            debug_path = old_path + DEBUG_SUFFIX
+            if os.path.exists(debug_path):
+                if isinstance(storage, LocalStorage):
+                    os.replace(debug_path, new_location + DEBUG_SUFFIX)
+                else:
+                    os.remove(debug_path)
+
+            # A scan is named after its content hash, so its record is found through the
+            # unique hash index; photos are shared between tests and matched on photo_url
+            file_hash = entry.name.split(".")[0]
+            updates.append(UpdateOne(
+                {"hash": file_hash, "scan_file_url": old_path}, {"$set": {"scan_file_url": new_location}}
+            ))
+            updates.append(UpdateMany({"photo_url": old_path}, {"$set": {"photo_url": new_location}}))
+            moved_paths.append(old_path)
+            if len(moved_paths) >= batch_size:
+                await _flush(updates, moved_paths)
+                updates, moved_paths = [], []
+
+        await _flush(updates, moved_paths)
+        if moved and not dry_run:
+            await WatermarkService.bump("drug_tests")
+    finally:
+        await db.close_database_connection()
+
+    print(f"{'Would move' if dry_run else 'Moved'} {moved} files into the {type(storage).__name__} layout")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move flat UPLOAD_DIR files into the configured storage layout")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(migrate_storage(args.dry_run, args.batch_size))
@@ -0,0 +1,34 @@
+import signal
+import asyncio
+import argparse
+from ..db.mongodb import db
+from ..services.ocr_worker import OCRWorker
+from ..services.ocr_scheduler import OCRScheduler
+from ..services.trace_service import TraceService
+from ..core import tracing
+from ..core.log import setup_logging, shutdown_logging
+
+async def run_worker(concurrency: int):
+    setup_logging()
+    await db.connect_to_database()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+    try:
+        await OCRWorker.run(stop, concurrency)
+    finally:
+        OCRScheduler.shutdown()
+        await TraceService.flush()
+        tracing.shutdown_exporter()
+        await db.close_database_connection()
+        shutdown_logging()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process pending OCR jobs stored by API-role workers")
+    parser.add_argument("--concurrency", type=int, default=0, help="Parallel jobs, default OCR_WORKERS or one per core")
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.concurrency))
@@ -0,0 +1,42 @@
+import json
+import asyncio
+import argparse
+from datetime import datetime
+from ..db.mongodb import db
+from ..models.drug_test import ReprocessRequest
+from ..services.reprocess_service import ReprocessService
+
+async def reprocess(request: ReprocessRequest):
+    await db.connect_to_database()
+    try:
+        job = await ReprocessService.start(request)
+        print(f"Reprocess job {job['_id']} ({'dry run' if job['params']['dry_run'] else 'writing updates'})")
+        job = await ReprocessService.run(job["_id"])
+        print(json.dumps(job, indent=2, default=str))
+    finally:
+        await db.close_database_connection()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run OCR over stored drug tests")
+    parser.add_argument("--status", choices=["pending", "completed", "failed"])
+    parser.add_argument("--max-confidence", type=float)
+    parser.add_argument("--date-from", type=datetime.fromisoformat)
+    parser.add_argument("--date-to", type=datetime.fromisoformat)
+    parser.add_argument("--stale-only", action="store_true", help="only records from an older OCR pipeline version")
+    parser.add_argument("--apply", action="store_true", help="write updates (default is a dry run)")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=5.0, help="records per second")
+    parser.add_argument("--resume", metavar="JOB_ID", help="continue an interrupted job")
+    args = parser.parse_args()
+
+    asyncio.run(reprocess(ReprocessRequest(
+        processing_status=args.status,
+        max_confidence=args.max_confidence,
+        date_from=args.date_from,
+        date_to=args.date_to,
+        stale_only=args.stale_only,
+        dry_run=not args.apply,
+        batch_size=args.batch_size,
+        rate_per_second=args.rate,
+        job_id=args.resume
+    )))
@@ -0,0 +1,30 @@
+import asyncio
+import argparse
+from ..db.mongodb import db
+from ..services.retention_service import RetentionService
+from ..services.upload_session_service import UploadSessionService
+
+async def run_retention(dry_run: bool, batch_size: int, max_batches: int, sweep_debug: bool):
+    await db.connect_to_database(warm_up=False)
+    try:
+        totals = await RetentionService.archive(dry_run, batch_size, max_batches)
+        sessions = await UploadSessionService.purge_expired(dry_run)
+    finally:
+        await db.close_database_connection()
+
+    verb = "Would archive" if dry_run else "Archived"
+    print(f"{verb} {totals['archived']} tests in {totals['batches']} batches ({totals['failed']} failed)")
+    print(f"{'Would remove' if dry_run else 'Removed'} {sessions} expired upload sessions")
+
+    if sweep_debug:
+        removed = RetentionService.sweep_debug_files(dry_run)
+        print(f"{'Would remove' if dry_run else 'Removed'} {removed} OCR debug images")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive drug tests past their retention period")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=None, help="Defaults to RETENTION_BATCH_SIZE")
+    parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches")
+    parser.add_argument("--no-debug-sweep", action="store_true", help="Keep OCR _processed.jpg debug images")
+    args = parser.parse_args()
+    asyncio.run(run_retention(args.dry_run, args.batch_size, args.max_batches, not args.no_debug_sweep))
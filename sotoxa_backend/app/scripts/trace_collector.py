@@ -0,0 +1,63 @@
+import sys
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for an OpenTelemetry collector's OTLP/HTTP JSON receiver.
+# Point TRACING_OTLP_ENDPOINT at http://localhost:4318/v1/traces to see
+# exported spans without running a real collector.
+
+def span_lines(payload: dict):
+    for resource_spans in payload.get("resourceSpans", []):
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                duration_ms = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e6
+                error = " ERROR" if span.get("status", {}).get("code") == 2 else ""
+                yield f"{span['traceId']} {span['spanId']} {span['name']:<22} {duration_ms:10.1f} ms{error}"
+
+
+def make_handler(output):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/v1/traces":
+                self.send_error(404)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                self.send_error(400, "Only OTLP/HTTP JSON is supported")
+                return
+            for line in span_lines(payload):
+                print(line, flush=True)
+            if output:
+                output.write(json.dumps(payload) + "\n")
+                output.flush()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print spans received over OTLP/HTTP JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", help="Also append each received payload to this JSONL file")
+    args = parser.parse_args()
+    output = open(args.output, "a") if args.output else None
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(output))
+    print(f"Collecting traces on http://{args.host}:{args.port}/v1/traces", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if output:
+            output.close()
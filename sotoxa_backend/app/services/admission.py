@@ -0,0 +1,84 @@
+import math
+from contextlib import asynccontextmanager
+from typing import Dict
+from fastapi import HTTPException, status
+from ..core.config import get_settings
+from ..core.metrics import ADMISSION_IN_FLIGHT, ADMISSION_REJECTED
+from ..models.user import UserInDB
+
+settings = get_settings()
+
+
+class AdmissionControl:
+    """
+    Non-blocking concurrency limits per route class. Requests over a user's
+    per-role limit get 429; requests over the route's global capacity get 503.
+    Both carry Retry-After so clients back off instead of piling on.
+    Counters are per process, so limits apply per worker.
+    """
+    _in_flight: Dict[str, int] = {}
+    _per_user: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _limits(route_class: str) -> Dict[str, int]:
+        return settings.ADMISSION_LIMITS.get(route_class, {})
+
+    @staticmethod
+    def reject(route_class: str, status_code: int, detail: str, retry_after: int):
+        ADMISSION_REJECTED.inc(route=route_class, status=status_code)
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    @staticmethod
+    def acquire(route_class: str, user: UserInDB):
+        limits = AdmissionControl._limits(route_class)
+        in_flight = AdmissionControl._in_flight.get(route_class, 0)
+        per_user = AdmissionControl._per_user.setdefault(route_class, {})
+
+        role = user.role.value if hasattr(user.role, "value") else str(user.role)
+        user_limit = limits.get(role, limits.get("default"))
+        if user_limit is not None and per_user.get(user.username, 0) >= user_limit:
+            AdmissionControl.reject(
+                route_class,
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                f"Too many concurrent {route_class} requests for this user (limit {user_limit})",
+                settings.ADMISSION_RETRY_AFTER
+            )
+
+        global_limit = limits.get("global")
+        if global_limit is not None and in_flight >= global_limit:
+            AdmissionControl.reject(
+                route_class,
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                f"Server is at {route_class} capacity, retry later",
+                settings.ADMISSION_RETRY_AFTER
+            )
+
+        AdmissionControl._in_flight[route_class] = in_flight + 1
+        per_user[user.username] = per_user.get(user.username, 0) + 1
+        ADMISSION_IN_FLIGHT.set(in_flight + 1, route=route_class)
+
+    @staticmethod
+    def release(route_class: str, user: UserInDB):
+        in_flight = AdmissionControl._in_flight.get(route_class, 1) - 1
+        AdmissionControl._in_flight[route_class] = in_flight
+        per_user = AdmissionControl._per_user.setdefault(route_class, {})
+        remaining = per_user.get(user.username, 1) - 1
+        if remaining > 0:
+            per_user[user.username] = remaining
+        else:
+            per_user.pop(user.username, None)
+        ADMISSION_IN_FLIGHT.set(in_flight, route=route_class)
+
+    @staticmethod
+    @asynccontextmanager
+    async def slot(route_class: str, user: UserInDB):
+        """Hold one admission slot for the duration of the block"""
+        AdmissionControl.acquire(route_class, user)
+        try:
+            yield
+        finally:
+            AdmissionControl.release(route_class, user)
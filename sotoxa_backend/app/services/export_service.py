@@ -1,10 +1,19 @@
 import csv
 import io
-import xlsxwriter
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 
 class ExportService:
+    @staticmethod
+    def _format_location(location: Optional[Dict]) -> str:
+        """Render a stored location as "lat, lon"; handles GeoJSON and pre-migration shapes"""
+        if not location:
+            return "N/A"
+        if location.get("type") == "Point":
+            longitude, latitude = location["coordinates"][:2]
+            return f"{latitude}, {longitude}"
+        return f"{location['latitude']}, {location['longitude']}"
+
     @staticmethod
     async def generate_csv(results: List[Dict]) -> bytes:
         output = io.StringIO()
@@ -26,7 +35,7 @@ class ExportService:
                 result["test_timestamp"].strftime("%Y-%m-%d %H:%M:%S"),
                 result["processing_status"],
                 f"{result['ocr_confidence']:.2f}%",
-                f"{result['location']['latitude']}, {result['location']['longitude']}" if result.get('location') else "N/A",
+                ExportService._format_location(result.get("location")),
                 ", ".join(result["ocr_data"].keys()),
                 ", ".join(f"{k}: {v}" for k, v in result["ocr_data"].items())
             ]
@@ -36,6 +45,7 @@ class ExportService:
 
     @staticmethod
     async def generate_excel(results: List[Dict]) -> bytes:
+        import xlsxwriter
         output = io.BytesIO()
         workbook = None
         try:
@@ -71,8 +81,7 @@ class ExportService:
                     result["test_timestamp"],
                     result["processing_status"],
                     f"{result['ocr_confidence']:.2f}%",
-                    f"{result['location']['latitude']}, {result['location']['longitude']}" 
-                    if result.get('location') else "N/A",
+                    ExportService._format_location(result.get("location")),
                     ", ".join(result["ocr_data"].keys()),
                     ", ".join(f"{k}: {v}" for k, v in result["ocr_data"].items())
                 ]
@@ -0,0 +1,115 @@
+import os
+import re
+from typing import Optional, Tuple
+import aiofiles
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from .storage import get_storage, CHUNK_SIZE
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class FileService:
+    """
+    Serves stored blobs. Blob keys are content hashes, so the hash is a
+    strong ETag. Routes address blobs by test ID, and a test's photo or
+    derivative can be replaced, so clients must revalidate: an unchanged
+    blob costs a 304.
+    """
+    REVALIDATE = "private, no-cache"
+
+    @staticmethod
+    def etag_for(location: str) -> str:
+        filename = location.rsplit("/", 1)[-1]
+        return f'"{filename.split(".", 1)[0]}"'
+
+    @staticmethod
+    def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+        """
+        Parse a single "bytes=start-end" range into inclusive offsets.
+        Returns None for headers we choose to ignore (multiple ranges, other
+        units), which means sending the whole file; raises ValueError when
+        the range cannot be satisfied.
+        """
+        match = RANGE_PATTERN.match(header.strip())
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            # Suffix range: the final N bytes
+            length = int(last)
+            if length == 0:
+                raise ValueError("empty suffix range")
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            raise ValueError("range not satisfiable")
+        return start, end
+
+    @staticmethod
+    async def _iter_file(path: str, start: int, end: int):
+        async with aiofiles.open(path, "rb") as in_file:
+            await in_file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await in_file.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    @staticmethod
+    async def serve(request: Request, location: str, media_type: str,
+                    cache_control: str = REVALIDATE, filename: Optional[str] = None) -> Response:
+        etag = FileService.etag_for(location)
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+        if filename:
+            headers["Content-Disposition"] = f'inline; filename="{filename}"'
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or
+                              etag in [tag.strip() for tag in if_none_match.split(",")]):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        storage = get_storage()
+        path = storage.filesystem_path(location)
+        if path is None:
+            # Remote object store: let the client fetch (and range) it directly
+            url = await storage.presigned_url(location)
+            if url:
+                return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+                                        headers={"Cache-Control": "private, no-store"})
+            return StreamingResponse(storage.open(location), media_type=media_type, headers=headers)
+
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        size = stat_result.st_size
+
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if range_header and (not if_range or if_range.strip() == etag):
+            try:
+                byte_range = FileService.parse_range(range_header, size)
+            except ValueError:
+                return Response(
+                    status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    headers={**headers, "Content-Range": f"bytes */{size}"}
+                )
+            if byte_range:
+                start, end = byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+                headers["Content-Length"] = str(end - start + 1)
+                return StreamingResponse(
+                    FileService._iter_file(path, start, end),
+                    status_code=status.HTTP_206_PARTIAL_CONTENT,
+                    media_type=media_type,
+                    headers=headers
+                )
+
+        # Whole file: FileResponse uses sendfile where the server supports it
+        return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
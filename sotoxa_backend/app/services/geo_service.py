@@ -0,0 +1,170 @@
+import math
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from ..db.mongodb import db
+from ..core.config import get_settings
+
+settings = get_settings()
+
+# Lets $geoWithin accept polygons larger than a hemisphere (low zoom tiles);
+# the ring must then be counter-clockwise around the area it encloses
+STRICT_WINDING_CRS = {
+    "type": "name",
+    "properties": {"name": "urn:x-mongodb:crs:strictwinding:EPSG:4326"}
+}
+
+
+class GeoService:
+    """
+    Location queries over drug_tests.location, stored as GeoJSON points
+    under a 2dsphere index.
+    """
+    PROJECTION = {
+        "person_id": 1,
+        "test_timestamp": 1,
+        "processing_status": 1,
+        "location": 1,
+        "operator.name": 1,
+    }
+    # Densify box edges so geodesic segments stay close to lines of latitude
+    EDGE_STEP_DEGREES = 1.0
+
+    @staticmethod
+    def filters(date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                processing_status: Optional[str] = None) -> Dict:
+        query = {}
+        if date_from or date_to:
+            query["test_timestamp"] = {}
+            if date_from:
+                query["test_timestamp"]["$gte"] = date_from
+            if date_to:
+                query["test_timestamp"]["$lte"] = date_to
+        if processing_status:
+            query["processing_status"] = processing_status
+        return query
+
+    @staticmethod
+    def _edge(start: Tuple[float, float], end: Tuple[float, float]) -> List[List[float]]:
+        """Points from start up to (not including) end, at most EDGE_STEP_DEGREES apart"""
+        steps = max(1, math.ceil(max(abs(end[0] - start[0]), abs(end[1] - start[1])) / GeoService.EDGE_STEP_DEGREES))
+        return [
+            [start[0] + (end[0] - start[0]) * i / steps, start[1] + (end[1] - start[1]) * i / steps]
+            for i in range(steps)
+        ]
+
+    @staticmethod
+    def box_query(west: float, south: float, east: float, north: float) -> Dict:
+        """
+        Filter for points inside a lon/lat box. The polygon lets the 2dsphere
+        index narrow the scan; the coordinate ranges make the edges exact.
+        """
+        if west >= east or south >= north:
+            raise ValueError("Bounding box must have west < east and south < north; split boxes crossing the antimeridian")
+
+        corners = [(west, south), (east, south), (east, north), (west, north)]
+        ring = []
+        for i, corner in enumerate(corners):
+            ring.extend(GeoService._edge(corner, corners[(i + 1) % 4]))
+        ring.append(ring[0])
+
+        return {
+            "location": {"$geoWithin": {"$geometry": {
+                "type": "Polygon",
+                "coordinates": [ring],
+                "crs": STRICT_WINDING_CRS
+            }}},
+            "location.coordinates.0": {"$gte": west, "$lte": east},
+            "location.coordinates.1": {"$gte": south, "$lte": north},
+        }
+
+    @staticmethod
+    async def near(latitude: float, longitude: float, radius_m: float,
+                   limit: int, query: Optional[Dict] = None) -> List[Dict]:
+        """Tests within radius_m of a point, nearest first, with distance_m"""
+        pipeline = [
+            {"$geoNear": {
+                "near": {"type": "Point", "coordinates": [longitude, latitude]},
+                "key": "location",
+                "distanceField": "distance_m",
+                "maxDistance": radius_m,
+                "spherical": True,
+                "query": query or {}
+            }},
+            {"$limit": limit},
+            {"$project": {**GeoService.PROJECTION, "distance_m": 1}},
+        ]
+        return await db.collection("drug_tests", "analytics").aggregate(pipeline).to_list(length=None)
+
+    @staticmethod
+    async def within(west: float, south: float, east: float, north: float,
+                     limit: int, query: Optional[Dict] = None) -> List[Dict]:
+        """Tests inside a bounding box, newest first"""
+        cursor = db.collection("drug_tests", "analytics").find(
+            {**(query or {}), **GeoService.box_query(west, south, east, north)},
+            GeoService.PROJECTION
+        )
+        return await cursor.sort("test_timestamp", -1).limit(limit).to_list(length=None)
+
+    @staticmethod
+    def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+        """West, south, east, north of a Web Mercator (slippy map) tile"""
+        n = 2 ** z
+        if not (0 <= x < n and 0 <= y < n):
+            raise ValueError(f"Tile {z}/{x}/{y} does not exist")
+
+        def latitude(tile_y: int) -> float:
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+        return x / n * 360.0 - 180.0, latitude(y + 1), (x + 1) / n * 360.0 - 180.0, latitude(y)
+
+    @staticmethod
+    async def tile_clusters(z: int, x: int, y: int, query: Optional[Dict] = None) -> Dict:
+        """
+        Grid clustering for one map tile: tests are bucketed into a
+        GEO_CLUSTER_GRID x GEO_CLUSTER_GRID grid on the server, so the client
+        gets at most grid² markers however many tests the tile holds.
+        """
+        west, south, east, north = GeoService.tile_bounds(z, x, y)
+        grid = settings.GEO_CLUSTER_GRID
+        cell_width = (east - west) / grid
+        cell_height = (north - south) / grid
+
+        pipeline = [
+            {"$match": {**(query or {}), **GeoService.box_query(west, south, east, north)}},
+            {"$project": {
+                "longitude": {"$arrayElemAt": ["$location.coordinates", 0]},
+                "latitude": {"$arrayElemAt": ["$location.coordinates", 1]},
+            }},
+            {"$group": {
+                # Points on the east/south tile edge belong to the last cell
+                "_id": {
+                    "x": {"$min": [{"$floor": {"$divide": [{"$subtract": ["$longitude", west]}, cell_width]}}, grid - 1]},
+                    "y": {"$min": [{"$floor": {"$divide": [{"$subtract": [north, "$latitude"]}, cell_height]}}, grid - 1]},
+                },
+                "count": {"$sum": 1},
+                "latitude": {"$avg": "$latitude"},
+                "longitude": {"$avg": "$longitude"},
+                "test_id": {"$first": "$_id"},
+            }},
+        ]
+        cells = await db.collection("drug_tests", "analytics").aggregate(pipeline).to_list(length=None)
+
+        clusters = []
+        for cell in cells:
+            cluster = {
+                "cell": [int(cell["_id"]["x"]), int(cell["_id"]["y"])],
+                "count": cell["count"],
+                "latitude": cell["latitude"],
+                "longitude": cell["longitude"],
+            }
+            if cell["count"] == 1:
+                cluster["test_id"] = str(cell["test_id"])
+            clusters.append(cluster)
+
+        return {
+            "tile": [z, x, y],
+            "bounds": [west, south, east, north],
+            "grid": grid,
+            "total": sum(cluster["count"] for cluster in clusters),
+            "clusters": clusters,
+        }
@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import HTTPException, Response, status
+from pymongo.errors import DuplicateKeyError
+from ..db.mongodb import db
+from ..models.user import UserInDB
+from ..core.config import get_settings
+
+settings = get_settings()
+
+
+class IdempotencyService:
+    """
+    Idempotency-Key support. The first request with a key claims it; retries
+    with the same key and request fingerprint get the stored response
+    replayed, while the original is still running they get 409. Keys are
+    scoped per user and expire after IDEMPOTENCY_TTL_HOURS (TTL index on
+    expires_at). Failed requests release their key so the client can retry.
+    """
+    COLLECTION = "idempotency_keys"
+    REPLAY_HEADER = "Idempotent-Replayed"
+
+    @staticmethod
+    def fingerprint(*parts) -> str:
+        return hashlib.sha256("\x1f".join("" if p is None else str(p) for p in parts).encode()).hexdigest()
+
+    @staticmethod
+    def _id(user: UserInDB, key: str) -> str:
+        return f"{user.username}:{key}"
+
+    @staticmethod
+    async def begin(user: UserInDB, key: str, fingerprint: str) -> Optional[Response]:
+        """Claim a key; returns the original response to replay, or None to proceed"""
+        keys = db.db[IdempotencyService.COLLECTION]
+        now = datetime.utcnow()
+        record_id = IdempotencyService._id(user, key)
+
+        for _ in range(2):
+            try:
+                await keys.insert_one({
+                    "_id": record_id,
+                    "fingerprint": fingerprint,
+                    "status": "in_progress",
+                    "created_at": now,
+                    "expires_at": now + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+                })
+                return None
+            except DuplicateKeyError:
+                existing = await keys.find_one({"_id": record_id})
+            # The TTL monitor only runs once a minute; treat expired keys as gone
+            if existing is None or existing["expires_at"] <= now:
+                await keys.delete_one({"_id": record_id, "expires_at": {"$lte": now}})
+                continue
+            break
+        else:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Idempotency-Key is being claimed, retry")
+
+        if existing["fingerprint"] != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used for a different request"
+            )
+        if existing["status"] != "completed":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still being processed",
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)}
+            )
+        return Response(
+            content=existing["body"],
+            status_code=existing["status_code"],
+            media_type=existing["media_type"],
+            headers={IdempotencyService.REPLAY_HEADER: "true"}
+        )
+
+    @staticmethod
+    async def complete(user: UserInDB, key: str, response: Response):
+        await db.db[IdempotencyService.COLLECTION].update_one(
+            {"_id": IdempotencyService._id(user, key)},
+            {"$set": {
+                "status": "completed",
+                "status_code": response.status_code,
+                "media_type": response.media_type,
+                "body": bytes(response.body),
+                "completed_at": datetime.utcnow(),
+            }}
+        )
+
+    @staticmethod
+    async def release(user: UserInDB, key: str):
+        await db.db[IdempotencyService.COLLECTION].delete_one({"_id": IdempotencyService._id(user, key)})
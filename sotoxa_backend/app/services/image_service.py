@@ -0,0 +1,109 @@
+import io
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, Optional
+from bson import ObjectId
+from ..db.mongodb import db
+from ..core.config import get_settings
+from ..core.metrics import IMAGE_DERIVATIVE_DURATION
+from .storage import get_storage
+from .watermark_service import WatermarkService
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+settings = get_settings()
+
+
+class ImageService:
+    """
+    Compact derivatives of stored scans and photos for list and detail views.
+    Originals are kept untouched for OCR and as evidence.
+    """
+    IMAGE_EXTENSIONS = {"jpg", "jpeg", "png"}
+
+    @staticmethod
+    def derivative_sizes() -> Dict[str, int]:
+        return {
+            "normalized": settings.IMAGE_NORMALIZED_MAX_SIZE,
+            "thumb": settings.IMAGE_THUMBNAIL_SIZE,
+        }
+
+    @staticmethod
+    def output_format() -> str:
+        from PIL import features
+        fmt = settings.IMAGE_DERIVATIVE_FORMAT.upper()
+        if fmt == "WEBP" and not features.check("webp"):
+            return "JPEG"
+        return fmt
+
+    @staticmethod
+    def media_type(fmt: Optional[str] = None) -> str:
+        return "image/webp" if (fmt or ImageService.output_format()) == "WEBP" else "image/jpeg"
+
+    @staticmethod
+    def _render(source: "Image.Image", max_size: int, fmt: str) -> bytes:
+        """Bounded-resolution re-encode; saving without exif= drops EXIF/GPS metadata"""
+        from PIL import Image
+        image = source.copy()
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, format=fmt, quality=settings.IMAGE_DERIVATIVE_QUALITY, optimize=True)
+        return output.getvalue()
+
+    @staticmethod
+    def render_derivatives(path: str) -> Dict[str, bytes]:
+        """Decode once and render every derivative; CPU-bound, run off the event loop"""
+        from PIL import Image, ImageOps
+        fmt = ImageService.output_format()
+        with Image.open(path) as image:
+            # Apply the camera orientation before the EXIF tag is discarded
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            return {
+                name: ImageService._render(image, max_size, fmt)
+                for name, max_size in ImageService.derivative_sizes().items()
+            }
+
+    @staticmethod
+    def derivative_key(file_hash: str, name: str) -> str:
+        extension = "webp" if ImageService.output_format() == "WEBP" else "jpg"
+        max_size = ImageService.derivative_sizes()[name]
+        return f"derivatives/{file_hash}_{name}{max_size}.{extension}"
+
+    @staticmethod
+    async def create_derivatives(location: str, file_hash: str) -> Dict[str, str]:
+        """Render and store derivatives of one blob, returning their locations"""
+        if location.rsplit(".", 1)[-1].lower() not in ImageService.IMAGE_EXTENSIONS:
+            return {}
+
+        storage = get_storage()
+        keys = {name: ImageService.derivative_key(file_hash, name) for name in ImageService.derivative_sizes()}
+        if all([await storage.exists(key) for key in keys.values()]):
+            return {name: storage.location(key) for name, key in keys.items()}
+
+        with IMAGE_DERIVATIVE_DURATION.time():
+            async with storage.local_path(location) as path:
+                rendered = await asyncio.to_thread(ImageService.render_derivatives, path)
+
+        locations = {}
+        for name, data in rendered.items():
+            async def chunks(data=data):
+                yield data
+            locations[name] = await storage.save(keys[name], chunks(), ImageService.media_type())
+        return locations
+
+    @staticmethod
+    async def process_test_images(test_id: str, kind: str, location: str, file_hash: str):
+        """Background task: build derivatives for a test's scan or photo and record them"""
+        try:
+            locations = await ImageService.create_derivatives(location, file_hash)
+            if locations:
+                # Only while the test still holds this file: a photo replaced meanwhile has its own task
+                url_field = "scan_file_url" if kind == "scan" else "photo_url"
+                await db.collection("drug_tests", "metadata").update_one(
+                    {"_id": ObjectId(test_id), url_field: location},
+                    {"$set": {f"derivatives.{kind}": locations}}
+                )
+                await WatermarkService.bump("drug_tests")
+        except Exception as e:
+            logging.error(f"Failed to create {kind} derivatives for test_id {test_id}: {str(e)}")
@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from bson import ObjectId
+from fastapi import BackgroundTasks, HTTPException, UploadFile, status
+from pymongo.errors import DuplicateKeyError
+from ..db.mongodb import db
+from ..models.drug_test import DrugTest, Location, Operator
+from ..models.user import UserInDB
+from .upload_service import UploadService
+from .ocr_queue import OCRQueue
+from .image_service import ImageService
+from .admission import AdmissionControl
+from .watermark_service import WatermarkService
+from ..core.config import get_settings
+from .outbox_service import OutboxService
+from .trace_service import TraceService
+from ..core import tracing
+
+settings = get_settings()
+
+
+class IngestService:
+    """Turns a received scan into a drug test record and queues its processing"""
+
+    @staticmethod
+    async def create_test(
+        background_tasks: BackgroundTasks,
+        file: UploadFile,
+        person_id: str,
+        operator_id: str,
+        operator_name: str,
+        lat: Optional[float],
+        lon: Optional[float],
+        priority: str,
+        current_user: UserInDB,
+        traceparent: Optional[str] = None,
+        digest: Optional[Tuple[str, int]] = None
+    ) -> Dict:
+        """
+        Store the scan, insert its record and queue OCR; returns the inserted
+        document. The upload starts a trace, continuing the client's
+        traceparent when one is sent, and the OCR job joins it.
+        """
+        # Shed load before touching storage: bounded OCR backlog and per-user/global upload slots
+        OCRQueue.check_capacity()
+        async with AdmissionControl.slot("upload", current_user):
+            trace_id, parent_id = tracing.parse_traceparent(traceparent) or (None, None)
+            async with TraceService.trace("upload", trace_id, parent_id, priority=priority):
+                try:
+                    # Save file
+                    with tracing.span("upload.save"):
+                        file_url, file_hash = await UploadService.save_file(file, digest=digest)
+
+                    # Create drug test entry
+                    drug_test = DrugTest(
+                        scan_file_url=file_url,
+                        person_id=person_id,
+                        location=Location(latitude=lat, longitude=lon) if lat is not None and lon is not None else None,
+                        operator=Operator(id=operator_id, name=operator_name),
+                        test_timestamp=datetime.utcnow(),
+                        hash=file_hash
+                    )
+
+                    # Save to database
+                    tracing.set_test_id(drug_test.id)
+                    document = drug_test.model_dump(by_alias=True)
+                    document["_id"] = ObjectId(drug_test.id)
+                    document["trace_id"] = tracing.current_trace_id()
+                    # The OCR job's spans hang off the upload span, whichever process runs it
+                    document["trace_parent_id"] = tracing.current_span_id()
+                    # OCR-role workers claim pending tests in priority order
+                    document["ocr_priority"] = priority
+                    if drug_test.location:
+                        document["location"] = drug_test.location.to_geojson()
+                    event = OutboxService.event(
+                        "test.uploaded",
+                        document["_id"],
+                        person_id,
+                        {"operator_id": operator_id, "test_timestamp": drug_test.test_timestamp}
+                    )
+                    document[OutboxService.PENDING_FIELD] = [OutboxService.pending(event)]
+                    with tracing.span("db.insert"):
+                        try:
+                            await db.collection("drug_tests", "ingest").insert_one(document)
+                        except DuplicateKeyError:
+                            # hash is unique: the same scan bytes already belong to a test
+                            existing = await db.db["drug_tests"].find_one({"hash": file_hash}, {"_id": 1})
+                            raise HTTPException(
+                                status_code=status.HTTP_409_CONFLICT,
+                                detail="This scan was already uploaded"
+                                       + (f" as test {existing['_id']}" if existing else "")
+                            )
+                    with tracing.span("db.followups"):
+                        await WatermarkService.bump("drug_tests")
+                        await OutboxService.publish([event])
+
+                    # Queue OCR processing
+                    await OCRQueue.process_in_background(
+                        background_tasks,
+                        file_url,
+                        drug_test.id,
+                        file_hash,
+                        priority,
+                        operator_id,
+                        document["trace_id"],
+                        document["trace_parent_id"]
+                    )
+
+                    # Build the compact normalized/thumbnail versions off the request path;
+                    # with separate OCR workers they are built there alongside OCR
+                    if settings.WORKER_ROLE != "api":
+                        background_tasks.add_task(
+                            ImageService.process_test_images,
+                            drug_test.id,
+                            "scan",
+                            file_url,
+                            file_hash
+                        )
+
+                    return document
+
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail=f"Failed to process upload: {str(e)}"
+                    )
@@ -0,0 +1,48 @@
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+from pymongo.errors import DuplicateKeyError
+from ..db.mongodb import db
+
+
+class LockService:
+    """
+    Leased locks in the locks collection, shared by every worker process and
+    host. A lock expires after its TTL so a holder that dies can't block
+    the next start forever.
+    """
+    COLLECTION = "locks"
+
+    @staticmethod
+    async def acquire(name: str, ttl_seconds: float) -> Optional[str]:
+        """Take the lock, returning an owner token, or None if someone else holds it"""
+        locks = db.db[LockService.COLLECTION]
+        token = uuid.uuid4().hex
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl_seconds)
+        try:
+            await locks.insert_one({"_id": name, "owner": token, "acquired_at": now, "expires_at": expires_at})
+            return token
+        except DuplicateKeyError:
+            # Take over an expired lease
+            taken = await locks.find_one_and_update(
+                {"_id": name, "expires_at": {"$lte": now}},
+                {"$set": {"owner": token, "acquired_at": now, "expires_at": expires_at}}
+            )
+            return token if taken else None
+
+    @staticmethod
+    async def release(name: str, token: str):
+        await db.db[LockService.COLLECTION].delete_one({"_id": name, "owner": token})
+
+    @staticmethod
+    @asynccontextmanager
+    async def hold(name: str, ttl_seconds: float) -> AsyncIterator[bool]:
+        """async with LockService.hold(...) as acquired: run the body only if acquired"""
+        token = await LockService.acquire(name, ttl_seconds)
+        try:
+            yield token is not None
+        finally:
+            if token is not None:
+                await LockService.release(name, token)
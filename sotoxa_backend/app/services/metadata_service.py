@@ -0,0 +1,142 @@
+from typing import Dict, List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from ..db.mongodb import db
+from ..models.drug_test import Location, MetadataUpdate, BulkMetadataItem
+from .person_service import PersonService
+from .watermark_service import WatermarkService
+from .outbox_service import OutboxService
+
+# Fields that place a test on a person's timeline
+TIMELINE_FIELDS = {"person_id", "test_timestamp"}
+
+
+class MetadataService:
+    """Applies MetadataUpdate payloads to drug test records"""
+
+    @staticmethod
+    def build_update(metadata: MetadataUpdate) -> Dict:
+        """Translate a metadata payload into the $set document for a drug test"""
+        update_data = {}
+
+        if metadata.person_id:
+            update_data["person_id"] = metadata.person_id
+
+        if metadata.operator_id and metadata.operator_name:
+            update_data["operator"] = {
+                "id": metadata.operator_id,
+                "name": metadata.operator_name
+            }
+
+        if metadata.test_timestamp:
+            update_data["test_timestamp"] = metadata.test_timestamp
+
+        if metadata.latitude is not None and metadata.longitude is not None:
+            update_data["location"] = Location(
+                latitude=metadata.latitude,
+                longitude=metadata.longitude
+            ).to_geojson()
+
+        return update_data
+
+    @staticmethod
+    async def update_one(test_id: ObjectId, update_data: Dict) -> Optional[Dict]:
+        """Apply an update and return the new document in a single round trip"""
+        if not update_data:
+            return await db.db["drug_tests"].find_one({"_id": test_id})
+
+        previous = None
+        if "person_id" in update_data:
+            # A reassignment changes two timelines; look up the old owner first
+            previous = await db.db["drug_tests"].find_one({"_id": test_id}, {"person_id": 1})
+
+        event = OutboxService.event("test.metadata_updated", test_id, update_data.get("person_id"), update_data)
+        update: Dict = OutboxService.with_pending({"$set": update_data}, event)
+        if "photo_url" in update_data:
+            # Derivatives of the replaced photo; the new photo's are built in the background
+            update["$unset"] = {"derivatives.photo": ""}
+        updated = await db.collection("drug_tests", "metadata").find_one_and_update(
+            {"_id": test_id},
+            update,
+            return_document=ReturnDocument.AFTER
+        )
+        if updated:
+            await WatermarkService.bump("drug_tests")
+            event["person_id"] = updated.get("person_id")
+            await OutboxService.publish([event])
+        if updated and TIMELINE_FIELDS & update_data.keys():
+            await PersonService.refresh_summaries([
+                updated.get("person_id"),
+                previous.get("person_id") if previous else None
+            ])
+        return updated
+
+    @staticmethod
+    async def bulk_update(items: List[BulkMetadataItem], ordered: bool = False) -> List[Dict]:
+        """
+        Apply many metadata updates with one existence query and one bulk_write.
+        Returns one outcome per item, in request order: updated, unchanged,
+        not_found, invalid, failed, or skipped (after a failure in ordered mode).
+        """
+        outcomes = [{"test_id": item.test_id, "status": "pending"} for item in items]
+
+        object_ids = {}
+        for index, item in enumerate(items):
+            try:
+                object_ids[index] = ObjectId(item.test_id)
+            except (InvalidId, TypeError):
+                outcomes[index].update(status="invalid", detail="Invalid test id")
+
+        existing = {}
+        if object_ids:
+            cursor = db.db["drug_tests"].find(
+                {"_id": {"$in": list(set(object_ids.values()))}},
+                {"person_id": 1}
+            )
+            existing = {doc["_id"]: doc.get("person_id") async for doc in cursor}
+
+        operations = []
+        op_indexes = []
+        events = []
+        timelines = set()
+        for index, object_id in object_ids.items():
+            if object_id not in existing:
+                outcomes[index].update(status="not_found", detail="Test not found")
+                continue
+            update_data = MetadataService.build_update(items[index])
+            if not update_data:
+                outcomes[index]["status"] = "unchanged"
+                continue
+            event = OutboxService.event(
+                "test.metadata_updated", object_id, update_data.get("person_id", existing[object_id]), update_data
+            )
+            operations.append(UpdateOne({"_id": object_id}, OutboxService.with_pending({"$set": update_data}, event)))
+            op_indexes.append(index)
+            events.append(event)
+            if TIMELINE_FIELDS & update_data.keys():
+                timelines.update({existing[object_id], update_data.get("person_id")})
+
+        failed = {}
+        if operations:
+            try:
+                await db.collection("drug_tests", "metadata").bulk_write(operations, ordered=ordered)
+            except BulkWriteError as e:
+                failed = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+            await WatermarkService.bump("drug_tests")
+
+        first_failure = min(failed) if failed else None
+        published = []
+        for op_index, index in enumerate(op_indexes):
+            if op_index in failed:
+                outcomes[index].update(status="failed", detail=failed[op_index])
+            elif ordered and first_failure is not None and op_index > first_failure:
+                outcomes[index].update(status="skipped", detail="Not applied after an earlier failure")
+            else:
+                outcomes[index]["status"] = "updated"
+                published.append(events[op_index])
+
+        await OutboxService.publish(published)
+        await PersonService.refresh_summaries(timelines)
+        return outcomes
@@ -0,0 +1,98 @@
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from ..db.mongodb import db
+from ..core.config import get_settings
+from ..core.metrics import OCR_CACHE_LOOKUPS
+from .ocr_service import OCRService
+
+settings = get_settings()
+
+OCRResult = Tuple[str, Dict[str, str], float]
+
+
+class OCRCache:
+    """
+    OCR results keyed by (file hash, pipeline version).
+    An in-process LRU sits in front of the ocr_cache collection. Changing the
+    preprocessing, patterns or Tesseract config changes the pipeline version,
+    so stale entries are simply never looked up again.
+    """
+    COLLECTION = "ocr_cache"
+
+    _memory: "OrderedDict[str, OCRResult]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _key(file_hash: str, pipeline_version: Optional[str] = None) -> str:
+        return f"{file_hash}:{pipeline_version or OCRService.pipeline_version()}"
+
+    @staticmethod
+    def _remember(key: str, result: OCRResult):
+        with OCRCache._lock:
+            OCRCache._memory[key] = result
+            OCRCache._memory.move_to_end(key)
+            while len(OCRCache._memory) > settings.OCR_CACHE_MEMORY_SIZE:
+                OCRCache._memory.popitem(last=False)
+
+    @staticmethod
+    async def get(file_hash: str) -> Optional[OCRResult]:
+        """Return cached (text, data, confidence) for this scan, if any"""
+        if not settings.OCR_CACHE_ENABLED or not file_hash:
+            return None
+
+        key = OCRCache._key(file_hash)
+        with OCRCache._lock:
+            result = OCRCache._memory.get(key)
+            if result is not None:
+                OCRCache._memory.move_to_end(key)
+        if result is not None:
+            OCR_CACHE_LOOKUPS.inc(result="memory_hit")
+            return result
+
+        try:
+            doc = await db.db[OCRCache.COLLECTION].find_one({"_id": key})
+        except Exception as e:
+            logging.warning(f"OCR cache lookup failed for {file_hash}: {str(e)}")
+            doc = None
+        if not doc:
+            OCR_CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+        result = (doc["ocr_text"], doc["ocr_data"], doc["ocr_confidence"])
+        OCRCache._remember(key, result)
+        OCR_CACHE_LOOKUPS.inc(result="db_hit")
+        return result
+
+    @staticmethod
+    async def put(file_hash: str, ocr_text: str, ocr_data: Dict[str, str], confidence: float):
+        """Store a result for the current pipeline version"""
+        if not settings.OCR_CACHE_ENABLED or not file_hash:
+            return
+
+        pipeline_version = OCRService.pipeline_version()
+        key = OCRCache._key(file_hash, pipeline_version)
+        OCRCache._remember(key, (ocr_text, ocr_data, confidence))
+        try:
+            await db.collection(OCRCache.COLLECTION, "ocr").replace_one(
+                {"_id": key},
+                {
+                    "_id": key,
+                    "file_hash": file_hash,
+                    "pipeline_version": pipeline_version,
+                    "ocr_text": ocr_text,
+                    "ocr_data": ocr_data,
+                    "ocr_confidence": confidence,
+                    "created_at": datetime.utcnow()
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logging.warning(f"OCR cache store failed for {file_hash}: {str(e)}")
+
+    @staticmethod
+    def clear_memory():
+        with OCRCache._lock:
+            OCRCache._memory.clear()
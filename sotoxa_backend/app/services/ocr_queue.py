@@ -1,70 +1,235 @@
-from fastapi import BackgroundTasks
-from typing import Optional
+from fastapi import BackgroundTasks, HTTPException, status
+from typing import Dict, Optional
+import math
+import time
+import asyncio
 from ..db.mongodb import db
 from bson import ObjectId
 import logging
 from .ocr_service import OCRService
+from .ocr_cache import OCRCache
+from .storage import get_storage
+from .ocr_scheduler import OCRScheduler
+from .person_service import PersonService
+from .watermark_service import WatermarkService
+from .outbox_service import OutboxService
+from .trace_service import TraceService
+from ..core import tracing
+from ..core.log import OCR_LOG
+from ..core.config import get_settings
+from ..core.metrics import OCR_STAGE_DURATION, OCR_JOBS, OCR_RETRIES, OCR_CONFIDENCE, OCR_QUEUE_DEPTH, ADMISSION_REJECTED
+
+settings = get_settings()
 
 class OCRQueue:
     MAX_RETRIES = 3
+    depth = 0  # jobs queued or running in this process
+    draining = False  # set at shutdown; new OCR work is refused
+
+    @staticmethod
+    def drain_estimate() -> float:
+        """Seconds until the current backlog clears, from observed Tesseract times"""
+        stats = OCR_STAGE_DURATION.snapshot(stage="tesseract")
+        avg_job = stats["sum"] / stats["count"] if stats["count"] else 1.0
+        workers = OCRScheduler.capacity()
+        return OCRQueue.depth * avg_job / workers
+
+    @staticmethod
+    async def drain(timeout: float) -> bool:
+        """Refuse new work and wait up to timeout for queued and running jobs; True if drained"""
+        OCRQueue.draining = True
+        deadline = time.monotonic() + timeout
+        while OCRQueue.depth > 0 or OCRScheduler.running() > 0:
+            if time.monotonic() >= deadline:
+                # Their records stay pending; a reprocess run with processing_status=pending recovers them
+                logging.warning(f"Shutting down with {OCRQueue.depth} OCR jobs unfinished")
+                return False
+            await asyncio.sleep(0.1)
+        return True
+
+    @staticmethod
+    def check_capacity():
+        """Reject new OCR work with 503 + Retry-After when the queue is full"""
+        if OCRQueue.draining:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is shutting down",
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)}
+            )
+        if OCRQueue.depth >= settings.OCR_MAX_QUEUE_DEPTH:
+            ADMISSION_REJECTED.inc(route="ocr_queue", status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            retry_after = max(settings.ADMISSION_RETRY_AFTER, OCRQueue.drain_estimate())
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OCR queue is full, retry later",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
 
     @staticmethod
     async def process_in_background(
         background_tasks: BackgroundTasks,
         file_path: str,
-        test_id: str
+        test_id: str,
+        file_hash: Optional[str] = None,
+        priority: str = "interactive",
+        operator: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        trace_parent_id: Optional[str] = None
     ):
-        """Add OCR processing to background tasks"""
+        """Add OCR processing to background tasks, continuing the upload's trace"""
+        if settings.WORKER_ROLE == "api":
+            # The record is stored as pending; an OCR-role worker claims it
+            return
+        OCRQueue.depth += 1
+        OCR_QUEUE_DEPTH.set(OCRQueue.depth)
         background_tasks.add_task(
-            OCRQueue._process_and_update,
+            OCRQueue._run_job,
             file_path,
-            test_id
+            test_id,
+            file_hash,
+            priority,
+            operator,
+            trace_id,
+            trace_parent_id,
+            time.time_ns()
         )
 
     @staticmethod
-    async def _process_and_update(file_path: str, test_id: str, retry_count: int = 0):
-        """Process OCR and update database with retry mechanism"""
+    async def _run_job(file_path: str, test_id: str, file_hash: Optional[str] = None,
+                       priority: str = "interactive", operator: Optional[str] = None,
+                       trace_id: Optional[str] = None, trace_parent_id: Optional[str] = None,
+                       enqueued_ns: Optional[int] = None):
+        """Run a queued OCR job, keeping the queue depth gauge accurate"""
         try:
-            # Perform OCR
-            ocr_text, ocr_data, confidence = await OCRService.process_image(file_path)
-            
-            # Log raw results
-            logging.info(f"OCR Text for test_id {test_id}:\n{ocr_text}")
-            logging.info(f"Extracted data for test_id {test_id}:\n{ocr_data}")
-            logging.info(f"Confidence score: {confidence}")
+            await OCRQueue._process_and_update(
+                file_path, test_id, file_hash=file_hash, priority=priority, operator=operator,
+                trace_id=trace_id, trace_parent_id=trace_parent_id, enqueued_ns=enqueued_ns
+            )
+        finally:
+            OCRQueue.depth -= 1
+            OCR_QUEUE_DEPTH.set(OCRQueue.depth)
+
+    @staticmethod
+    async def ocr_stored_file(location: str, priority: str = "interactive", operator: Optional[str] = None):
+        """Run OCR on a stored blob, fetching a local copy first for remote backends"""
+        async with get_storage().local_path(location) as path:
+            return await OCRService.process_image(path, priority=priority, operator=operator)
+
+    @staticmethod
+    async def _process_and_update(file_path: str, test_id: str, retry_count: int = 0,
+                                  file_hash: Optional[str] = None, priority: str = "interactive",
+                                  operator: Optional[str] = None, trace_id: Optional[str] = None,
+                                  trace_parent_id: Optional[str] = None, enqueued_ns: Optional[int] = None):
+        """
+        Process OCR and update database with retry mechanism. The job is one
+        ocr.job trace segment, backdated to when it was queued so the time
+        spent pending shows up as its own span, and one summary log record.
+        """
+        start_ns = enqueued_ns or time.time_ns()
+        summary = {"event": "ocr.scan", "test_id": test_id, "priority": priority}
+        async with TraceService.trace("ocr.job", trace_id, trace_parent_id, test_id, start_ns=enqueued_ns,
+                                      priority=priority) as job:
+            if enqueued_ns:
+                tracing.record("ocr.pending", enqueued_ns, time.time_ns())
+            await OCRQueue._attempt(file_path, test_id, retry_count, file_hash, priority, operator, summary)
+            job.set("status", summary["status"])
+            summary["trace_id"] = tracing.current_trace_id()
+            summary["stages_ms"] = tracing.durations_by_name()
+
+        summary["duration_ms"] = (time.time_ns() - start_ns) / 1e6
+        failed = summary["status"] == "failed"
+        OCR_LOG.log(logging.ERROR if failed else logging.INFO, "OCR %s for test_id %s after %d attempts",
+                    summary["status"], test_id, summary["attempts"], extra=summary)
+
+    @staticmethod
+    async def _attempt(file_path: str, test_id: str, retry_count: int, file_hash: Optional[str],
+                       priority: str, operator: Optional[str], summary: Dict):
+        """One OCR attempt, retried while no results are extracted; the outcome goes into summary"""
+        summary["attempts"] = retry_count + 1
+        try:
+            # Reuse a prior result for identical scan bytes under the same pipeline version
+            cached = None
+            if retry_count == 0:
+                with tracing.span("ocr.cache_lookup") as lookup:
+                    cached = await OCRCache.get(file_hash)
+                    lookup.set("hit", cached is not None)
+            if cached:
+                ocr_text, ocr_data, confidence = cached
+            else:
+                # Perform OCR
+                with tracing.span("ocr.attempt", attempt=retry_count):
+                    ocr_text, ocr_data, confidence = await OCRQueue.ocr_stored_file(file_path, priority, operator)
 
             # Validate results and retry if needed
-            if not OCRService._validate_results(ocr_data) and retry_count < OCRQueue.MAX_RETRIES:
-                logging.warning(f"Retrying OCR for test_id {test_id}, attempt {retry_count + 1}")
-                return await OCRQueue._process_and_update(file_path, test_id, retry_count + 1)
+            valid = OCRService._validate_results(ocr_data)
+            if not valid and retry_count < OCRQueue.MAX_RETRIES:
+                OCR_RETRIES.inc()
+                return await OCRQueue._attempt(
+                    file_path, test_id, retry_count + 1, file_hash, priority, operator, summary
+                )
+            summary.update(
+                cached=bool(cached),
+                confidence=confidence,
+                results_found=sum(result != "Not Found" for result in ocr_data.values()),
+            )
+
+            OCR_CONFIDENCE.observe(confidence)
 
             # Update database
-            update_result = await db.db["drug_tests"].update_one(
-                {"_id": ObjectId(test_id)},
-                {
-                    "$set": {
-                        "ocr_text": ocr_text,
-                        "ocr_data": ocr_data,
-                        "ocr_confidence": confidence,
-                        "processing_status": "completed",
-                        "retry_count": retry_count
-                    }
-                }
+            event = OutboxService.event(
+                "test.ocr_completed", ObjectId(test_id), None, {"ocr_data": ocr_data, "ocr_confidence": confidence}
             )
+            with OCR_STAGE_DURATION.time(stage="db_update"), tracing.span("db.update"):
+                updated = await db.collection("drug_tests", "ocr").find_one_and_update(
+                    {"_id": ObjectId(test_id)},
+                    OutboxService.with_pending({
+                        "$set": {
+                            "ocr_text": ocr_text,
+                            "ocr_data": ocr_data,
+                            "ocr_confidence": confidence,
+                            "processing_status": "completed",
+                            "retry_count": retry_count,
+                            "ocr_pipeline_version": OCRService.pipeline_version()
+                        }
+                    }, event),
+                    projection={"person_id": 1}
+                )
+            OCR_JOBS.inc(status="completed")
 
-            if update_result.modified_count == 0:
-                logging.error(f"Failed to update OCR results for test_id: {test_id}")
+            # Only cache usable results so failed reads still get a fresh attempt
+            if valid and not cached:
+                with tracing.span("ocr.cache_store"):
+                    await OCRCache.put(file_hash, ocr_text, ocr_data, confidence)
 
-        except Exception as e:
-            logging.error(f"Background OCR processing failed for test_id {test_id}: {str(e)}")
-            await db.db["drug_tests"].update_one(
-                {"_id": ObjectId(test_id)},
-                {
-                    "$set": {
-                        "processing_status": "failed",
-                        "processing_error": str(e),
-                        "retry_count": retry_count
-                    }
-                }
-            )
+            if updated is None:
+                OCR_LOG.error("Failed to update OCR results for test_id %s", test_id)
+            else:
+                with tracing.span("db.followups"):
+                    await WatermarkService.bump("drug_tests")
+                    event["person_id"] = updated.get("person_id")
+                    await OutboxService.publish([event])
+                    await PersonService.refresh_summaries([updated.get("person_id")])
+            summary["status"] = "completed"
 
+        except Exception as e:
+            summary.update(status="failed", error=str(e))
+            OCR_JOBS.inc(status="failed")
+            event = OutboxService.event("test.ocr_failed", ObjectId(test_id), None, {"processing_error": str(e)})
+            with tracing.span("db.update"):
+                failed = await db.collection("drug_tests", "ocr").find_one_and_update(
+                    {"_id": ObjectId(test_id)},
+                    OutboxService.with_pending({
+                        "$set": {
+                            "processing_status": "failed",
+                            "processing_error": str(e),
+                            "retry_count": retry_count
+                        }
+                    }, event),
+                    projection={"person_id": 1}
+                )
+            if failed:
+                with tracing.span("db.followups"):
+                    await WatermarkService.bump("drug_tests")
+                    event["person_id"] = failed.get("person_id")
+                    await OutboxService.publish([event])
+                    await PersonService.refresh_summaries([failed.get("person_id")])
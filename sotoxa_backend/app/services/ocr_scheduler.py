@@ -0,0 +1,178 @@
+import os
+import time
+import asyncio
+import contextvars
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from ..core.config import get_settings
+from ..core.metrics import OCR_WAIT_TIME, OCR_SCHEDULER_QUEUED
+from ..core import tracing
+
+settings = get_settings()
+
+
+class _Job:
+    __slots__ = ("func", "args", "priority", "operator", "future", "enqueued_at", "enqueued_ns",
+                 "dispatched_ns", "context")
+
+    def __init__(self, func: Callable, args: tuple, priority: str, operator: str, future: asyncio.Future):
+        self.func = func
+        self.args = args
+        self.priority = priority
+        self.operator = operator
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.enqueued_ns = time.time_ns()
+        self.dispatched_ns = 0
+        # The submitter's context, so the job's spans land in its trace
+        self.context = contextvars.copy_context()
+
+
+class OCRScheduler:
+    """
+    Dispatches OCR work onto the worker pool by priority class.
+
+    Classes share the pool by stride scheduling (weighted fair queuing):
+    each dispatch advances the class's pass by 1/weight and the busy class
+    with the lowest pass goes next. Within a class, operators are served
+    round-robin so one operator's batch can't monopolise it. Any job that
+    has waited longer than OCR_AGING_SECONDS is dispatched first, oldest
+    first, so low-priority work always finishes.
+    """
+    PRIORITIES = ("interactive", "batch", "reprocess")
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _queues: Dict[str, "OrderedDict[str, deque[_Job]]"] = {p: OrderedDict() for p in PRIORITIES}
+    _pass: Dict[str, float] = {p: 0.0 for p in PRIORITIES}
+    _running = 0
+    _tasks: set = set()
+
+    @staticmethod
+    def capacity() -> int:
+        """OCR threads in this process; by default web workers split the cores evenly, OCR workers get them all"""
+        if settings.OCR_WORKERS:
+            return settings.OCR_WORKERS
+        web_workers = 1 if settings.WORKER_ROLE == "ocr" else max(1, settings.WEB_WORKERS)
+        return max(1, (os.cpu_count() or 1) // web_workers)
+
+    @staticmethod
+    def executor() -> ThreadPoolExecutor:
+        """Shared OCR worker pool; Tesseract runs as a subprocess so threads scale across cores"""
+        if OCRScheduler._executor is None:
+            OCRScheduler._executor = ThreadPoolExecutor(
+                max_workers=OCRScheduler.capacity(),
+                thread_name_prefix="ocr"
+            )
+        return OCRScheduler._executor
+
+    @staticmethod
+    def running() -> int:
+        return OCRScheduler._running
+
+    @staticmethod
+    def shutdown():
+        """Stop the worker pool; threads still running finish in the background"""
+        if OCRScheduler._executor is not None:
+            OCRScheduler._executor.shutdown(wait=False, cancel_futures=True)
+            OCRScheduler._executor = None
+
+    @staticmethod
+    def queued(priority: Optional[str] = None) -> int:
+        priorities = [priority] if priority else OCRScheduler.PRIORITIES
+        return sum(
+            len(jobs)
+            for p in priorities
+            for jobs in OCRScheduler._queues[p].values()
+        )
+
+    @staticmethod
+    async def submit(func: Callable, *args, priority: str = "batch", operator: Optional[str] = None):
+        """Queue func(*args) for the worker pool and wait for its result"""
+        if priority not in OCRScheduler.PRIORITIES:
+            raise ValueError(f"Unknown OCR priority: {priority}")
+
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(func, args, priority, operator or "system", future)
+
+        queues = OCRScheduler._queues[priority]
+        if not queues:
+            # A class returning from idle must not bank credit for the time it was idle
+            active = [OCRScheduler._pass[p] for p in OCRScheduler.PRIORITIES if OCRScheduler.queued(p)]
+            if active:
+                OCRScheduler._pass[priority] = max(OCRScheduler._pass[priority], min(active))
+        queues.setdefault(job.operator, deque()).append(job)
+        OCR_SCHEDULER_QUEUED.inc(priority=priority)
+
+        OCRScheduler._dispatch()
+        return await future
+
+    @staticmethod
+    def _pop(priority: str, operator: str) -> _Job:
+        queues = OCRScheduler._queues[priority]
+        jobs = queues[operator]
+        job = jobs.popleft()
+        # Round-robin: the operator just served goes to the back
+        del queues[operator]
+        if jobs:
+            queues[operator] = jobs
+        OCR_SCHEDULER_QUEUED.dec(priority=priority)
+        return job
+
+    @staticmethod
+    def _next_job() -> Optional[_Job]:
+        now = time.monotonic()
+
+        # Aging: the oldest job past the threshold wins regardless of class
+        oldest = None
+        for priority in OCRScheduler.PRIORITIES:
+            for operator, jobs in OCRScheduler._queues[priority].items():
+                head = jobs[0]
+                if now - head.enqueued_at >= settings.OCR_AGING_SECONDS and \
+                        (oldest is None or head.enqueued_at < oldest.enqueued_at):
+                    oldest = head
+        if oldest is not None:
+            return OCRScheduler._pop(oldest.priority, oldest.operator)
+
+        # Weighted fair queuing across busy classes
+        busy = [p for p in OCRScheduler.PRIORITIES if OCRScheduler._queues[p]]
+        if not busy:
+            return None
+        priority = min(busy, key=lambda p: (OCRScheduler._pass[p], OCRScheduler.PRIORITIES.index(p)))
+        OCRScheduler._pass[priority] += 1.0 / settings.OCR_PRIORITY_WEIGHTS.get(priority, 1)
+        operator = next(iter(OCRScheduler._queues[priority]))
+        return OCRScheduler._pop(priority, operator)
+
+    @staticmethod
+    def _dispatch():
+        while OCRScheduler._running < OCRScheduler.capacity():
+            job = OCRScheduler._next_job()
+            if job is None:
+                return
+            OCRScheduler._running += 1
+            OCR_WAIT_TIME.observe(time.monotonic() - job.enqueued_at, priority=job.priority)
+            job.dispatched_ns = time.time_ns()
+            task = asyncio.get_running_loop().create_task(OCRScheduler._execute(job))
+            # Keep a reference so the task isn't garbage collected mid-flight
+            OCRScheduler._tasks.add(task)
+            task.add_done_callback(OCRScheduler._tasks.discard)
+
+    @staticmethod
+    def _run(job: _Job):
+        """Runs on a worker thread inside the submitter's context"""
+        tracing.record("ocr.queue_wait", job.enqueued_ns, job.dispatched_ns, priority=job.priority)
+        return job.func(*job.args)
+
+    @staticmethod
+    async def _execute(job: _Job):
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(OCRScheduler.executor(), job.context.run, OCRScheduler._run, job)
+            if not job.future.done():
+                job.future.set_result(result)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            OCRScheduler._running -= 1
+            OCRScheduler._dispatch()
@@ -1,19 +1,37 @@
-import pytesseract
-from PIL import Image, ImageEnhance, ImageOps
 import re
-from typing import Dict, Tuple, List
-import pdf2image
+import json
+import hashlib
+from typing import TYPE_CHECKING, Dict, Tuple, List, Optional
 import os
-from concurrent.futures import ThreadPoolExecutor
-import logging
 from ..core.config import get_settings
+from ..core.metrics import OCR_STAGE_DURATION
+from ..core import tracing
+from ..core.log import OCR_LOG, OCR_DEBUG, ocr_content
+from .ocr_scheduler import OCRScheduler
 import platform
 
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+
 settings = get_settings()
 
-pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+# pytesseract, NumPy and Pillow are imported on first use, so processes that
+# never run OCR (API-only workers) don't pay for loading them at startup
 
 class OCRService:
+    # Bump when _preprocess_image or result extraction changes behaviour;
+    # it feeds pipeline_version(), which keys the OCR result cache
+    PREPROCESS_VERSION = 3
+
+    # Skew is estimated on a copy at most this many px on its longer side, from at most this many dark pixels
+    SKEW_MAX_SIZE = 800
+    SKEW_MAX_POINTS = 20000
+
+    # pytesseract shlex-splits the config, so the whitelist is quoted to keep its space; without
+    # it Tesseract runs each line together into one zero-confidence word
+    TESSERACT_CONFIG = r'--oem 3 --psm 6 -c tessedit_char_whitelist="ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789:.-/ "'
+
     # Update patterns specifically for SoToxa format
     DRUG_PATTERNS = {
     "THC": [
@@ -38,10 +56,153 @@ class OCRService:
 
 
     @staticmethod
-    def _preprocess_image(image: Image.Image) -> Image.Image:
+    def _tesseract():
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = settings.TESSERACT_CMD
+        return pytesseract
+
+    @staticmethod
+    def pipeline_version() -> str:
+        """Fingerprint of everything that determines OCR output for a given scan"""
+        fingerprint = json.dumps({
+            "preprocess": OCRService.PREPROCESS_VERSION,
+            "patterns": OCRService.DRUG_PATTERNS,
+            "tesseract_config": OCRService.TESSERACT_CONFIG,
+            "confidence_threshold": settings.OCR_CONFIDENCE_THRESHOLD,
+            "deskew_max_angle": settings.OCR_DESKEW_MAX_ANGLE,
+            "binarization": [settings.OCR_BINARIZATION, settings.OCR_SAUVOLA_WINDOW, settings.OCR_SAUVOLA_K],
+        }, sort_keys=True)
+        return hashlib.sha256(fingerprint.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _otsu_threshold(pixels: "np.ndarray") -> Optional[int]:
+        """
+        Grey level maximising between-class variance of the histogram, None
+        when there is nothing to separate (a blank or uniform image)
+        """
+        import numpy as np
+        histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+        if np.count_nonzero(histogram) < 2:
+            return None
+        levels = np.arange(256)
+        weight = np.cumsum(histogram)
+        total = weight[-1]
+        cumulative_mean = np.cumsum(histogram * levels)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            between = (cumulative_mean[-1] * weight - total * cumulative_mean) ** 2 / (weight * (total - weight))
+        if np.isnan(between).all():
+            return None
+        return int(np.nanargmax(between))
+
+    @staticmethod
+    def _estimate_skew(image: "Image.Image") -> float:
+        """
+        Skew angle in degrees (clockwise on screen) from horizontal projection profiles. Printed
+        lines give the sharpest row histogram when projected at the true
+        angle, so the score is the sum of squared row-sum differences. The
+        Otsu mask is taken once, from a box-reduced copy of at most 800px,
+        and every projection reuses an evenly thinned sample of its dark
+        pixels: coarse 1 degree search, then 0.1 degree refine.
+        """
+        import numpy as np
+        max_angle = settings.OCR_DESKEW_MAX_ANGLE
+        factor = -(-max(image.size) // OCRService.SKEW_MAX_SIZE)
+        pixels = np.asarray(image.reduce(factor) if factor > 1 else image)
+        threshold = OCRService._otsu_threshold(pixels)
+        if threshold is None:
+            return 0.0
+        ys, xs = np.nonzero(pixels < threshold)
+        if len(xs) < 100:
+            return 0.0
+        step = -(-len(xs) // OCRService.SKEW_MAX_POINTS)
+        xs = xs[::step].astype(np.float64)
+        ys = ys[::step].astype(np.float64)
+        xs -= xs.mean()
+
+        def scores(angles: "np.ndarray") -> "np.ndarray":
+            result = np.empty(len(angles))
+            for i, angle in enumerate(angles):
+                rows = np.round(ys - xs * np.tan(np.radians(angle))).astype(np.int64)
+                profile = np.bincount(rows - rows.min())
+                result[i] = np.sum(np.diff(profile).astype(np.float64) ** 2)
+            return result
+
+        coarse = np.arange(-max_angle, max_angle + 0.5, 1.0)
+        best = coarse[np.argmax(scores(coarse))]
+        fine = np.arange(best - 1.0, best + 1.05, 0.1)
+        return float(fine[np.argmax(scores(fine))])
+
+    @staticmethod
+    def _deskew(image: "Image.Image") -> "Image.Image":
+        """Rotate a greyscale image so its text lines are horizontal"""
+        from PIL import Image
+        if settings.OCR_DESKEW_MAX_ANGLE <= 0:
+            return image
+        angle = OCRService._estimate_skew(image)
+        if abs(angle) < 0.2:
+            return image
+        # A line drifting down to the right has a positive angle in image coordinates;
+        # PIL rotates counter-clockwise for positive angles, which levels it
+        return image.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+
+    @staticmethod
+    def _binarize(image: "Image.Image") -> "Image.Image":
+        """
+        Black text on white: Sauvola's local threshold (robust to shadows and
+        thermal fade across a receipt) or a global Otsu threshold. Local mean
+        and deviation vary slowly, so they are computed from integral images
+        on a 4x box-reduced copy and the threshold map is upsampled. A 3x3
+        box blur first keeps sensor noise on a dim background from turning
+        into speckle that Tesseract reads as characters.
+        """
+        import numpy as np
+        from PIL import Image
+        method = settings.OCR_BINARIZATION
+        if method == "none":
+            return image
+        if method == "otsu":
+            pixels = np.asarray(image)
+            threshold = OCRService._otsu_threshold(pixels)
+            if threshold is None:
+                return image
+            return Image.fromarray(np.where(pixels > threshold, 255, 0).astype(np.uint8))
+
+        # Separable 3x3 box sum in uint16; about twice as fast as ImageFilter.BoxBlur(1)
+        padded = np.pad(np.asarray(image), 1, mode="edge").astype(np.uint16)
+        rows = padded[:-2] + padded[1:-1] + padded[2:]
+        pixels = ((rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:] + 4) // 9).astype(np.uint8)
+        image = Image.fromarray(pixels)
+        factor = 4
+        half = max(settings.OCR_SAUVOLA_WINDOW // (2 * factor), 1)
+        size = 2 * half + 1
+        means = np.asarray(image.reduce(factor), dtype=np.float64)
+        squares = pixels.astype(np.float32)
+        np.multiply(squares, squares, out=squares)
+        squares = np.asarray(Image.fromarray(squares, "F").reduce(factor), dtype=np.float64)
+
+        def window_mean(values: np.ndarray) -> np.ndarray:
+            height, width = values.shape
+            table = np.pad(values, half + 1, mode="edge").cumsum(0).cumsum(1)
+            return (table[size:size + height, size:size + width] - table[:height, size:size + width]
+                    - table[size:size + height, :width] + table[:height, :width]) / (size * size)
+
+        mean = window_mean(means)
+        std = np.sqrt(np.maximum(window_mean(squares) - mean ** 2, 0))
+        threshold = mean * (1 + settings.OCR_SAUVOLA_K * (std / 128.0 - 1))
+        # Pixels are integers, so p > t and p > floor(t) agree and the map can be upsampled as 8-bit
+        threshold = Image.fromarray(np.clip(threshold, 0, 255).astype(np.uint8))
+        threshold = np.asarray(threshold.resize(image.size, Image.Resampling.BILINEAR))
+        return Image.fromarray((pixels > threshold) * np.uint8(255))
+
+    @staticmethod
+    def _preprocess_image(image: "Image.Image") -> "Image.Image":
         """Enhanced preprocessing for SoToxa prints"""
+        from PIL import Image, ImageEnhance, ImageOps
         # Convert to grayscale
         image = image.convert('L')
+
+        # Straighten skewed phone photos before anything resamples the image
+        image = OCRService._deskew(image)
         
         # Auto-level the image
         image = ImageOps.autocontrast(image, cutoff=2)
@@ -63,6 +224,9 @@ class OCRService:
             ratio = 1500.0 / min(image.width, image.height)
             new_size = (int(image.width * ratio), int(image.height * ratio))
             image = image.resize(new_size, Image.Resampling.LANCZOS)
+
+        # Threshold last, at the resolution Tesseract will see
+        image = OCRService._binarize(image)
         
         return image
 
@@ -73,7 +237,7 @@ class OCRService:
         for pattern in patterns:
             match = re.search(pattern, text, re.IGNORECASE)
             if match:
-                result = matches[0].strip().upper()
+                result = match.group(1).strip().upper()
                 # Normalize results
                 if result in ['POS', 'POSITIVE']:
                     return 'Positive'
@@ -102,27 +266,39 @@ class OCRService:
         return len(valid_results) > 0
 
     @staticmethod
-    async def process_image(image_path: str) -> Tuple[str, Dict[str, str], float]:
+    async def process_image(image_path: str, priority: str = "interactive",
+                            operator: Optional[str] = None) -> Tuple[str, Dict[str, str], float]:
+        """Process image with OCR on the worker pool, scheduled by priority class"""
+        with tracing.span("ocr.process_image", priority=priority):
+            return await OCRScheduler.submit(
+                OCRService.process_image_sync,
+                image_path,
+                priority=priority,
+                operator=operator
+            )
+
+    @staticmethod
+    def process_image_sync(image_path: str) -> Tuple[str, Dict[str, str], float]:
         """Process image with OCR and extract drug test results"""
+        from PIL import Image
+        pytesseract = OCRService._tesseract()
+        # Details for a sample of scans only; the caller logs one summary per scan
+        debug = OCR_DEBUG.sample()
         try:
             # Load and preprocess image
-            image = Image.open(image_path)
-            processed_image = OCRService._preprocess_image(image)
-            
-            # Save preprocessed image for debugging
-            debug_path = image_path + "_processed.jpg"
-            processed_image.save(debug_path)
-            logging.info(f"Saved preprocessed image to: {debug_path}")
-
-            # Configure tesseract
-            custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789:.-/ '
+            with OCR_STAGE_DURATION.time(stage="load"), tracing.span("ocr.load"):
+                image = Image.open(image_path)
+                image.load()
+            with OCR_STAGE_DURATION.time(stage="preprocess"), tracing.span("ocr.preprocess"):
+                processed_image = OCRService._preprocess_image(image)
 
             # Perform OCR
-            ocr_result = pytesseract.image_to_data(
-                processed_image,
-                output_type=pytesseract.Output.DICT,
-                config=custom_config
-            )
+            with OCR_STAGE_DURATION.time(stage="tesseract"), tracing.span("ocr.tesseract"):
+                ocr_result = pytesseract.image_to_data(
+                    processed_image,
+                    output_type=pytesseract.Output.DICT,
+                    config=OCRService.TESSERACT_CONFIG
+                )
 
             # Extract text with confidence
             text_with_conf = [(text, float(conf)) 
@@ -133,25 +309,36 @@ class OCRService:
             full_text = " ".join(text for text, _ in text_with_conf)
             full_text = OCRService._clean_text(full_text)
 
-            # Log raw OCR output
-            logging.info(f"Raw OCR text:\n{full_text}")
-            
             # Calculate confidence
             confidences = [conf for _, conf in text_with_conf]
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
             # Extract results
-            structured_data = {}
-            for drug, patterns in OCRService.DRUG_PATTERNS.items():
-                result = OCRService._extract_result(full_text, patterns)
-                structured_data[drug] = result
-                logging.info(f"Drug {drug}: Pattern match attempt on text: '{full_text}'")
-                logging.info(f"Drug {drug}: Result: '{result}'")
+            with OCR_STAGE_DURATION.time(stage="extraction"), tracing.span("ocr.extraction"):
+                structured_data = {}
+                for drug, patterns in OCRService.DRUG_PATTERNS.items():
+                    result = OCRService._extract_result(full_text, patterns)
+                    structured_data[drug] = result
+
+            if debug:
+                # Save preprocessed image for debugging
+                debug_path = image_path + "_processed.jpg"
+                with tracing.span("ocr.debug_save"):
+                    processed_image.save(debug_path)
+                OCR_DEBUG.logger.debug("OCR scan details", extra={
+                    "image": image_path,
+                    "processed_image": debug_path,
+                    "processed_size": processed_image.size,
+                    "words": len(ocr_result["text"]),
+                    "words_kept": len(text_with_conf),
+                    "confidence": avg_confidence,
+                    **ocr_content(full_text, structured_data),
+                })
 
             return full_text, structured_data, avg_confidence
 
         except Exception as e:
-            logging.error(f"OCR processing failed for {image_path}: {str(e)}")
+            OCR_LOG.warning("OCR processing failed for %s: %s", image_path, e)
             raise
 
 
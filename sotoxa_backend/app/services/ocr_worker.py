@@ -0,0 +1,108 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from pymongo import ReturnDocument
+from ..db.mongodb import db
+from ..core.config import get_settings
+from .ocr_queue import OCRQueue
+from .ocr_scheduler import OCRScheduler
+from .image_service import ImageService
+
+settings = get_settings()
+
+
+class OCRWorker:
+    """
+    OCR for deployments split into API and OCR roles. API workers store
+    uploads as pending; OCR workers claim pending tests with a lease, run
+    the same OCR and derivative pipeline the in-process queue uses, and let
+    a lease expire back to the pool if the worker dies mid-job. Interactive
+    uploads are claimed before batch ones.
+    """
+    CLAIM_ORDER = ("interactive", "batch")
+    PROJECTION = {
+        "scan_file_url": 1, "hash": 1, "operator.id": 1, "ocr_priority": 1, "derivatives": 1,
+        "trace_id": 1, "trace_parent_id": 1, "uploaded_at": 1,
+    }
+    # Claiming writes only these, without bumping the drug_tests watermark,
+    # so responses revalidated by that watermark must leave them out
+    LEASE_FIELDS = ("ocr_lease_until", "ocr_worker")
+
+    @staticmethod
+    async def claim(worker_id: str) -> Optional[Dict]:
+        now = datetime.utcnow()
+        lease = {
+            "processing_status": "pending",
+            "archived": {"$ne": True},
+            "$or": [{"ocr_lease_until": {"$exists": False}}, {"ocr_lease_until": {"$lt": now}}],
+        }
+        for priority in OCRWorker.CLAIM_ORDER:
+            # Records from before worker roles have no ocr_priority; treat them as interactive
+            query = dict(lease, ocr_priority=priority if priority != "interactive" else {"$in": [priority, None]})
+            claimed = await db.collection("drug_tests", "ocr").find_one_and_update(
+                query,
+                {"$set": {
+                    "ocr_lease_until": now + timedelta(seconds=settings.OCR_WORKER_LEASE_SECONDS),
+                    "ocr_worker": worker_id,
+                }},
+                projection=OCRWorker.PROJECTION,
+                sort=[("uploaded_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if claimed:
+                return claimed
+        return None
+
+    @staticmethod
+    async def process(test: Dict):
+        test_id = str(test["_id"])
+        priority = test.get("ocr_priority") or "interactive"
+        # The job was queued when the API worker stored it
+        uploaded_at = test.get("uploaded_at")
+        enqueued_ns = int(uploaded_at.replace(tzinfo=timezone.utc).timestamp() * 1e9) if uploaded_at else None
+        await OCRQueue._process_and_update(
+            test["scan_file_url"],
+            test_id,
+            file_hash=test["hash"],
+            priority=priority if priority in OCRScheduler.PRIORITIES else "batch",
+            operator=(test.get("operator") or {}).get("id"),
+            trace_id=test.get("trace_id"),
+            trace_parent_id=test.get("trace_parent_id"),
+            enqueued_ns=enqueued_ns
+        )
+        if "scan" not in (test.get("derivatives") or {}):
+            await ImageService.process_test_images(test_id, "scan", test["scan_file_url"], test["hash"])
+
+    @staticmethod
+    async def _slot(worker_id: str, stop: asyncio.Event):
+        while not stop.is_set():
+            try:
+                test = await OCRWorker.claim(worker_id)
+            except Exception as e:
+                logging.error(f"OCR worker {worker_id} failed to claim a job: {str(e)}")
+                test = None
+            if test is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), settings.OCR_WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            OCRQueue.depth += 1
+            try:
+                await OCRWorker.process(test)
+            except Exception as e:
+                # Keep the slot alive; the job goes back to the pool when its lease expires
+                logging.error(f"OCR worker {worker_id} failed to process test {test['_id']}: {str(e)}")
+            finally:
+                OCRQueue.depth -= 1
+
+    @staticmethod
+    async def run(stop: asyncio.Event, concurrency: Optional[int] = None):
+        """Claim and process jobs until stop is set; in-flight jobs finish before returning"""
+        worker_id = f"{os.uname().nodename if hasattr(os, 'uname') else 'host'}:{os.getpid()}"
+        concurrency = concurrency or OCRScheduler.capacity()
+        logging.info(f"OCR worker {worker_id} started with {concurrency} slots")
+        await asyncio.gather(*(OCRWorker._slot(worker_id, stop) for _ in range(concurrency)))
+        logging.info(f"OCR worker {worker_id} stopped")
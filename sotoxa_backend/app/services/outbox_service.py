@@ -0,0 +1,229 @@
+import base64
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+from ..db.mongodb import db
+from ..core.config import get_settings
+from .lock_service import LockService
+
+settings = get_settings()
+
+
+class OutboxService:
+    """
+    Change feed for downstream systems. Every write path publishes its events
+    here, numbered from a single counter, and consumers page through them in
+    sequence order with an opaque resume token instead of polling the test
+    list. Events expire after OUTBOX_RETENTION_DAYS (TTL index on created_at);
+    a token older than that is rejected so the consumer knows to resync.
+
+    Publishing happens after the test write, so the write also stores a
+    pending copy of its event on the test (outbox_pending) and publish()
+    removes it. Events whose publish failed stay pending and the sweeper
+    publishes them later; a unique event_id keeps a late duplicate out.
+    """
+    COLLECTION = "change_events"
+    COUNTER_ID = "change_events"
+    PENDING_FIELD = "outbox_pending"
+    SWEEP_LOCK = "outbox_sweep"
+    EVENT_TYPES = (
+        "test.uploaded",
+        "test.ocr_completed",
+        "test.ocr_failed",
+        "test.metadata_updated",
+        "test.archived",
+    )
+
+    _sweeper: Optional[asyncio.Task] = None
+    _stop: Optional[asyncio.Event] = None
+
+    @staticmethod
+    def event(event_type: str, test_id, person_id: Optional[str] = None, data: Optional[Dict] = None) -> Dict:
+        return {
+            "event_id": ObjectId(),
+            "type": event_type,
+            "test_id": test_id,
+            "person_id": person_id,
+            "data": data or {},
+        }
+
+    @staticmethod
+    def pending(event: Dict) -> Dict:
+        """The copy of an event that the write causing it stores on the test"""
+        return {
+            "event_id": event["event_id"],
+            "type": event["type"],
+            "person_id": event["person_id"],
+            "data": event["data"],
+            "created_at": datetime.utcnow(),
+        }
+
+    @staticmethod
+    def with_pending(update: Dict, event: Dict) -> Dict:
+        """Add an event's pending copy to an update document"""
+        update.setdefault("$push", {})[OutboxService.PENDING_FIELD] = OutboxService.pending(event)
+        return update
+
+    @staticmethod
+    async def publish(events: List[Dict]) -> bool:
+        """
+        Number and store a batch of events, then clear their pending copies.
+        Never fails the write they follow: on error the copies stay for the
+        sweeper and False is returned.
+        """
+        if not events:
+            return True
+        try:
+            # One counter round trip reserves the whole batch's sequence range
+            counter = await db.db["counters"].find_one_and_update(
+                {"_id": OutboxService.COUNTER_ID},
+                {"$inc": {"seq": len(events)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            first = counter["seq"] - len(events) + 1
+            now = datetime.utcnow()
+            try:
+                await db.collection(OutboxService.COLLECTION, "ingest").insert_many([
+                    dict(event, _id=first + offset, created_at=now)
+                    for offset, event in enumerate(events)
+                ], ordered=False)
+            except BulkWriteError as e:
+                # A duplicate event_id was published by a concurrent sweep; its
+                # reserved sequence number is left as a gap, which readers skip
+                if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+            await db.collection("drug_tests", "metadata").update_many(
+                {"_id": {"$in": list({event["test_id"] for event in events})}},
+                {"$pull": {OutboxService.PENDING_FIELD: {
+                    "event_id": {"$in": [event["event_id"] for event in events]}
+                }}}
+            )
+            return True
+        except Exception as e:
+            logging.error(f"Failed to publish {len(events)} change events, leaving them to the sweeper: {str(e)}")
+            return False
+
+    @staticmethod
+    async def sweep(batch_size: int = 500) -> int:
+        """Publish events still pending OUTBOX_SWEEP_AFTER seconds after their write; returns how many"""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.OUTBOX_SWEEP_AFTER)
+        field = OutboxService.PENDING_FIELD
+        cursor = db.collection("drug_tests", "metadata").find(
+            {f"{field}.created_at": {"$lte": cutoff}},
+            {field: 1, "person_id": 1}
+        ).limit(batch_size)
+
+        stranded = []
+        async for test in cursor:
+            for entry in test[field]:
+                if entry["created_at"] <= cutoff:
+                    stranded.append((entry["created_at"], {
+                        "event_id": entry["event_id"],
+                        "type": entry["type"],
+                        "test_id": test["_id"],
+                        "person_id": entry.get("person_id") or test.get("person_id"),
+                        "data": entry["data"],
+                    }))
+        # Publish in the order the writes happened
+        stranded.sort(key=lambda item: item[0])
+        events = [event for _, event in stranded]
+        if not await OutboxService.publish(events):
+            return 0
+        if events:
+            logging.warning(f"Published {len(events)} change events left pending by failed publishes")
+        return len(events)
+
+    @staticmethod
+    async def run_sweeper(stop: asyncio.Event):
+        """Sweep every OUTBOX_SWEEP_INTERVAL seconds until stop is set; one process sweeps at a time"""
+        while not stop.is_set():
+            try:
+                async with LockService.hold(OutboxService.SWEEP_LOCK, settings.OUTBOX_SWEEP_INTERVAL * 2) as acquired:
+                    if acquired:
+                        await OutboxService.sweep()
+            except Exception as e:
+                logging.error(f"Outbox sweep failed: {str(e)}")
+            try:
+                await asyncio.wait_for(stop.wait(), settings.OUTBOX_SWEEP_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def start_sweeper():
+        if OutboxService._sweeper is None and settings.OUTBOX_SWEEP_INTERVAL > 0:
+            OutboxService._stop = asyncio.Event()
+            OutboxService._sweeper = asyncio.get_running_loop().create_task(
+                OutboxService.run_sweeper(OutboxService._stop)
+            )
+
+    @staticmethod
+    async def stop_sweeper():
+        if OutboxService._sweeper is not None:
+            OutboxService._stop.set()
+            await OutboxService._sweeper
+            OutboxService._sweeper = None
+
+    @staticmethod
+    def encode_token(seq: int) -> str:
+        return base64.urlsafe_b64encode(f"seq:{seq}".encode()).decode()
+
+    @staticmethod
+    def decode_token(token: str) -> int:
+        """Raises ValueError for a malformed token"""
+        try:
+            prefix, seq = base64.urlsafe_b64decode(token.encode()).decode().split(":")
+            if prefix != "seq" or int(seq) < 0:
+                raise ValueError
+            return int(seq)
+        except Exception:
+            raise ValueError("Invalid resume token")
+
+    @staticmethod
+    async def read(token: Optional[str], limit: int, types: Optional[List[str]] = None) -> Dict:
+        """
+        Events after the token, oldest first. Without a token the feed replays
+        from the oldest retained event. Raises LookupError when the token
+        points before the retained window.
+        """
+        after = OutboxService.decode_token(token) if token else 0
+        events = db.db[OutboxService.COLLECTION]
+
+        if after:
+            oldest = await events.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+            if oldest is not None and oldest["_id"] > after + 1:
+                raise LookupError("Resume token has expired; resync from the test list")
+
+        query: Dict = {"_id": {"$gt": after}}
+        batch = await events.find(query).sort("_id", 1).limit(limit + 1).to_list(length=None)
+
+        # Sequence numbers are reserved before the insert lands, so a younger
+        # event can be visible while an older one is still in flight. Stop at
+        # a recent gap rather than move the token past an event not yet written.
+        settle = datetime.utcnow() - timedelta(seconds=settings.OUTBOX_SETTLE_SECONDS)
+        visible = []
+        expected = after + 1
+        for event in batch:
+            if event["_id"] != expected and event["created_at"] > settle:
+                break
+            visible.append(event)
+            expected = event["_id"] + 1
+
+        has_more = len(visible) > limit or len(visible) < len(batch)
+        visible = visible[:limit]
+        last_seq = visible[-1]["_id"] if visible else after
+        # Filtered after paging so the token still advances past skipped types
+        if types:
+            visible = [event for event in visible if event["type"] in types]
+        for event in visible:
+            event["seq"] = event.pop("_id")
+
+        return {
+            "events": visible,
+            "next_token": OutboxService.encode_token(last_seq),
+            "has_more": has_more,
+        }
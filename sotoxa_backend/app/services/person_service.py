@@ -0,0 +1,165 @@
+import base64
+import logging
+import asyncio
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from ..db.mongodb import db
+
+
+class PersonService:
+    """
+    Person timelines. History pages are read from the (person_id,
+    test_timestamp, _id) index with keyset pagination; the per-person
+    summary lives in person_summaries and is rebuilt for a person whenever
+    one of their tests is written, so reads never aggregate.
+    """
+    SUMMARY_COLLECTION = "person_summaries"
+    HISTORY_PROJECTION = {
+        "test_timestamp": 1,
+        "processing_status": 1,
+        "ocr_data": 1,
+        "ocr_confidence": 1,
+        "operator.name": 1,
+        "derivatives.scan.thumb": 1,
+    }
+    SUMMARY_PROJECTION = {"test_timestamp": 1, "processing_status": 1, "ocr_data": 1}
+
+    @staticmethod
+    def encode_cursor(test_timestamp: datetime, test_id: ObjectId) -> str:
+        raw = f"{test_timestamp.isoformat()}|{test_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+        """Raises ValueError for a malformed cursor"""
+        try:
+            timestamp, test_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+            return datetime.fromisoformat(timestamp), ObjectId(test_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    async def history(person_id: str, limit: int, cursor: Optional[str] = None) -> Dict:
+        """One page of a person's tests, newest first, alongside their summary"""
+        query: Dict = {"person_id": person_id}
+        if cursor:
+            timestamp, test_id = PersonService.decode_cursor(cursor)
+            query["$or"] = [
+                {"test_timestamp": {"$lt": timestamp}},
+                {"test_timestamp": timestamp, "_id": {"$lt": test_id}},
+            ]
+
+        find = db.db["drug_tests"].find(query, PersonService.HISTORY_PROJECTION) \
+            .sort([("test_timestamp", -1), ("_id", -1)]) \
+            .limit(limit + 1)
+        items, summary = await asyncio.gather(
+            find.to_list(length=None),
+            db.db[PersonService.SUMMARY_COLLECTION].find_one({"_id": person_id}, {"_id": 0, "version": 0})
+        )
+
+        if summary is None and items:
+            # Records written before summaries existed: build it once, on first view
+            await PersonService.refresh_summary(person_id)
+            summary = await db.db[PersonService.SUMMARY_COLLECTION].find_one({"_id": person_id}, {"_id": 0, "version": 0})
+
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = PersonService.encode_cursor(items[-1]["test_timestamp"], items[-1]["_id"])
+
+        return {
+            "person_id": person_id,
+            "summary": summary,
+            "items": items,
+            "next_cursor": next_cursor,
+        }
+
+    @staticmethod
+    def summarize(person_id: str, tests: List[Dict]) -> Dict:
+        """Build a person summary from their tests, given newest first"""
+        drug_counts: Dict[str, Dict[str, int]] = {}
+        last_positive = None
+        completed = 0
+
+        for test in tests:
+            if test.get("processing_status") != "completed":
+                continue
+            completed += 1
+            positives = []
+            for drug, result in (test.get("ocr_data") or {}).items():
+                if result not in ("Positive", "Negative"):
+                    continue
+                counts = drug_counts.setdefault(drug, {"positive": 0, "negative": 0})
+                counts[result.lower()] += 1
+                if result == "Positive":
+                    positives.append(drug)
+            if positives and last_positive is None:
+                last_positive = {
+                    "test_id": str(test["_id"]),
+                    "test_timestamp": test.get("test_timestamp"),
+                    "drugs": positives,
+                }
+
+        return {
+            "_id": person_id,
+            "total_tests": len(tests),
+            "completed_tests": completed,
+            "first_test_at": tests[-1].get("test_timestamp") if tests else None,
+            "last_test_at": tests[0].get("test_timestamp") if tests else None,
+            "last_positive": last_positive,
+            "drug_counts": drug_counts,
+            "updated_at": datetime.utcnow(),
+        }
+
+    @staticmethod
+    async def refresh_summary(person_id: Optional[str]):
+        """
+        Rebuild one person's summary from their tests via the person index.
+        Concurrent refreshes can read the tests in one order and write in the
+        other, so each write is a compare-and-set on the summary's version,
+        read before the tests: a refresh that lost the race reads again.
+
+        This is a full rebuild, O(the person's tests) per call, rather than
+        $inc deltas: reassignment, reprocessing and archiving can take away
+        a person's last positive or first test, which a delta cannot undo.
+        """
+        if not person_id:
+            return
+        summaries = db.collection(PersonService.SUMMARY_COLLECTION, "metadata")
+        for _ in range(2):
+            current = await summaries.find_one({"_id": person_id}, {"version": 1})
+            tests = await db.db["drug_tests"].find(
+                {"person_id": person_id},
+                PersonService.SUMMARY_PROJECTION
+            ).sort([("test_timestamp", -1), ("_id", -1)]).to_list(length=None)
+
+            # A person whose tests are all gone keeps an empty summary rather than
+            # none, so a slower refresh that still saw tests cannot recreate it
+            summary = PersonService.summarize(person_id, tests)
+            if current is None:
+                summary["version"] = 1
+                try:
+                    await summaries.insert_one(summary)
+                    return
+                except DuplicateKeyError:
+                    continue
+            # Summaries written before versioning have no version field, which None matches
+            version = current.get("version")
+            summary["version"] = (version or 0) + 1
+            result = await summaries.replace_one({"_id": person_id, "version": version}, summary)
+            if result.matched_count:
+                return
+        # Lost twice: the version read on the second attempt was written after the
+        # first attempt began, so whoever replaced it read the tests later still
+        # and its summary already includes the write that triggered this refresh
+
+    @staticmethod
+    async def refresh_summaries(person_ids: Iterable[Optional[str]]):
+        """Refresh several summaries; failures are logged, never raised to the writer"""
+        for person_id in {p for p in person_ids if p}:
+            try:
+                await PersonService.refresh_summary(person_id)
+            except Exception as e:
+                logging.error(f"Failed to refresh summary for person {person_id}: {str(e)}")
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from ..db.mongodb import db
+from ..models.drug_test import ReprocessRequest
+from .ocr_service import OCRService
+from .ocr_cache import OCRCache
+from .ocr_queue import OCRQueue
+from .person_service import PersonService
+from .watermark_service import WatermarkService
+from .outbox_service import OutboxService
+from .trace_service import TraceService
+
+
+class ReprocessService:
+    """
+    Re-runs OCR over stored drug tests in resumable, rate-limited batches.
+    Progress is checkpointed in reprocess_jobs after every batch, keyed on the
+    last processed _id, so an interrupted job continues where it stopped.
+    """
+    JOBS_COLLECTION = "reprocess_jobs"
+    DIFF_SAMPLE_SIZE = 100
+    PROJECTION = {
+        "scan_file_url": 1,
+        "hash": 1,
+        "ocr_data": 1,
+        "ocr_confidence": 1,
+        "processing_status": 1,
+        "person_id": 1,
+    }
+
+    @staticmethod
+    def build_query(request: ReprocessRequest) -> Dict:
+        # Archived stubs have no scan in hot storage to re-read
+        query = {"archived": {"$ne": True}}
+        if request.processing_status:
+            query["processing_status"] = request.processing_status
+        if request.max_confidence is not None:
+            query["ocr_confidence"] = {"$lte": request.max_confidence}
+        if request.date_from or request.date_to:
+            query["test_timestamp"] = {}
+            if request.date_from:
+                query["test_timestamp"]["$gte"] = request.date_from
+            if request.date_to:
+                query["test_timestamp"]["$lte"] = request.date_to
+        if request.stale_only:
+            query["ocr_pipeline_version"] = {"$ne": OCRService.pipeline_version()}
+        return query
+
+    @staticmethod
+    async def start(request: ReprocessRequest) -> Dict:
+        """Create a job, or load an existing one when request.job_id is set"""
+        jobs = db.db[ReprocessService.JOBS_COLLECTION]
+        if request.job_id:
+            job = await jobs.find_one({"_id": request.job_id})
+            if not job:
+                raise ValueError(f"Reprocess job {request.job_id} not found")
+            return job
+
+        job = {
+            "_id": str(ObjectId()),
+            "params": request.model_dump(exclude={"job_id"}),
+            "pipeline_version": OCRService.pipeline_version(),
+            "status": "pending",
+            "last_id": None,
+            "scanned": 0,
+            "changed": 0,
+            "unchanged": 0,
+            "unresolved": 0,
+            "failed": 0,
+            "written": 0,
+            "transitions": {},
+            "diff_samples": [],
+            "created_at": datetime.utcnow(),
+            "updated_at": datetime.utcnow(),
+        }
+        await jobs.insert_one(job)
+        return job
+
+    @staticmethod
+    async def get_job(job_id: str) -> Optional[Dict]:
+        return await db.db[ReprocessService.JOBS_COLLECTION].find_one({"_id": job_id})
+
+    @staticmethod
+    async def _ocr(record: Dict, delay: float) -> Dict:
+        """OCR one record after its rate-limit delay and diff it against the stored result"""
+        await asyncio.sleep(delay)
+        outcome = {"_id": record["_id"], "person_id": record.get("person_id")}
+        try:
+            async with TraceService.trace("ocr.reprocess", test_id=str(record["_id"]), priority="reprocess"):
+                cached = await OCRCache.get(record.get("hash"))
+                if cached:
+                    ocr_text, ocr_data, confidence = cached
+                else:
+                    ocr_text, ocr_data, confidence = await OCRQueue.ocr_stored_file(record["scan_file_url"], priority="reprocess")
+                    if OCRService._validate_results(ocr_data):
+                        await OCRCache.put(record.get("hash"), ocr_text, ocr_data, confidence)
+        except Exception as e:
+            outcome["error"] = str(e)
+            return outcome
+
+        old_data = record.get("ocr_data") or {}
+        outcome.update({
+            "valid": OCRService._validate_results(ocr_data),
+            "ocr_text": ocr_text,
+            "ocr_data": ocr_data,
+            "ocr_confidence": confidence,
+            "changes": {
+                drug: [old_data.get(drug, "Not Found"), result]
+                for drug, result in ocr_data.items()
+                if old_data.get(drug, "Not Found") != result
+            },
+            "confidence_delta": confidence - (record.get("ocr_confidence") or 0.0),
+        })
+        return outcome
+
+    @staticmethod
+    async def _process_batch(records: List[Dict], rate_per_second: float, dry_run: bool) -> Dict:
+        # Stagger job starts to honour the rate; the scheduler runs them at the
+        # lowest priority so live uploads are never stuck behind a reprocess
+        interval = 1.0 / rate_per_second
+        outcomes = await asyncio.gather(
+            *(ReprocessService._ocr(record, i * interval) for i, record in enumerate(records))
+        )
+
+        counters = {"scanned": len(records), "changed": 0, "unchanged": 0, "unresolved": 0, "failed": 0, "written": 0}
+        transitions: Dict[str, int] = {}
+        samples = []
+        operations = []
+        events = []
+        now = datetime.utcnow()
+        pipeline_version = OCRService.pipeline_version()
+
+        for outcome in outcomes:
+            if "error" in outcome:
+                counters["failed"] += 1
+                samples.append({"_id": str(outcome["_id"]), "error": outcome["error"]})
+                continue
+            if not outcome["valid"]:
+                # Never replace a stored result with an unreadable one
+                counters["unresolved"] += 1
+                continue
+
+            if outcome["changes"]:
+                counters["changed"] += 1
+                for drug, (old, new) in outcome["changes"].items():
+                    key = f"transitions.{drug}.{old}->{new}"
+                    transitions[key] = transitions.get(key, 0) + 1
+                samples.append({
+                    "_id": str(outcome["_id"]),
+                    "changes": outcome["changes"],
+                    "confidence_delta": round(outcome["confidence_delta"], 2)
+                })
+            else:
+                counters["unchanged"] += 1
+
+            update = {"$set": {
+                "ocr_text": outcome["ocr_text"],
+                "ocr_data": outcome["ocr_data"],
+                "ocr_confidence": outcome["ocr_confidence"],
+                "processing_status": "completed",
+                "processing_error": None,
+                "ocr_pipeline_version": pipeline_version,
+                "reprocessed_at": now
+            }}
+            # Only results that actually changed are news to downstream systems
+            if outcome["changes"]:
+                event = OutboxService.event(
+                    "test.ocr_completed",
+                    outcome["_id"],
+                    outcome.get("person_id"),
+                    {"ocr_data": outcome["ocr_data"], "ocr_confidence": outcome["ocr_confidence"], "reprocessed": True}
+                )
+                OutboxService.with_pending(update, event)
+                events.append(event)
+            operations.append(UpdateOne({"_id": outcome["_id"]}, update))
+
+        if operations and not dry_run:
+            result = await db.collection("drug_tests", "ocr").bulk_write(operations, ordered=False)
+            counters["written"] = result.modified_count
+            await WatermarkService.bump("drug_tests")
+            await OutboxService.publish(events)
+            await PersonService.refresh_summaries(
+                outcome["person_id"] for outcome in outcomes if outcome.get("changes")
+            )
+
+        return {"counters": counters, "transitions": transitions, "samples": samples}
+
+    @staticmethod
+    async def run(job_id: str) -> Dict:
+        """Process a job to completion, checkpointing after every batch"""
+        jobs = db.db[ReprocessService.JOBS_COLLECTION]
+        job = await jobs.find_one({"_id": job_id})
+        if not job or job["status"] == "completed":
+            return job
+
+        request = ReprocessRequest(**job["params"])
+        query = ReprocessService.build_query(request)
+        last_id = job.get("last_id")
+        await jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "updated_at": datetime.utcnow()}})
+
+        try:
+            while True:
+                batch_query = dict(query)
+                if last_id is not None:
+                    batch_query["_id"] = {"$gt": last_id}
+                cursor = db.collection("drug_tests", "analytics").find(batch_query, ReprocessService.PROJECTION)
+                records = await cursor.sort("_id", 1).limit(request.batch_size).to_list(length=None)
+                if not records:
+                    break
+
+                batch = await ReprocessService._process_batch(records, request.rate_per_second, request.dry_run)
+                last_id = records[-1]["_id"]
+                await jobs.update_one(
+                    {"_id": job_id},
+                    {
+                        "$set": {"last_id": last_id, "updated_at": datetime.utcnow()},
+                        "$inc": {**batch["counters"], **batch["transitions"]},
+                        "$push": {"diff_samples": {
+                            "$each": batch["samples"],
+                            "$slice": ReprocessService.DIFF_SAMPLE_SIZE
+                        }}
+                    }
+                )
+                logging.info(f"Reprocess job {job_id}: batch of {len(records)} done, last_id={last_id}")
+
+            await jobs.update_one(
+                {"_id": job_id},
+                {"$set": {"status": "completed", "completed_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            logging.error(f"Reprocess job {job_id} stopped: {str(e)}")
+            await jobs.update_one(
+                {"_id": job_id},
+                {"$set": {"status": "interrupted", "error": str(e), "updated_at": datetime.utcnow()}}
+            )
+
+        return await jobs.find_one({"_id": job_id})
@@ -0,0 +1,210 @@
+import os
+import time
+import logging
+from calendar import monthrange
+from datetime import datetime
+from typing import Dict, List, Optional
+from pymongo import ReplaceOne
+from ..db.mongodb import db
+from ..core.config import get_settings
+from .storage import get_storage, get_cold_storage, LocalStorage
+from .watermark_service import WatermarkService
+from .outbox_service import OutboxService
+
+settings = get_settings()
+
+DEBUG_SUFFIX = "_processed.jpg"
+
+
+def months_ago(now: datetime, months: int) -> datetime:
+    """Same day and time `months` calendar months earlier, clamped to the month's length"""
+    month_index = now.year * 12 + now.month - 1 - months
+    year, month = divmod(month_index, 12)
+    day = min(now.day, monthrange(year, month + 1)[1])
+    return now.replace(year=year, month=month + 1, day=day)
+
+
+class RetentionService:
+    """
+    Moves old drug tests out of the working set. Full records go to
+    drug_tests_archive and their blobs to cold storage; drug_tests keeps a
+    stub with the fields timelines, dashboards and dedup need. Each step is
+    idempotent and ordered copy -> archive -> stub -> delete, so an
+    interrupted run is safe to repeat.
+    """
+    ARCHIVE_COLLECTION = "drug_tests_archive"
+    STUB_FIELDS = (
+        "person_id", "operator", "test_timestamp", "uploaded_at", "hash",
+        "processing_status", "ocr_data", "ocr_confidence",
+    )
+
+    @staticmethod
+    def build_query(now: Optional[datetime] = None) -> Optional[Dict]:
+        """Records due for archival under RETENTION_POLICIES; None if every policy is disabled"""
+        now = now or datetime.utcnow()
+        policies = dict(settings.RETENTION_POLICIES)
+        default_months = policies.pop("default", 0)
+
+        clauses = [
+            {"processing_status": status, "test_timestamp": {"$lt": months_ago(now, months)}}
+            for status, months in policies.items()
+            if months > 0
+        ]
+        if default_months > 0:
+            clauses.append({
+                "processing_status": {"$nin": list(policies)},
+                "test_timestamp": {"$lt": months_ago(now, default_months)}
+            })
+        if not clauses:
+            return None
+        return {"archived": {"$ne": True}, "$or": clauses}
+
+    @staticmethod
+    async def _archive_blob(location: Optional[str]) -> Optional[str]:
+        """Copy a hot blob to cold storage, returning its cold location"""
+        if not location:
+            return None
+        cold = get_cold_storage()
+        key = location.rsplit("/", 1)[-1]
+        if not await cold.exists(key):
+            await cold.save(key, get_storage().open(location))
+        return cold.location(key)
+
+    @staticmethod
+    async def _delete_debug_file(location: str):
+        path = get_storage().filesystem_path(location)
+        if path and os.path.exists(path + DEBUG_SUFFIX):
+            os.remove(path + DEBUG_SUFFIX)
+
+    @staticmethod
+    async def _photo_shared(record: Dict) -> bool:
+        """Photos are content-addressed, so one can belong to several tests"""
+        return await db.db["drug_tests"].count_documents(
+            {"photo_url": record["photo_url"], "_id": {"$ne": record["_id"]}, "archived": {"$ne": True}},
+            limit=1
+        ) > 0
+
+    @staticmethod
+    async def _delete_hot_blobs(record: Dict):
+        storage = get_storage()
+        derivatives = record.get("derivatives") or {}
+
+        await storage.delete(record["scan_file_url"])
+        await RetentionService._delete_debug_file(record["scan_file_url"])
+        for location in derivatives.get("scan", {}).values():
+            await storage.delete(location)
+
+        if record.get("photo_url") and not await RetentionService._photo_shared(record):
+            await storage.delete(record["photo_url"])
+            for location in derivatives.get("photo", {}).values():
+                await storage.delete(location)
+
+    @staticmethod
+    async def _archive_batch(records: List[Dict], dry_run: bool) -> Dict:
+        counters = {"archived": 0, "failed": 0}
+        if dry_run:
+            counters["archived"] = len(records)
+            return counters
+
+        now = datetime.utcnow()
+        archived = []
+        for record in records:
+            try:
+                archive_doc = dict(record)
+                archive_doc["scan_file_url"] = await RetentionService._archive_blob(record.get("scan_file_url"))
+                archive_doc["photo_url"] = await RetentionService._archive_blob(record.get("photo_url"))
+                # Derivatives are rebuilt from the originals if a record is ever restored
+                archive_doc.pop("derivatives", None)
+                archive_doc.pop(OutboxService.PENDING_FIELD, None)
+                archive_doc["archived_at"] = now
+                archived.append((record, archive_doc))
+            except Exception as e:
+                counters["failed"] += 1
+                logging.error(f"Failed to archive blobs for test_id {record['_id']}: {str(e)}")
+
+        if not archived:
+            return counters
+
+        await db.collection(RetentionService.ARCHIVE_COLLECTION, "ingest").bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for _, doc in archived],
+            ordered=False
+        )
+
+        stubs = []
+        events = []
+        for record, _ in archived:
+            event = OutboxService.event("test.archived", record["_id"], record.get("person_id"), {"archived_at": now})
+            stub = {field: record[field] for field in RetentionService.STUB_FIELDS if field in record}
+            stub.update({"_id": record["_id"], "archived": True, "archived_at": now})
+            # Keep events the record still owes the feed, plus this one
+            stub[OutboxService.PENDING_FIELD] = record.get(OutboxService.PENDING_FIELD, []) + [OutboxService.pending(event)]
+            stubs.append(ReplaceOne({"_id": record["_id"], "archived": {"$ne": True}}, stub))
+            events.append(event)
+        await db.collection("drug_tests", "metadata").bulk_write(stubs, ordered=False)
+        await WatermarkService.bump("drug_tests")
+        await OutboxService.publish(events)
+
+        for record, _ in archived:
+            try:
+                await RetentionService._delete_hot_blobs(record)
+            except Exception as e:
+                # The record is archived; a leftover hot blob only costs disk
+                logging.warning(f"Failed to remove hot blobs for archived test_id {record['_id']}: {str(e)}")
+        counters["archived"] = len(archived)
+        return counters
+
+    @staticmethod
+    async def archive(dry_run: bool = False, batch_size: Optional[int] = None,
+                      max_batches: Optional[int] = None) -> Dict:
+        """Archive due records in _id order, one batch at a time"""
+        query = RetentionService.build_query()
+        totals = {"archived": 0, "failed": 0, "batches": 0}
+        if query is None:
+            return totals
+
+        batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+        last_id = None
+        while max_batches is None or totals["batches"] < max_batches:
+            batch_query = dict(query)
+            if last_id is not None:
+                batch_query["_id"] = {"$gt": last_id}
+            records = await db.collection("drug_tests", "analytics").find(batch_query) \
+                .sort("_id", 1).limit(batch_size).to_list(length=None)
+            if not records:
+                break
+            # Keyset past failures too, so a bad record can't stall the run
+            last_id = records[-1]["_id"]
+
+            counters = await RetentionService._archive_batch(records, dry_run)
+            totals["archived"] += counters["archived"]
+            totals["failed"] += counters["failed"]
+            totals["batches"] += 1
+            logging.info(f"Retention batch {totals['batches']}: {counters}")
+        return totals
+
+    @staticmethod
+    def sweep_debug_files(dry_run: bool = False) -> int:
+        """
+        Remove OCR debug images whose scan is gone, or that are older than
+        RETENTION_DEBUG_FILE_DAYS. Only applies to local storage.
+        """
+        storage = get_storage()
+        if not isinstance(storage, LocalStorage) or not os.path.isdir(storage.root):
+            return 0
+
+        cutoff = time.time() - settings.RETENTION_DEBUG_FILE_DAYS * 86400
+        removed = 0
+        for folder, _, filenames in os.walk(storage.root):
+            for filename in filenames:
+                if not filename.endswith(DEBUG_SUFFIX):
+                    continue
+                path = os.path.join(folder, filename)
+                try:
+                    orphaned = not os.path.exists(path[:-len(DEBUG_SUFFIX)])
+                    if orphaned or os.path.getmtime(path) < cutoff:
+                        if not dry_run:
+                            os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+        return removed
@@ -0,0 +1,123 @@
+import re
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from ..db.mongodb import db
+from ..core.config import get_settings
+
+settings = get_settings()
+
+# Quoted phrases or bare terms; a leading "-" negates and is never highlighted
+QUERY_TOKEN = re.compile(r'(-?)"([^"]+)"|(-?)(\S+)')
+
+
+class SearchService:
+    """
+    Ranked search over OCR text, person and operator via the drug_tests text
+    index (search_text). Results page by text score; snippets and highlight
+    offsets are cut from ocr_text around the first hit.
+    """
+    PROJECTION = {
+        "score": {"$meta": "textScore"},
+        "ocr_text": 1,
+        "person_id": 1,
+        "operator.name": 1,
+        "test_timestamp": 1,
+        "processing_status": 1,
+        "ocr_confidence": 1,
+    }
+
+    @staticmethod
+    def build_query(q: str, date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                    processing_status: Optional[str] = None) -> Dict:
+        query: Dict = {"$text": {"$search": q}}
+        if date_from or date_to:
+            query["test_timestamp"] = {}
+            if date_from:
+                query["test_timestamp"]["$gte"] = date_from
+            if date_to:
+                query["test_timestamp"]["$lte"] = date_to
+        if processing_status:
+            query["processing_status"] = processing_status
+        return query
+
+    @staticmethod
+    def highlight_terms(q: str) -> List[str]:
+        """Phrases and terms from a $text search string, excluding negations"""
+        terms = []
+        for match in QUERY_TOKEN.finditer(q):
+            negated, phrase, term_negated, term = match.groups()
+            if phrase and not negated:
+                terms.append(phrase)
+            elif term and not term_negated:
+                terms.append(term)
+        return terms
+
+    @staticmethod
+    def snippet(text: str, terms: List[str], length: int) -> Tuple[str, List[List[int]]]:
+        """
+        Cut a window of about `length` characters around the first hit and
+        return it with [start, end) offsets of every hit inside it.
+        """
+        if not text:
+            return "", []
+        if not terms:
+            return text[:length], []
+
+        pattern = re.compile(
+            r"\b(?:" + "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)) + r")\b",
+            re.IGNORECASE
+        )
+        first = pattern.search(text)
+        start = 0
+        if first and len(text) > length:
+            start = max(0, min(first.start() - length // 3, len(text) - length))
+            # Don't open the snippet mid-word
+            if start > 0:
+                space = text.find(" ", start)
+                if space != -1 and space < first.start():
+                    start = space + 1
+        end = min(len(text), start + length)
+
+        window = text[start:end]
+        prefix = "…" if start > 0 else ""
+        suffix = "…" if end < len(text) else ""
+        highlights = [
+            [match.start() + len(prefix), match.end() + len(prefix)]
+            for match in pattern.finditer(window)
+        ]
+        return f"{prefix}{window}{suffix}", highlights
+
+    @staticmethod
+    async def search(q: str, page: int, limit: int, date_from: Optional[datetime] = None,
+                     date_to: Optional[datetime] = None, processing_status: Optional[str] = None) -> Dict:
+        """One page of results, best match first"""
+        skip = (page - 1) * limit
+        if skip >= settings.SEARCH_MAX_RESULTS:
+            raise ValueError(f"Results are limited to the top {settings.SEARCH_MAX_RESULTS}; refine the query")
+
+        query = SearchService.build_query(q, date_from, date_to, processing_status)
+        # Fetch one extra to learn whether another page exists without counting
+        fetch = min(limit + 1, settings.SEARCH_MAX_RESULTS - skip)
+        cursor = db.collection("drug_tests", "analytics").find(query, SearchService.PROJECTION) \
+            .sort([("score", {"$meta": "textScore"}), ("_id", -1)]) \
+            .skip(skip).limit(fetch)
+        documents = await cursor.to_list(length=None)
+
+        has_more = len(documents) > limit
+        terms = SearchService.highlight_terms(q)
+        results = []
+        for document in documents[:limit]:
+            snippet, highlights = SearchService.snippet(
+                document.pop("ocr_text", "") or "", terms, settings.SEARCH_SNIPPET_LENGTH
+            )
+            document["snippet"] = snippet
+            document["highlights"] = highlights
+            results.append(document)
+
+        return {
+            "query": q,
+            "page": page,
+            "limit": limit,
+            "has_more": has_more,
+            "results": results,
+        }
@@ -0,0 +1,54 @@
+import os
+import logging
+from pymongo.errors import DuplicateKeyError
+from ..db.mongodb import db
+from ..db.indexes import ensure_indexes
+from ..models.user import UserCreate, UserRole, UserInDB
+from ..core.config import get_settings
+from .auth_service import AuthService
+from .lock_service import LockService
+
+settings = get_settings()
+
+
+class StartupService:
+    """
+    One-off startup work. With several worker processes (or hosts) starting
+    together, only the one holding the startup lock runs it; the others
+    serve straight away.
+    """
+    LOCK = "startup"
+
+    @staticmethod
+    async def create_admin():
+        """Create the default admin user if it doesn't exist"""
+        if await AuthService.get_user("admin"):
+            return
+        admin_user = UserCreate(
+            username="admin",
+            email="admin@example.com",
+            password="admin123",  # Change this in production!
+            role=UserRole.ADMIN
+        )
+        user_in_db = UserInDB(
+            **admin_user.dict(exclude={'password'}),
+            hashed_password=AuthService.get_password_hash(admin_user.password)
+        )
+        try:
+            await db.db["users"].insert_one(user_in_db.dict(by_alias=True))
+        except DuplicateKeyError:
+            pass  # Created by a process that didn't take the lock, e.g. an older build
+
+    @staticmethod
+    async def run():
+        async with LockService.hold(StartupService.LOCK, settings.STARTUP_LOCK_TTL) as acquired:
+            if not acquired:
+                logging.info(f"Worker {os.getpid()}: startup tasks are running in another worker")
+                return
+            if settings.STARTUP_ENSURE_INDEXES:
+                # Serving must not depend on it: each failure is logged, and init_db exits non-zero on them
+                failures = await ensure_indexes(db.db)
+                if failures:
+                    logging.error(f"Index check: {len(failures)} index(es) missing, run python -m app.scripts.init_db")
+            await StartupService.create_admin()
+            logging.info(f"Worker {os.getpid()}: startup tasks completed")
@@ -0,0 +1,243 @@
+import os
+import uuid
+import shutil
+import asyncio
+import tempfile
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Optional
+import aiofiles
+from ..core.config import get_settings
+
+settings = get_settings()
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class StorageBackend:
+    """
+    Content-addressed blob storage. Keys look like "<hash>.<ext>", optionally
+    prefixed with a subfolder; the returned location is what gets stored in
+    scan_file_url / photo_url.
+    """
+
+    async def save(self, key: str, chunks: AsyncIterator[bytes], content_type: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    async def open(self, location: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, location: str):
+        raise NotImplementedError
+
+    def location(self, key: str) -> str:
+        raise NotImplementedError
+
+    def local_path(self, location: str):
+        """Async context manager yielding a filesystem path, for tools like Pillow and Tesseract"""
+        raise NotImplementedError
+
+    def filesystem_path(self, location: str) -> Optional[str]:
+        """Path the blob can be served from directly, if it lives on local disk"""
+        return None
+
+    async def presigned_url(self, location: str, expires: int = 300) -> Optional[str]:
+        """Time-limited URL clients can fetch the blob from directly, if supported"""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    """Files under UPLOAD_DIR sharded by hash prefix: ab/cd/abcd....jpg"""
+
+    def __init__(self, root: str, shard_depth: int = 2):
+        self.root = root
+        self.shard_depth = shard_depth
+
+    def _sharded(self, key: str) -> str:
+        folder, _, filename = key.rpartition("/")
+        shards = [filename[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return os.path.join(self.root, folder, *shards, filename)
+
+    def location(self, key: str) -> str:
+        return self._sharded(key)
+
+    async def save(self, key: str, chunks: AsyncIterator[bytes], content_type: Optional[str] = None) -> str:
+        path = self._sharded(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp name and rename so readers never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            async with aiofiles.open(tmp_path, "wb") as out_file:
+                async for chunk in chunks:
+                    await out_file.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    async def open(self, location: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        async with aiofiles.open(location, "rb") as in_file:
+            while chunk := await in_file.read(chunk_size):
+                yield chunk
+
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self._sharded(key))
+
+    async def delete(self, location: str):
+        if os.path.exists(location):
+            os.remove(location)
+
+    @asynccontextmanager
+    async def local_path(self, location: str):
+        yield location
+
+    def filesystem_path(self, location: str) -> Optional[str]:
+        return location
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible storage (AWS, MinIO, moto) using multipart uploads for large blobs"""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, part_size: int = 8 * 1024 * 1024,
+                 storage_class: Optional[str] = None):
+        # Imported here: boto3 is optional and slow to import, and local storage never needs it
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("S3 storage requires boto3: pip install boto3")
+        self.client_error = ClientError
+        self.bucket = bucket
+        self.storage_class = storage_class
+        self.part_size = max(part_size, 5 * 1024 * 1024)  # S3 minimum part size
+        self.client = boto3.client(
+            "s3",
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY or None,
+            region_name=settings.AWS_REGION,
+            endpoint_url=endpoint_url or None
+        )
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def _key(self, location: str) -> str:
+        prefix = f"s3://{self.bucket}/"
+        return location[len(prefix):] if location.startswith(prefix) else location
+
+    async def save(self, key: str, chunks: AsyncIterator[bytes], content_type: Optional[str] = None) -> str:
+        extra = {"ContentType": content_type} if content_type else {}
+        if self.storage_class:
+            extra["StorageClass"] = self.storage_class
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                if len(buffer) < self.part_size:
+                    continue
+                if upload_id is None:
+                    response = await asyncio.to_thread(
+                        self.client.create_multipart_upload, Bucket=self.bucket, Key=key, **extra
+                    )
+                    upload_id = response["UploadId"]
+                part_number = len(parts) + 1
+                response = await asyncio.to_thread(
+                    self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id,
+                    PartNumber=part_number, Body=bytes(buffer)
+                )
+                parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+                buffer.clear()
+
+            if upload_id is None:
+                # Small object: a single PUT is cheaper than a multipart round trip
+                await asyncio.to_thread(
+                    self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(buffer), **extra
+                )
+            else:
+                if buffer:
+                    part_number = len(parts) + 1
+                    response = await asyncio.to_thread(
+                        self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id,
+                        PartNumber=part_number, Body=bytes(buffer)
+                    )
+                    parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+                await asyncio.to_thread(
+                    self.client.complete_multipart_upload, Bucket=self.bucket, Key=key,
+                    UploadId=upload_id, MultipartUpload={"Parts": parts}
+                )
+        except Exception:
+            if upload_id is not None:
+                await asyncio.to_thread(
+                    self.client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id
+                )
+            raise
+        return self.location(key)
+
+    async def open(self, location: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        response = await asyncio.to_thread(self.client.get_object, Bucket=self.bucket, Key=self._key(location))
+        body = response["Body"]
+        try:
+            while chunk := await asyncio.to_thread(body.read, chunk_size):
+                yield chunk
+        finally:
+            body.close()
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except self.client_error:
+            return False
+
+    async def delete(self, location: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=self._key(location))
+
+    async def presigned_url(self, location: str, expires: int = 300) -> Optional[str]:
+        return await asyncio.to_thread(
+            self.client.generate_presigned_url,
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(location)},
+            ExpiresIn=expires
+        )
+
+    @asynccontextmanager
+    async def local_path(self, location: str):
+        tmp_dir = tempfile.mkdtemp(prefix="sotoxa-")
+        path = os.path.join(tmp_dir, os.path.basename(self._key(location)))
+        try:
+            async with aiofiles.open(path, "wb") as out_file:
+                async for chunk in self.open(location):
+                    await out_file.write(chunk)
+            yield path
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@lru_cache()
+def get_storage() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "s3" or settings.USE_S3:
+        return S3Storage(
+            settings.AWS_BUCKET_NAME,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            part_size=settings.S3_MULTIPART_PART_SIZE
+        )
+    return LocalStorage(settings.UPLOAD_DIR, settings.STORAGE_SHARD_DEPTH)
+
+
+@lru_cache()
+def get_cold_storage() -> StorageBackend:
+    """Storage for archived blobs (see RetentionService)"""
+    if settings.COLD_STORAGE_BACKEND == "s3":
+        return S3Storage(
+            settings.COLD_STORAGE_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            part_size=settings.S3_MULTIPART_PART_SIZE,
+            storage_class=settings.COLD_STORAGE_CLASS or None
+        )
+    return LocalStorage(settings.COLD_STORAGE_DIR, settings.STORAGE_SHARD_DEPTH)
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from ..db.mongodb import db
+from ..core import tracing
+from ..core.config import get_settings
+
+settings = get_settings()
+
+
+class TraceService:
+    """
+    Stores traces for drug tests. Each process writes the spans it recorded
+    for a trace as one segment (the upload request, each OCR job), keyed by
+    trace_id and test_id, so one test's timeline can be read back across API
+    and OCR workers. Segments are saved after the traced work, off its
+    latency path, and expire after TRACE_RETENTION_DAYS.
+    """
+    COLLECTION = "traces"
+    PERCENTILES = (50, 90, 95, 99)
+
+    _tasks: set = set()
+
+    @staticmethod
+    @asynccontextmanager
+    async def trace(name: str, trace_id: Optional[str] = None, parent_id: Optional[str] = None,
+                    test_id: Optional[str] = None, start_ns: Optional[int] = None, **attributes):
+        """
+        Run the block as the root span of a trace segment, continuing trace_id
+        when given. Inside another trace this is just a child span.
+        """
+        if not settings.TRACING_ENABLED or tracing.current() is not None:
+            with tracing.span(name, start_ns=start_ns, **attributes) as span:
+                yield span
+            return
+
+        trace = tracing.Trace(trace_id, parent_id, test_id)
+        try:
+            with tracing.activate(trace):
+                with tracing.span(name, start_ns=start_ns, **attributes) as span:
+                    yield span
+        finally:
+            task = asyncio.get_running_loop().create_task(TraceService.save(trace))
+            TraceService._tasks.add(task)
+            task.add_done_callback(TraceService._tasks.discard)
+
+    @staticmethod
+    async def save(trace: tracing.Trace):
+        """Store and export a finished segment; failures are logged, never raised"""
+        if not trace.spans:
+            return
+        exporter = tracing.exporter()
+        if exporter is not None:
+            exporter.export(trace)
+
+        # The root span is the one attached to the remote parent (or to nothing)
+        root = next(span for span in reversed(trace.spans) if span.parent_id == trace.parent_id)
+        try:
+            await db.collection(TraceService.COLLECTION, "ocr").insert_one({
+                "trace_id": trace.trace_id,
+                "test_id": trace.test_id,
+                "name": root.name,
+                "started_at": datetime.utcfromtimestamp(root.start_ns / 1e9),
+                "duration_ms": (root.end_ns - root.start_ns) / 1e6,
+                "spans": sorted((span.to_dict() for span in trace.spans), key=lambda span: span["start_ns"]),
+                "created_at": datetime.utcnow(),
+            })
+        except Exception as e:
+            logging.error(f"Failed to store trace {trace.trace_id}: {str(e)}")
+
+    @staticmethod
+    async def flush(timeout: float = 5.0):
+        """Wait for pending segment writes, e.g. before the DB connection closes"""
+        if TraceService._tasks:
+            await asyncio.wait(list(TraceService._tasks), timeout=timeout)
+
+    @staticmethod
+    async def for_test(test_id: str) -> Dict:
+        """Every stored segment for a test, oldest first, with its end-to-end time"""
+        segments = await db.db[TraceService.COLLECTION].find(
+            {"test_id": test_id}, {"_id": 0, "created_at": 0}
+        ).sort("started_at", 1).to_list(length=None)
+        spans = [span for segment in segments for span in segment["spans"]]
+        total_ms = None
+        if spans:
+            total_ms = (max(span["end_ns"] for span in spans) - min(span["start_ns"] for span in spans)) / 1e6
+        return {
+            "test_id": test_id,
+            "trace_ids": list(dict.fromkeys(segment["trace_id"] for segment in segments)),
+            "total_ms": total_ms,
+            "segments": segments,
+        }
+
+    @staticmethod
+    async def for_trace(trace_id: str) -> List[Dict]:
+        return await db.db[TraceService.COLLECTION].find(
+            {"trace_id": trace_id}, {"_id": 0, "created_at": 0}
+        ).sort("started_at", 1).to_list(length=None)
+
+    @staticmethod
+    def percentiles(durations: List[float]) -> Dict:
+        """Count, mean, max and nearest-rank percentiles of span durations in ms"""
+        durations = sorted(durations)
+        count = len(durations)
+        stats = {"count": count, "mean_ms": sum(durations) / count, "max_ms": durations[-1]}
+        for p in TraceService.PERCENTILES:
+            stats[f"p{p}_ms"] = durations[max(0, -(-p * count // 100) - 1)]
+        return stats
+
+    @staticmethod
+    async def stats(minutes: int, names: Optional[List[str]] = None) -> Dict:
+        """Per-span-name duration percentiles over segments stored in the last `minutes`"""
+        since = datetime.utcnow() - timedelta(minutes=minutes)
+        pipeline = [
+            {"$match": {"created_at": {"$gte": since}}},
+            {"$sort": {"created_at": -1}},
+            {"$unwind": "$spans"},
+        ]
+        if names:
+            pipeline.append({"$match": {"spans.name": {"$in": names}}})
+        pipeline += [
+            {"$limit": settings.TRACE_STATS_MAX_SPANS},
+            {"$project": {"_id": 0, "name": "$spans.name", "duration_ms": "$spans.duration_ms"}},
+        ]
+        rows = await db.collection(TraceService.COLLECTION, "analytics").aggregate(pipeline).to_list(length=None)
+
+        durations: Dict[str, List[float]] = {}
+        for row in rows:
+            durations.setdefault(row["name"], []).append(row["duration_ms"])
+        return {
+            "window_minutes": minutes,
+            "spans_sampled": len(rows),
+            "truncated": len(rows) >= settings.TRACE_STATS_MAX_SPANS,
+            "stages": {name: TraceService.percentiles(values) for name, values in sorted(durations.items())},
+        }
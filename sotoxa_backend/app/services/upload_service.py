@@ -1,12 +1,10 @@
-import os
+import time
 import hashlib
 from fastapi import UploadFile, HTTPException
 from ..core.config import get_settings
-from typing import Tuple
-import aiofiles
-import mimetypes
-# from botocore.exceptions import ClientError
-# import boto3  # Commented out as we're using only local storage
+from ..core.metrics import UPLOAD_BYTES, UPLOAD_THROUGHPUT
+from .storage import get_storage
+from typing import Optional, Tuple
 
 settings = get_settings()
 
@@ -45,61 +43,71 @@ class UploadService:
         return True
 
     @staticmethod
-    async def save_file(file: UploadFile, subfolder: str = "") -> Tuple[str, str]:
+    async def _iter_chunks(file: UploadFile):
+        """Stream the upload from the start in UPLOAD_CHUNK_SIZE pieces"""
+        await file.seek(0)
+        while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+            yield chunk
+
+    @staticmethod
+    async def hash_file(file: UploadFile) -> Tuple[str, int]:
+        """SHA-256 and size of the upload, enforcing MAX_FILE_SIZE"""
+        # Hash the content in chunks; the upload is already spooled by Starlette,
+        # so nothing needs to be held in memory as a whole
+        sha256_hash = hashlib.sha256()
+        size = 0
+        async for chunk in UploadService._iter_chunks(file):
+            sha256_hash.update(chunk)
+            size += len(chunk)
+            # The part's content-length is rarely sent, so enforce the limit here
+            if size > settings.MAX_FILE_SIZE:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File exceeds maximum size of {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+                )
+        return sha256_hash.hexdigest(), size
+
+    @staticmethod
+    async def save_file(
+        file: UploadFile, subfolder: str = "", digest: Optional[Tuple[str, int]] = None
+    ) -> Tuple[str, str]:
         """
         Save file and return URL and hash
-        Optional subfolder parameter for organizing uploads
+        Optional subfolder parameter for organizing uploads; digest is the
+        hash_file result when the caller already has it
         """
-        # Create hash of file content
-        sha256_hash = hashlib.sha256()
-        contents = await file.read()
-        sha256_hash.update(contents)
-        file_hash = sha256_hash.hexdigest()
+        start = time.perf_counter()
+        storage = get_storage()
+
+        file_hash, size = digest or await UploadService.hash_file(file)
 
         # Generate unique filename using hash
         file_extension = file.filename.split('.')[-1].lower()
-        filename = f"{file_hash}.{file_extension}"
+        key = f"{file_hash}.{file_extension}"
 
         if subfolder:
-            filename = f"{subfolder}/{filename}"
-
-        # AWS S3 code commented out as we're using only local storage
-        # if settings.USE_S3:
-        #     try:
-        #         s3_client = boto3.client(
-        #             's3',
-        #             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        #             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        #             region_name=settings.AWS_REGION
-        #         )
-        #
-        #         s3_client.put_object(
-        #             Bucket=settings.AWS_BUCKET_NAME,
-        #             Key=filename,
-        #             Body=contents,
-        #             ContentType=file.content_type
-        #         )
-        #
-        #         file_url = f"https://{settings.AWS_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{filename}"
-        #     except ClientError as e:
-        #         raise HTTPException(
-        #             status_code=500,
-        #             detail=f"Failed to upload to S3: {str(e)}"
-        #         )
-        # else:
-        # Save locally
-        upload_dir = os.path.join(settings.UPLOAD_DIR, subfolder) if subfolder else settings.UPLOAD_DIR
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, filename)
-
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            await out_file.write(contents)
-
-        file_url = file_path
+            key = f"{subfolder}/{key}"
+
+        # Content-addressed: identical bytes are already stored
+        if await storage.exists(key):
+            file_url = storage.location(key)
+        else:
+            try:
+                file_url = await storage.save(
+                    key,
+                    UploadService._iter_chunks(file),
+                    UploadService.MIME_TYPES.get(file_extension)
+                )
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Failed to store file: {str(e)}"
+                )
+
+        elapsed = time.perf_counter() - start
+        UPLOAD_BYTES.inc(size)
+        if elapsed > 0:
+            UPLOAD_THROUGHPUT.observe(size / elapsed)
 
         await file.seek(0)
         return file_url, file_hash
-
-
-
-
@@ -0,0 +1,252 @@
+import os
+import asyncio
+import hashlib
+import logging
+import aiofiles
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Optional
+from bson import ObjectId
+from fastapi import HTTPException, status
+from starlette.requests import ClientDisconnect
+from ..db.mongodb import db
+from ..models.user import UserInDB
+from ..core.config import get_settings
+from .upload_service import UploadService
+
+settings = get_settings()
+
+
+class UploadSessionService:
+    """
+    Resumable uploads. A session records the declared size and how many
+    bytes have been received; chunks must be sent at exactly that offset
+    and are written into a temp file under UPLOAD_SESSION_DIR. If a
+    connection drops mid-chunk the bytes that arrived are kept, so the
+    client asks for the offset and continues from there. Committing hands
+    the assembled file to the normal ingest path.
+    """
+    COLLECTION = "upload_sessions"
+    # A writer that died mid-chunk never clears its claim; after this the offset is free again
+    WRITE_LEASE = timedelta(minutes=10)
+    # Likewise for a commit that died before finishing: the session reopens after this
+    COMMIT_LEASE = timedelta(minutes=10)
+
+    @staticmethod
+    def _path(session_id) -> str:
+        return os.path.join(settings.UPLOAD_SESSION_DIR, f"{session_id}.part")
+
+    @staticmethod
+    async def create(data: Dict, user: UserInDB) -> Dict:
+        extension = data["filename"].split('.')[-1].lower()
+        if extension not in settings.ALLOWED_EXTENSIONS or extension not in UploadService.MIME_TYPES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid file. Allowed types: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+            )
+        if data["size"] > settings.MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"File exceeds maximum size of {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB"
+            )
+
+        now = datetime.utcnow()
+        session = dict(data)
+        session.update({
+            "_id": ObjectId(),
+            "owner": user.username,
+            "received": 0,
+            "status": "open",
+            "created_at": now,
+            "expires_at": now + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS),
+        })
+        os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+        async with aiofiles.open(UploadSessionService._path(session["_id"]), "wb"):
+            pass
+        await db.db[UploadSessionService.COLLECTION].insert_one(session)
+        return session
+
+    @staticmethod
+    async def get(session_id: str, user: UserInDB) -> Dict:
+        """The caller's session; 404 for unknown, expired or someone else's sessions"""
+        try:
+            oid = ObjectId(session_id)
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+        sessions = db.db[UploadSessionService.COLLECTION]
+        session = await sessions.find_one({"_id": oid, "owner": user.username})
+        now = datetime.utcnow()
+        # Sessions claimed before commit leases existed have none and count as expired
+        if session is not None and session["status"] == "committing" and session.get("committing_until", now) <= now:
+            # The commit holding this session never finished; reopen it so it can be retried or aborted
+            await sessions.update_one(
+                {"_id": oid, "status": "committing", "committing_until": session.get("committing_until")},
+                {"$set": {"status": "open"}, "$unset": {"committing_until": ""}}
+            )
+            session = await sessions.find_one({"_id": oid, "owner": user.username})
+        if session is None or (session["status"] == "open" and session["expires_at"] <= now):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found")
+        return session
+
+    @staticmethod
+    def _offset_conflict(session: Dict, detail: str) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=detail,
+            headers={"Upload-Offset": str(session["received"])}
+        )
+
+    @staticmethod
+    async def write_chunk(session: Dict, offset: int, chunks: AsyncIterator[bytes]) -> Dict:
+        """Append a request body at `offset`, which must equal the bytes received so far"""
+        if session["status"] != "open":
+            raise UploadSessionService._offset_conflict(session, f"Upload session is {session['status']}")
+        if offset != session["received"]:
+            raise UploadSessionService._offset_conflict(
+                session, f"Chunk offset {offset} does not match received bytes {session['received']}"
+            )
+
+        sessions = db.db[UploadSessionService.COLLECTION]
+        now = datetime.utcnow()
+        # Claim the offset so two concurrent PUTs for the same range can't interleave writes
+        claimed = await sessions.find_one_and_update(
+            {
+                "_id": session["_id"], "status": "open", "received": offset,
+                "$or": [{"writing_until": {"$exists": False}}, {"writing_until": {"$lt": now}}],
+            },
+            {"$set": {"writing_until": now + UploadSessionService.WRITE_LEASE}}
+        )
+        if claimed is None:
+            raise UploadSessionService._offset_conflict(session, "Another chunk is being written to this session")
+
+        written = 0
+        disconnected = False
+        try:
+            async with aiofiles.open(UploadSessionService._path(session["_id"]), "r+b") as f:
+                await f.seek(offset)
+                # Drop anything past the offset left by an earlier, unrecorded write
+                await f.truncate()
+                try:
+                    async for chunk in chunks:
+                        if offset + written + len(chunk) > session["size"]:
+                            raise HTTPException(
+                                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                detail=f"Chunk exceeds the declared size of {session['size']} bytes"
+                            )
+                        await f.write(chunk)
+                        written += len(chunk)
+                except ClientDisconnect:
+                    # Keep what arrived; the client resumes from the recorded offset
+                    disconnected = True
+        finally:
+            session = await sessions.find_one_and_update(
+                {"_id": session["_id"]},
+                {
+                    # Activity keeps the session alive
+                    "$set": {
+                        "received": offset + written,
+                        "expires_at": datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS),
+                    },
+                    "$unset": {"writing_until": ""},
+                },
+                return_document=True
+            )
+
+        if disconnected:
+            logging.info(f"Upload session {session['_id']} interrupted at offset {session['received']}")
+        return session
+
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        sha256_hash = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                sha256_hash.update(chunk)
+        return sha256_hash.hexdigest()
+
+    @staticmethod
+    async def verify(session: Dict):
+        """Check a fully received session against its declared checksum"""
+        if session["received"] != session["size"]:
+            raise UploadSessionService._offset_conflict(
+                session, f"Upload incomplete: {session['received']} of {session['size']} bytes received"
+            )
+        if session.get("sha256"):
+            # Reading and hashing up to MAX_FILE_SIZE would stall the event loop
+            path = UploadSessionService._path(session["_id"])
+            digest = await asyncio.to_thread(UploadSessionService._file_sha256, path)
+            if digest != session["sha256"].lower():
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Uploaded content does not match the declared sha256"
+                )
+
+    @staticmethod
+    async def open_file(session: Dict):
+        """The assembled file, for UploadFile (which reads it in the threadpool)"""
+        return await asyncio.to_thread(open, UploadSessionService._path(session["_id"]), "rb")
+
+    @staticmethod
+    async def claim_commit(session: Dict) -> Dict:
+        """Move a session from open to committing; only one commit can hold it, until COMMIT_LEASE"""
+        now = datetime.utcnow()
+        claimed = await db.db[UploadSessionService.COLLECTION].find_one_and_update(
+            {
+                "_id": session["_id"], "status": "open",
+                "$or": [{"writing_until": {"$exists": False}}, {"writing_until": {"$lt": now}}],
+            },
+            {"$set": {"status": "committing", "committing_until": now + UploadSessionService.COMMIT_LEASE}},
+            return_document=True
+        )
+        if claimed is None:
+            raise UploadSessionService._offset_conflict(session, "Upload session is busy, retry")
+        return claimed
+
+    @staticmethod
+    async def release_commit(session: Dict):
+        await db.db[UploadSessionService.COLLECTION].update_one(
+            {"_id": session["_id"], "status": "committing"},
+            {"$set": {"status": "open"}, "$unset": {"committing_until": ""}}
+        )
+
+    @staticmethod
+    async def mark_committed(session: Dict, test_id: str):
+        await db.db[UploadSessionService.COLLECTION].update_one(
+            {"_id": session["_id"]},
+            {
+                "$set": {"status": "committed", "test_id": test_id, "committed_at": datetime.utcnow()},
+                "$unset": {"committing_until": ""},
+            }
+        )
+        UploadSessionService._remove_file(session["_id"])
+
+    @staticmethod
+    async def abort(session: Dict):
+        # Only an open session: one claimed by a commit since it was read is left alone
+        result = await db.db[UploadSessionService.COLLECTION].delete_one({"_id": session["_id"], "status": "open"})
+        if not result.deleted_count:
+            raise UploadSessionService._offset_conflict(session, "Upload session is busy, retry")
+        UploadSessionService._remove_file(session["_id"])
+
+    @staticmethod
+    def _remove_file(session_id):
+        try:
+            os.remove(UploadSessionService._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    async def purge_expired(dry_run: bool = False, now: Optional[datetime] = None) -> int:
+        """
+        Drop expired sessions and their partial files; committed sessions
+        only lose the record. Run by the retention CLI: expires_at is not a
+        TTL index because a record removed by MongoDB would orphan its file.
+        """
+        now = now or datetime.utcnow()
+        sessions = db.db[UploadSessionService.COLLECTION]
+        removed = 0
+        async for session in sessions.find({"expires_at": {"$lte": now}}, {"_id": 1}):
+            if not dry_run:
+                await sessions.delete_one({"_id": session["_id"]})
+                UploadSessionService._remove_file(session["_id"])
+            removed += 1
+        return removed
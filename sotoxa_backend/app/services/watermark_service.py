@@ -0,0 +1,73 @@
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict
+from fastapi import Request, Response, status
+from ..db.mongodb import db
+
+
+class WatermarkService:
+    """
+    Per-collection change counters. Every write path bumps its collection's
+    watermark, so a list response can be identified by its query plus the
+    watermark and revalidated with a single point read instead of re-running
+    the query.
+    """
+    COLLECTION = "watermarks"
+    CACHE_CONTROL = "private, no-cache"
+
+    @staticmethod
+    async def bump(collection: str):
+        """Record a write to collection; never fails the write it follows"""
+        try:
+            await db.db[WatermarkService.COLLECTION].update_one(
+                {"_id": collection},
+                {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Failed to bump watermark for {collection}: {str(e)}")
+
+    @staticmethod
+    async def current(collection: str) -> Dict:
+        watermark = await db.db[WatermarkService.COLLECTION].find_one({"_id": collection})
+        return watermark or {"version": 0, "updated_at": None}
+
+    @staticmethod
+    async def etag(request: Request, collection: str) -> str:
+        """Weak ETag from the route, its query parameters and the collection watermark"""
+        watermark = await WatermarkService.current(collection)
+        fingerprint = "|".join([
+            request.url.path,
+            "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items())),
+            collection,
+            str(watermark["version"]),
+        ])
+        return f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()[:24]}"'
+
+    @staticmethod
+    def matches(request: Request, etag: str) -> bool:
+        """Weak comparison against If-None-Match"""
+        if_none_match = request.headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        opaque = etag[2:] if etag.startswith("W/") else etag
+        return any(
+            (tag.strip()[2:] if tag.strip().startswith("W/") else tag.strip()) == opaque
+            for tag in if_none_match.split(",")
+        )
+
+    @staticmethod
+    def not_modified(etag: str) -> Response:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": WatermarkService.CACHE_CONTROL}
+        )
+
+    @staticmethod
+    def tag(response: Response, etag: str) -> Response:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = WatermarkService.CACHE_CONTROL
+        return response
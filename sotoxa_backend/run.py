@@ -1,12 +1,49 @@
+import os
+import asyncio
+import argparse
 import uvicorn
 from app.core.config import get_settings
 
 if __name__ == "__main__":
     settings = get_settings()
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the Sotoxa backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=settings.WEB_WORKERS,
+        help="worker processes; above 1 runs the production mode without auto-reload"
+    )
+    parser.add_argument("--no-reload", action="store_true", help="disable auto-reload in single-worker mode")
+    parser.add_argument(
+        "--role", choices=["all", "api", "ocr"], default=settings.WORKER_ROLE,
+        help="all: API and OCR in each worker; api: API only, OCR left to 'ocr' processes; ocr: OCR only"
+    )
+    args = parser.parse_args()
+
+    # Workers read settings from the environment (spawned processes re-read it)
+    os.environ["WORKER_ROLE"] = args.role
+    os.environ["WEB_WORKERS"] = str(args.workers)
+    get_settings.cache_clear()
+
+    if args.role == "ocr":
+        # No web server: imports only the database and OCR stack
+        from app.scripts.ocr_worker import run_worker
+        asyncio.run(run_worker(0))
+    elif args.workers > 1:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level="info",
+            # Leave room for shutdown to drain in-flight OCR before workers are killed
+            timeout_graceful_shutdown=int(settings.OCR_DRAIN_TIMEOUT) + 5
+        )
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=args.host,
+            port=args.port,
+            reload=not args.no_reload,
+            log_level="info"
+        )
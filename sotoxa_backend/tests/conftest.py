@@ -0,0 +1,63 @@
+import io
+import os
+
+# Settings are read once at import; POPPLER_PATH has no default off Windows
+os.environ.setdefault("POPPLER_PATH", "")
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from PIL import Image
+
+from app.core.config import get_settings
+from app.db.mongodb import db
+from app.models.user import UserInDB, UserRole
+from app.services.auth_service import AuthService
+
+
+@pytest.fixture
+def settings(monkeypatch, tmp_path):
+    """Shared settings, with relative UPLOAD_DIR/UPLOAD_SESSION_DIR under tmp_path and OCR left to workers"""
+    settings = get_settings()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "WORKER_ROLE", "api")
+    monkeypatch.setattr(settings, "TRACING_ENABLED", False)
+    return settings
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """A fresh in-memory database behind app.db.mongodb.db"""
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(db, "client", client)
+    monkeypatch.setattr(db, "db", client["sotoxa_test"])
+    return db.db
+
+
+@pytest.fixture
+def user():
+    return UserInDB(username="operator1", email="operator1@example.com", role=UserRole.OPERATOR, hashed_password="x")
+
+
+@pytest.fixture
+def client(settings, mongo, user):
+    from app.main import app
+
+    async def current_user():
+        return user
+
+    app.dependency_overrides[AuthService.get_current_user] = current_user
+    # Not entered as a context manager: startup would connect to a real MongoDB
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def jpeg():
+    """Factory for small JPEGs whose content (and so their hash) depends on seed"""
+    def make(seed: int = 0) -> bytes:
+        image = Image.new("RGB", (64, 48), (seed % 256, (seed * 7) % 256, (seed * 13) % 256))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG")
+        return buffer.getvalue()
+    return make
@@ -0,0 +1,124 @@
+import gzip
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core import compression
+from app.core.compression import CompressionMiddleware, choose_encoding
+
+BIG = {"items": ["x" * 40] * 200}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/big")
+    async def big():
+        return JSONResponse(BIG, headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def rows():
+            for i in range(100):
+                yield f'{{"row": {i}, "pad": "{"y" * 50}"}}\n'.encode()
+        return StreamingResponse(rows(), media_type="application/json")
+
+    @app.get("/image")
+    async def image():
+        return Response(b"\xff\xd8" + b"\0" * 4096, media_type="image/jpeg")
+
+    @app.get("/partial")
+    async def partial():
+        return Response(b"x" * 4096, status_code=206, media_type="text/plain",
+                        headers={"Content-Range": "bytes 0-4095/8192"})
+
+    return TestClient(app)
+
+
+def get(client, path, encoding):
+    # Raw bytes: the test client would otherwise decode gzip transparently
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def test_negotiation(monkeypatch):
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0") is None
+    assert choose_encoding("identity") is None
+    assert choose_encoding("*") == "gzip"
+    monkeypatch.setattr(compression, "brotli", None)
+    assert choose_encoding("br") is None
+    monkeypatch.setattr(compression, "brotli", object())
+    assert choose_encoding("gzip, br") == "br"
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+
+
+def test_large_json_is_gzipped(client):
+    response, body = get(client, "/big", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.headers["etag"] == 'W/"abc"'
+    assert gzip.decompress(body) == JSONResponse(BIG).body
+    assert "content-length" not in response.headers or int(response.headers["content-length"]) == len(body)
+
+
+def test_without_accept_encoding_body_is_untouched(client):
+    response, body = get(client, "/big", "identity")
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"abc"'
+    assert body == JSONResponse(BIG).body
+
+
+def test_small_body_is_sent_as_is(client):
+    response, body = get(client, "/small", "gzip")
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert body == b'{"ok":true}'
+
+
+def test_stream_is_compressed_incrementally(client):
+    response, body = get(client, "/stream", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    lines = gzip.decompress(body).decode().splitlines()
+    assert len(lines) == 100
+    assert lines[-1].startswith('{"row": 99')
+
+
+async def test_stream_chunks_are_not_buffered():
+    chunk = b"z" * 2048
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        for _ in range(3):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": [(b"accept-encoding", b"gzip")]}
+    await CompressionMiddleware(app)(scope, None, send)
+
+    bodies = [message for message in messages if message["type"] == "http.response.body"]
+    # The first chunk goes out before the app has produced the rest
+    assert len(bodies) >= 2
+    assert bodies[-1]["more_body"] is False
+    assert gzip.decompress(b"".join(message["body"] for message in bodies)) == chunk * 3
+
+
+@pytest.mark.parametrize("path", ["/image", "/partial"])
+def test_binary_and_partial_responses_pass_through(client, path):
+    response, body = get(client, path, "gzip")
+    assert "content-encoding" not in response.headers
+    assert len(body) >= 4096
@@ -0,0 +1,64 @@
+import pytest
+from fastapi import HTTPException
+
+from app.services.idempotency_service import IdempotencyService
+
+FORM = {"person_id": "P1", "operator_id": "O1", "operator_name": "Operator"}
+
+
+def upload(client, data: bytes, key: str, **form):
+    return client.post(
+        "/api/drug-tests/upload",
+        files={"file": ("scan.jpg", data, "image/jpeg")},
+        data={**FORM, **form},
+        headers={"Idempotency-Key": key},
+    )
+
+
+async def test_retry_replays_original_response(client, mongo, jpeg):
+    first = upload(client, jpeg(1), "key-1")
+    assert first.status_code == 201
+    assert IdempotencyService.REPLAY_HEADER not in first.headers
+
+    retry = upload(client, jpeg(1), "key-1")
+    assert retry.status_code == 201
+    assert retry.headers[IdempotencyService.REPLAY_HEADER] == "true"
+    assert retry.json() == first.json()
+    assert await mongo.drug_tests.count_documents({}) == 1
+
+
+def test_key_reused_for_different_request_is_rejected(client, jpeg):
+    assert upload(client, jpeg(1), "key-1").status_code == 201
+    assert upload(client, jpeg(1), "key-1", person_id="P2").status_code == 422
+
+
+def test_key_reused_for_same_size_different_content_is_rejected(client, jpeg):
+    original = jpeg(1)
+    altered = bytearray(original)
+    altered[-3] ^= 1
+    assert upload(client, original, "key-1").status_code == 201
+    assert upload(client, bytes(altered), "key-1").status_code == 422
+
+
+def test_keys_are_scoped_per_user(client, jpeg, user, mongo):
+    assert upload(client, jpeg(1), "key-1").status_code == 201
+    user.username = "operator2"
+    response = upload(client, jpeg(2), "key-1")
+    assert response.status_code == 201
+    assert IdempotencyService.REPLAY_HEADER not in response.headers
+
+
+async def test_key_in_progress_conflicts(mongo, user):
+    fingerprint = IdempotencyService.fingerprint("upload", "P1")
+    assert await IdempotencyService.begin(user, "key-1", fingerprint) is None
+    with pytest.raises(HTTPException) as raised:
+        await IdempotencyService.begin(user, "key-1", fingerprint)
+    assert raised.value.status_code == 409
+    assert "Retry-After" in raised.value.headers
+
+
+async def test_released_key_can_be_claimed_again(mongo, user):
+    fingerprint = IdempotencyService.fingerprint("upload", "P1")
+    await IdempotencyService.begin(user, "key-1", fingerprint)
+    await IdempotencyService.release(user, "key-1")
+    assert await IdempotencyService.begin(user, "key-1", fingerprint) is None
@@ -0,0 +1,27 @@
+from pymongo.errors import OperationFailure
+
+from app.db.indexes import INDEXES, ensure_indexes
+
+
+async def test_a_failed_index_does_not_skip_the_rest(mongo, monkeypatch):
+    drug_tests = type(mongo["drug_tests"])
+    create_index = drug_tests.create_index
+
+    async def failing_geo(self, keys, **kwargs):
+        if keys == [("location", "2dsphere")]:
+            raise OperationFailure("Can't extract geo keys")
+        return await create_index(self, keys, **kwargs)
+
+    monkeypatch.setattr(drug_tests, "create_index", failing_geo)
+    failures = await ensure_indexes(mongo)
+
+    assert [f for f in failures if f.startswith("drug_tests index")] == \
+        ["drug_tests index [('location', '2dsphere')]: Can't extract geo keys"]
+    # Indexes declared after the geo index still exist
+    assert "outbox_pending.created_at_1" in await mongo.drug_tests.index_information()
+    assert "created_at_1" in await mongo.traces.index_information()
+    assert "username_1" in await mongo.users.index_information()
+
+
+def test_user_uniqueness_comes_first():
+    assert [(c, k) for c, k, _ in INDEXES[:2]] == [("users", "username"), ("users", "email")]
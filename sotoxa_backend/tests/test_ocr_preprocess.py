@@ -0,0 +1,116 @@
+import random
+import shlex
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.bench.synthetic import random_results, render_print
+from app.services.ocr_service import OCRService, settings
+
+
+def test_tesseract_whitelist_keeps_the_space():
+    # pytesseract splits the config with shlex; a bare trailing space would be dropped
+    whitelist = next(arg for arg in shlex.split(OCRService.TESSERACT_CONFIG) if arg.startswith("tessedit_char_whitelist="))
+    assert whitelist.endswith(" ")
+
+
+def test_otsu_threshold_is_none_for_uniform_pixels():
+    for value in (0, 128, 255):
+        assert OCRService._otsu_threshold(np.full((40, 60), value, dtype=np.uint8)) is None
+
+
+def test_otsu_threshold_splits_two_levels():
+    pixels = np.full((40, 60), 220, dtype=np.uint8)
+    pixels[10:20] = 30
+    threshold = OCRService._otsu_threshold(pixels)
+    assert 30 <= threshold < 220
+
+
+def test_uniform_image_is_not_deskewed_or_thresholded(monkeypatch):
+    blank = Image.new("L", (1600, 1200), 255)
+    assert OCRService._estimate_skew(blank) == 0.0
+    assert OCRService._deskew(blank) is blank
+
+    monkeypatch.setattr(settings, "OCR_BINARIZATION", "otsu")
+    assert OCRService._binarize(blank) is blank
+
+
+@pytest.fixture
+def printed():
+    """A level, greyscale synthetic result print"""
+    return render_print(random_results(random.Random(1))).convert("L")
+
+
+@pytest.mark.parametrize("angle", [-6.0, -2.5, 3.0, 8.0])
+def test_skew_estimate_levels_rotated_print(printed, angle):
+    rotated = printed.rotate(angle, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+    # The estimate is the rotation that levels the lines again
+    assert OCRService._estimate_skew(rotated) == pytest.approx(-angle, abs=0.5)
+
+
+def test_skew_estimate_on_a_phone_sized_scan(printed):
+    # Reduced before thresholding and thinned to SKEW_MAX_POINTS dark pixels
+    large = printed.resize((printed.width * 5, printed.height * 5))
+    rotated = large.rotate(3, resample=Image.Resampling.BICUBIC, expand=True, fillcolor=255)
+    assert OCRService._estimate_skew(rotated) == pytest.approx(-3, abs=0.5)
+
+
+def test_small_skew_is_left_alone(printed):
+    assert OCRService._deskew(printed) is printed
+
+
+def test_deskew_disabled(printed, monkeypatch):
+    monkeypatch.setattr(settings, "OCR_DESKEW_MAX_ANGLE", 0)
+    rotated = printed.rotate(5, expand=True, fillcolor=255)
+    assert OCRService._deskew(rotated) is rotated
+
+
+def shadowed(image: Image.Image) -> Image.Image:
+    """Darken the image towards its right edge, down to 35% brightness"""
+    pixels = np.asarray(image, dtype=np.float64)
+    gain = np.linspace(1.0, 0.35, pixels.shape[1])
+    return Image.fromarray((pixels * gain).astype(np.uint8))
+
+
+@pytest.mark.parametrize("method", ["sauvola", "otsu"])
+def test_binarize_output_is_black_and_white(printed, monkeypatch, method):
+    monkeypatch.setattr(settings, "OCR_BINARIZATION", method)
+    result = np.asarray(OCRService._binarize(printed))
+    assert result.shape == np.asarray(printed).shape
+    assert set(np.unique(result)) <= {0, 255}
+
+
+def test_sauvola_keeps_shadowed_background_white(printed, monkeypatch):
+    original = np.asarray(printed)
+    text = original < 100
+    image = shadowed(printed)
+
+    monkeypatch.setattr(settings, "OCR_BINARIZATION", "sauvola")
+    sauvola = np.asarray(OCRService._binarize(image))
+    monkeypatch.setattr(settings, "OCR_BINARIZATION", "otsu")
+    otsu = np.asarray(OCRService._binarize(image))
+
+    background = ~text
+    assert (sauvola[text] == 0).mean() > 0.8
+    assert (sauvola[background] == 255).mean() > 0.95
+    # A single global threshold loses the darkened side
+    assert (otsu[background] == 255).mean() < (sauvola[background] == 255).mean()
+
+
+def test_sauvola_does_not_speckle_a_noisy_background(printed, monkeypatch):
+    original = np.asarray(printed)
+    background = original > 200
+    noise = np.random.default_rng(0).normal(0, 12, original.shape)
+    noisy = Image.fromarray(np.clip(original * 0.8 + noise, 0, 255).astype(np.uint8))
+
+    # Through the whole pipeline: the contrast and sharpness steps amplify the noise first
+    monkeypatch.setattr(settings, "OCR_BINARIZATION", "sauvola")
+    result = OCRService._preprocess_image(noisy)
+    background = np.asarray(Image.fromarray(background).resize(result.size))
+    assert (np.asarray(result)[background] == 255).mean() > 0.99
+
+
+def test_binarize_none_returns_image(printed, monkeypatch):
+    monkeypatch.setattr(settings, "OCR_BINARIZATION", "none")
+    assert OCRService._binarize(printed) is printed
@@ -0,0 +1,31 @@
+import asyncio
+
+from bson import ObjectId
+
+from app.services.ocr_queue import OCRQueue
+from app.services.ocr_worker import OCRWorker
+
+
+async def test_failed_job_does_not_end_the_slot(settings, monkeypatch):
+    monkeypatch.setattr(settings, "OCR_WORKER_POLL_INTERVAL", 0.01)
+    jobs = [{"_id": ObjectId()}, {"_id": ObjectId()}]
+    processed = []
+    stop = asyncio.Event()
+
+    async def claim(worker_id):
+        return jobs.pop(0) if jobs else None
+
+    async def process(test):
+        processed.append(test["_id"])
+        if len(processed) == 1:
+            raise OSError("storage unavailable")
+        stop.set()
+
+    monkeypatch.setattr(OCRWorker, "claim", staticmethod(claim))
+    monkeypatch.setattr(OCRWorker, "process", staticmethod(process))
+    depth = OCRQueue.depth
+
+    await asyncio.wait_for(OCRWorker.run(stop, concurrency=1), 5)
+
+    assert len(processed) == 2
+    assert OCRQueue.depth == depth
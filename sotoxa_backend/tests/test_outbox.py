@@ -0,0 +1,181 @@
+import asyncio
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services.outbox_service import OutboxService
+
+
+async def publish(count: int, event_type: str = "test.uploaded"):
+    await OutboxService.publish([OutboxService.event(event_type, f"t{i}", "P1") for i in range(count)])
+
+
+async def test_pages_follow_the_resume_token(mongo, settings):
+    await publish(5)
+
+    first = await OutboxService.read(None, 3)
+    assert [event["seq"] for event in first["events"]] == [1, 2, 3]
+    assert first["has_more"]
+
+    second = await OutboxService.read(first["next_token"], 3)
+    assert [event["seq"] for event in second["events"]] == [4, 5]
+    assert not second["has_more"]
+
+    # Nothing new: the token stays where it was
+    third = await OutboxService.read(second["next_token"], 3)
+    assert third["events"] == []
+    assert third["next_token"] == second["next_token"]
+
+
+async def test_type_filter_still_advances_the_token(mongo, settings):
+    await publish(2, "test.uploaded")
+    await publish(1, "test.ocr_completed")
+
+    page = await OutboxService.read(None, 10, ["test.ocr_completed"])
+    assert [event["seq"] for event in page["events"]] == [3]
+    assert OutboxService.decode_token(page["next_token"]) == 3
+
+
+async def test_recent_gap_holds_the_token_back(mongo, settings):
+    await publish(3)
+    # Sequence 2 reserved but not yet written
+    await mongo.change_events.delete_one({"_id": 2})
+
+    page = await OutboxService.read(None, 10)
+    assert [event["seq"] for event in page["events"]] == [1]
+    assert OutboxService.decode_token(page["next_token"]) == 1
+    assert page["has_more"]
+
+
+async def test_settled_gap_is_skipped(mongo, settings):
+    await publish(3)
+    await mongo.change_events.delete_one({"_id": 2})
+    old = datetime.utcnow() - timedelta(seconds=settings.OUTBOX_SETTLE_SECONDS + 1)
+    await mongo.change_events.update_many({}, {"$set": {"created_at": old}})
+
+    page = await OutboxService.read(None, 10)
+    assert [event["seq"] for event in page["events"]] == [1, 3]
+
+
+async def test_token_before_retained_window_is_rejected(mongo, settings):
+    await publish(5)
+    # Events 1-3 expired
+    await mongo.change_events.delete_many({"_id": {"$lte": 3}})
+
+    with pytest.raises(LookupError):
+        await OutboxService.read(OutboxService.encode_token(1), 10)
+    page = await OutboxService.read(OutboxService.encode_token(3), 10)
+    assert [event["seq"] for event in page["events"]] == [4, 5]
+
+
+def test_malformed_token_is_rejected():
+    for token in ("not-a-token", base64.urlsafe_b64encode(b"seq:-1").decode(), base64.urlsafe_b64encode(b"id:3").decode()):
+        with pytest.raises(ValueError):
+            OutboxService.decode_token(token)
+
+
+def test_changes_route_maps_errors(client):
+    assert client.get("/api/changes", params={"token": "bogus"}).status_code == 400
+    assert client.get("/api/changes", params={"types": "test.unknown"}).status_code == 400
+    assert client.get("/api/changes").json()["events"] == []
+
+
+@pytest.fixture
+def feed_unavailable(mongo):
+    """Make change_events writes fail, as if the publish after a test write was lost; undo() restores them"""
+    from app.db.mongodb import db
+    collection = db.collection
+
+    def broken(name, operation="default"):
+        if name == OutboxService.COLLECTION:
+            raise ConnectionError("change_events unavailable")
+        return collection(name, operation)
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(db, "collection", broken)
+        yield patch
+
+
+def upload(client, jpeg, seed=1):
+    response = client.post(
+        "/api/drug-tests/upload",
+        files={"file": ("scan.jpg", jpeg(seed), "image/jpeg")},
+        data={"person_id": "P1", "operator_id": "O1", "operator_name": "Operator"},
+    )
+    assert response.status_code == 201
+    return response.json()["_id"]
+
+
+async def test_published_event_is_cleared_from_the_test(client, mongo, jpeg):
+    upload(client, jpeg)
+    test = await mongo.drug_tests.find_one({})
+    assert test[OutboxService.PENDING_FIELD] == []
+
+    page = await OutboxService.read(None, 10)
+    assert [event["type"] for event in page["events"]] == ["test.uploaded"]
+    assert page["events"][0]["event_id"] is not None
+    assert OutboxService.PENDING_FIELD not in client.get("/api/drug-tests/results").json()["results"][0]
+
+
+async def test_failed_publish_is_swept_later(client, mongo, jpeg, settings, monkeypatch, feed_unavailable):
+    upload(client, jpeg)
+    test = await mongo.drug_tests.find_one({})
+    assert len(test[OutboxService.PENDING_FIELD]) == 1
+    feed_unavailable.undo()
+
+    # Too recent: the publish may still be in flight
+    assert await OutboxService.sweep() == 0
+
+    monkeypatch.setattr(settings, "OUTBOX_SWEEP_AFTER", 0)
+    assert await OutboxService.sweep() == 1
+    # The lost publish had reserved sequence 1
+    monkeypatch.setattr(settings, "OUTBOX_SETTLE_SECONDS", 0)
+    page = await OutboxService.read(None, 10)
+    assert [(event["type"], event["person_id"]) for event in page["events"]] == [("test.uploaded", "P1")]
+    assert (await mongo.drug_tests.find_one({}))[OutboxService.PENDING_FIELD] == []
+    assert await OutboxService.sweep() == 0
+
+
+async def test_sweep_does_not_duplicate_a_published_event(mongo, settings, monkeypatch):
+    await mongo.change_events.create_index(
+        "event_id", unique=True, partialFilterExpression={"event_id": {"$exists": True}}
+    )
+    monkeypatch.setattr(settings, "OUTBOX_SWEEP_AFTER", 0)
+    event = OutboxService.event("test.uploaded", "t1", "P1")
+    # Published, but the pending copy was not cleared
+    await mongo.drug_tests.insert_one({"_id": "t1", OutboxService.PENDING_FIELD: [OutboxService.pending(event)]})
+    await OutboxService.publish([event])
+    await mongo.drug_tests.update_one({"_id": "t1"}, {"$push": {OutboxService.PENDING_FIELD: OutboxService.pending(event)}})
+
+    await OutboxService.sweep()
+    assert await mongo.change_events.count_documents({}) == 1
+    assert (await mongo.drug_tests.find_one({"_id": "t1"}))[OutboxService.PENDING_FIELD] == []
+
+
+async def test_metadata_update_stores_its_event_with_the_write(mongo, settings, feed_unavailable):
+    from app.services.metadata_service import MetadataService
+    await mongo.drug_tests.insert_one({"_id": "t1", "person_id": "P1"})
+
+    await MetadataService.update_one("t1", {"person_id": "P2"})
+    pending = (await mongo.drug_tests.find_one({"_id": "t1"}))[OutboxService.PENDING_FIELD]
+    assert [(entry["type"], entry["person_id"]) for entry in pending] == [("test.metadata_updated", "P2")]
+
+
+async def test_sweeper_runs_until_stopped(mongo, settings, monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_SWEEP_AFTER", 0)
+    monkeypatch.setattr(settings, "OUTBOX_SWEEP_INTERVAL", 0.01)
+    event = OutboxService.event("test.archived", "t1", "P1")
+    await mongo.drug_tests.insert_one({"_id": "t1", OutboxService.PENDING_FIELD: [OutboxService.pending(event)]})
+
+    stop = asyncio.Event()
+    sweeper = asyncio.create_task(OutboxService.run_sweeper(stop))
+    for _ in range(100):
+        if await mongo.change_events.count_documents({}):
+            break
+        await asyncio.sleep(0.01)
+    stop.set()
+    await asyncio.wait_for(sweeper, 1)
+
+    assert await mongo.change_events.count_documents({"type": "test.archived"}) == 1
+    assert await mongo.locks.count_documents({}) == 0
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.db.mongodb import db
+from app.services.person_service import PersonService
+
+NOW = datetime(2026, 1, 1)
+
+
+async def add_test(person_id: str, minutes: int, result: str = "Negative"):
+    await db.db["drug_tests"].insert_one({
+        "_id": ObjectId(),
+        "person_id": person_id,
+        "test_timestamp": NOW + timedelta(minutes=minutes),
+        "processing_status": "completed",
+        "ocr_data": {"THC": result},
+    })
+
+
+def interleave(monkeypatch, *concurrent):
+    """Run each of `concurrent` in turn, just before refresh_summary's next writes to person_summaries"""
+    collection = db.collection
+    pending = list(reversed(concurrent))
+    racing = []
+
+    class Racing:
+        def __init__(self, target):
+            self.target = target
+
+        def __getattr__(self, name):
+            return getattr(self.target, name)
+
+        async def _race(self):
+            # Writes made by the concurrent refresh itself do not race
+            if pending and not racing:
+                racing.append(True)
+                try:
+                    await pending.pop()()
+                finally:
+                    racing.pop()
+
+        async def insert_one(self, *args, **kwargs):
+            await self._race()
+            return await self.target.insert_one(*args, **kwargs)
+
+        async def replace_one(self, *args, **kwargs):
+            await self._race()
+            return await self.target.replace_one(*args, **kwargs)
+
+    def racing_collection(name, operation="default"):
+        target = collection(name, operation)
+        return Racing(target) if name == PersonService.SUMMARY_COLLECTION else target
+
+    monkeypatch.setattr(db, "collection", racing_collection)
+
+
+async def test_summary_counts_completed_tests(mongo):
+    await add_test("P1", 0, "Positive")
+    await add_test("P1", 10)
+
+    await PersonService.refresh_summary("P1")
+
+    summary = await mongo[PersonService.SUMMARY_COLLECTION].find_one({"_id": "P1"})
+    assert summary["total_tests"] == 2
+    assert summary["drug_counts"] == {"THC": {"positive": 1, "negative": 1}}
+    assert summary["last_test_at"] == NOW + timedelta(minutes=10)
+    assert summary["version"] == 1
+
+
+async def test_stale_refresh_does_not_overwrite_a_newer_one(mongo, monkeypatch):
+    await add_test("P1", 0)
+    await PersonService.refresh_summary("P1")
+
+    async def newer_test_and_refresh():
+        await add_test("P1", 10, "Positive")
+        await PersonService.refresh_summary("P1")
+
+    # This refresh reads one test, then loses the race to one that saw two
+    interleave(monkeypatch, newer_test_and_refresh)
+    await PersonService.refresh_summary("P1")
+
+    summary = await mongo[PersonService.SUMMARY_COLLECTION].find_one({"_id": "P1"})
+    assert summary["total_tests"] == 2
+    assert summary["drug_counts"]["THC"] == {"positive": 1, "negative": 1}
+    assert summary["version"] == 3
+
+
+async def test_concurrent_first_refresh_retries_the_insert(mongo, monkeypatch):
+    await add_test("P1", 0)
+
+    async def newer_test_and_refresh():
+        await add_test("P1", 10)
+        await PersonService.refresh_summary("P1")
+
+    interleave(monkeypatch, newer_test_and_refresh)
+    await PersonService.refresh_summary("P1")
+
+    summary = await mongo[PersonService.SUMMARY_COLLECTION].find_one({"_id": "P1"})
+    assert summary["total_tests"] == 2
+    assert summary["version"] == 2
+
+
+async def test_refresh_that_loses_twice_leaves_a_complete_summary(mongo, monkeypatch):
+    await add_test("P1", 0)
+    await PersonService.refresh_summary("P1")
+
+    def newer_test_and_refresh(minutes):
+        async def run():
+            await add_test("P1", minutes)
+            await PersonService.refresh_summary("P1")
+        return run
+
+    # Both attempts lose; the second winner already counted every test
+    interleave(monkeypatch, newer_test_and_refresh(10), newer_test_and_refresh(20))
+    await PersonService.refresh_summary("P1")
+
+    summary = await mongo[PersonService.SUMMARY_COLLECTION].find_one({"_id": "P1"})
+    assert summary["total_tests"] == 3
+    assert summary["version"] == 3
+
+
+async def test_history_hides_the_version(mongo):
+    await add_test("P1", 0)
+
+    page = await PersonService.history("P1", 10)
+    assert page["summary"]["total_tests"] == 1
+    assert "version" not in page["summary"]
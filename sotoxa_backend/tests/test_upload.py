@@ -0,0 +1,37 @@
+import pytest
+
+from app.db.indexes import ensure_indexes
+
+FORM = {"person_id": "P1", "operator_id": "O1", "operator_name": "Operator"}
+
+
+def upload(client, data: bytes, **form):
+    return client.post(
+        "/api/drug-tests/upload",
+        files={"file": ("scan.jpg", data, "image/jpeg")},
+        data={**FORM, **form},
+    )
+
+
+@pytest.mark.parametrize("lat,lon", [(91, 0), (-90.5, 0), (0, 180.1), (0, -181)])
+async def test_out_of_range_location_is_rejected(client, mongo, jpeg, lat, lon):
+    response = upload(client, jpeg(1), lat=lat, lon=lon)
+    assert response.status_code == 422
+    assert await mongo.drug_tests.count_documents({}) == 0
+
+
+def test_location_in_range_is_accepted(client, jpeg):
+    response = upload(client, jpeg(1), lat=51.5, lon=-0.12)
+    assert response.status_code == 201
+    assert response.json()["location"] == {"latitude": 51.5, "longitude": -0.12}
+
+
+async def test_duplicate_scan_conflicts_with_the_existing_test(client, mongo, jpeg):
+    await ensure_indexes(mongo)
+    first = upload(client, jpeg(1))
+    assert first.status_code == 201
+
+    response = upload(client, jpeg(1), person_id="P2")
+    assert response.status_code == 409
+    assert first.json()["_id"] in response.json()["detail"]
+    assert await mongo.drug_tests.count_documents({}) == 1
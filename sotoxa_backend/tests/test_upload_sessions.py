@@ -0,0 +1,116 @@
+import hashlib
+from datetime import datetime, timedelta
+
+import pytest
+
+BASE = "/api/drug-tests/uploads"
+
+
+@pytest.fixture
+def payload(jpeg):
+    return jpeg(3)
+
+
+def create(client, payload: bytes, **fields):
+    body = {
+        "filename": "scan.jpg", "size": len(payload), "sha256": hashlib.sha256(payload).hexdigest(),
+        "person_id": "P1", "operator_id": "O1", "operator_name": "Operator",
+    }
+    response = client.post(BASE, json={**body, **fields})
+    assert response.status_code == 201
+    return response.json()["_id"]
+
+
+def put(client, session_id: str, data: bytes, offset: int):
+    return client.put(f"{BASE}/{session_id}/chunks", content=data, headers={"Upload-Offset": str(offset)})
+
+
+def test_chunks_resume_from_received_offset(client, payload):
+    session_id = create(client, payload)
+    half = len(payload) // 2
+
+    assert put(client, session_id, payload[:half], 0).json()["received"] == half
+    head = client.head(f"{BASE}/{session_id}")
+    assert head.headers["Upload-Offset"] == str(half)
+    assert head.headers["Upload-Length"] == str(len(payload))
+
+    response = put(client, session_id, payload[half:], half)
+    assert response.json()["received"] == len(payload)
+
+
+def test_chunk_at_wrong_offset_conflicts(client, payload):
+    session_id = create(client, payload)
+    half = len(payload) // 2
+    put(client, session_id, payload[:half], 0)
+
+    for offset in (0, half + 1):
+        response = put(client, session_id, payload[half:], offset)
+        assert response.status_code == 409
+        assert response.headers["Upload-Offset"] == str(half)
+
+
+def test_chunk_past_declared_size_is_rejected(client, payload):
+    session_id = create(client, payload)
+    assert put(client, session_id, payload + b"extra", 0).status_code == 413
+
+
+def test_commit_creates_test_once(client, mongo, payload):
+    session_id = create(client, payload)
+    put(client, session_id, payload, 0)
+
+    first = client.post(f"{BASE}/{session_id}/commit")
+    assert first.status_code == 201
+    assert first.json()["hash"] == hashlib.sha256(payload).hexdigest()
+
+    # A retry after a lost response returns the same test
+    retry = client.post(f"{BASE}/{session_id}/commit")
+    assert retry.status_code == 200
+    assert retry.json()["_id"] == first.json()["_id"]
+    assert client.get(f"{BASE}/{session_id}").json()["status"] == "committed"
+
+
+def test_commit_of_incomplete_upload_conflicts(client, payload):
+    session_id = create(client, payload)
+    put(client, session_id, payload[:10], 0)
+    response = client.post(f"{BASE}/{session_id}/commit")
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "10"
+
+
+async def test_checksum_mismatch_is_rejected_and_session_reopened(client, mongo, payload):
+    session_id = create(client, payload, sha256="0" * 64)
+    put(client, session_id, payload, 0)
+
+    assert client.post(f"{BASE}/{session_id}/commit").status_code == 422
+    assert client.get(f"{BASE}/{session_id}").json()["status"] == "open"
+    assert await mongo.drug_tests.count_documents({}) == 0
+
+
+async def test_commit_while_another_commit_runs_conflicts(client, mongo, payload):
+    session_id = create(client, payload)
+    put(client, session_id, payload, 0)
+    await mongo.upload_sessions.update_one({}, {"$set": {
+        "status": "committing", "committing_until": datetime.utcnow() + timedelta(minutes=5),
+    }})
+
+    assert client.post(f"{BASE}/{session_id}/commit").status_code == 409
+    assert client.delete(f"{BASE}/{session_id}").status_code == 409
+
+
+async def test_commit_that_died_reopens_the_session(client, mongo, payload):
+    session_id = create(client, payload)
+    put(client, session_id, payload, 0)
+    await mongo.upload_sessions.update_one({}, {"$set": {
+        "status": "committing", "committing_until": datetime.utcnow() - timedelta(seconds=1),
+    }})
+
+    assert client.get(f"{BASE}/{session_id}").json()["status"] == "open"
+    response = client.post(f"{BASE}/{session_id}/commit")
+    assert response.status_code == 201
+    assert "committing_until" not in await mongo.upload_sessions.find_one({})
+
+
+def test_sessions_are_private_to_their_owner(client, payload, user):
+    session_id = create(client, payload)
+    user.username = "operator2"
+    assert client.get(f"{BASE}/{session_id}").status_code == 404
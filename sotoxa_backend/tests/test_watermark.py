@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from app.services.ocr_worker import OCRWorker
+from app.services.watermark_service import WatermarkService
+
+
+def test_unchanged_list_revalidates_with_304(client):
+    first = client.get("/api/drug-tests/results", params={"limit": 5})
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    again = client.get("/api/drug-tests/results", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    assert again.content == b""
+
+
+def test_etag_depends_on_query(client):
+    five = client.get("/api/drug-tests/results", params={"limit": 5}).headers["ETag"]
+    ten = client.get("/api/drug-tests/results", params={"limit": 10}).headers["ETag"]
+    assert five != ten
+    response = client.get("/api/drug-tests/results", params={"limit": 10}, headers={"If-None-Match": five})
+    assert response.status_code == 200
+
+
+async def test_write_invalidates_etag(client):
+    etag = client.get("/api/drug-tests/results").headers["ETag"]
+    await WatermarkService.bump("drug_tests")
+
+    response = client.get("/api/drug-tests/results", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_upload_invalidates_etag(client, jpeg):
+    etag = client.get("/api/drug-tests/results").headers["ETag"]
+    client.post(
+        "/api/drug-tests/upload",
+        files={"file": ("scan.jpg", jpeg(5), "image/jpeg")},
+        data={"person_id": "P1", "operator_id": "O1", "operator_name": "Operator"},
+    )
+    response = client.get("/api/drug-tests/results", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
+
+
+async def test_ocr_claim_keeps_a_valid_etag_valid(client, mongo):
+    await mongo.drug_tests.insert_one({
+        "_id": ObjectId(), "person_id": "P1", "processing_status": "pending",
+        "ocr_priority": "interactive", "uploaded_at": datetime(2026, 1, 1),
+    })
+    before = client.get("/api/drug-tests/results")
+
+    # Claiming does not bump the watermark, so it must not change what the list shows
+    assert await OCRWorker.claim("worker-1") is not None
+    after = client.get("/api/drug-tests/results")
+    assert after.headers["ETag"] == before.headers["ETag"]
+    assert after.json() == before.json()
+
+
+def test_weak_comparison_and_lists(client):
+    etag = client.get("/api/drug-tests/results").headers["ETag"]
+    strong = etag[2:]
+    for header in (strong, f'"other", {etag}', "*"):
+        response = client.get("/api/drug-tests/results", headers={"If-None-Match": header})
+        assert response.status_code == 304